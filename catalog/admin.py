@@ -1,5 +1,13 @@
-from django.contrib import admin
-from .models import Author, Genre, Book, BookInstance, Language
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+from django.template.defaultfilters import pluralize
+from django.utils import timezone
+
+from . import tagcache
+from .forms import validate_renewal_date
+from .models import Author, Genre, Book, BookInstance, BookInstanceCounter, Hold, Language, OverdueNotice
 
 
 # Define the admin class
@@ -23,16 +31,42 @@ class BookInstanceInline(admin.TabularInline):
 # Register the Admin classes for Book using the decorator
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'display_genre')
+    list_display = ('title', 'author', 'display_genre', 'available_copies', 'total_copies')
+    list_select_related = ('author',)
 
     inlines = [BookInstanceInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('genre')
+
+
+class BookInstanceActionForm(ActionForm):
+    due_back = forms.DateField(required=False, label='Renewal date', widget=forms.DateInput(attrs={'type': 'date'}))
+
 
 # Register the Admin classes for BookInstance using the decorator
 @admin.register(BookInstance)
 class BookInstanceAdmin(admin.ModelAdmin):
     list_display = ('book', 'status', 'borrower', 'due_back', 'id')
     list_filter = ('status', 'due_back')
+    list_select_related = ('book', 'borrower')
+    action_form = BookInstanceActionForm
+    actions = ['renew_loans']
+
+    @admin.action(description='Renew selected loans to the renewal date', permissions=['change'])
+    def renew_loans(self, request, queryset):
+        try:
+            due_back = self.action_form.base_fields['due_back'].clean(request.POST.get('due_back'))
+            if due_back is None:
+                raise ValidationError('Enter a renewal date.')
+            validate_renewal_date(due_back)
+        except ValidationError as e:
+            self.message_user(request, ' '.join(e.messages), messages.ERROR)
+            return
+        # One UPDATE; copies in the selection that are not on loan are left alone
+        renewed = queryset.filter(status__exact='o').update(due_back=due_back, updated_at=timezone.now())
+        tagcache.invalidate(*{f'bookinstance-of:{book_id}' for book_id in queryset.values_list('book_id', flat=True)})
+        self.message_user(request, f'Renewed {renewed} loan{pluralize(renewed)} to {due_back}.', messages.SUCCESS)
 
     fieldsets = (
         (None, {
@@ -44,6 +78,50 @@ class BookInstanceAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(BookInstanceCounter)
+class BookInstanceCounterAdmin(admin.ModelAdmin):
+    """Read-only view of the copy counters; they are maintained by signals and reconcile_counters."""
+    list_display = ('book', 'status', 'count')
+    list_filter = ('status',)
+    list_select_related = ('book',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    """Read-only view of the reservation queues; patrons join and leave them from the book pages."""
+    list_display = ('book', 'position', 'patron', 'created_at')
+    list_select_related = ('book', 'patron')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OverdueNotice)
+class OverdueNoticeAdmin(admin.ModelAdmin):
+    """Notices sent by send_overdue_notices; deleting one lets the command send it again today."""
+    list_display = ('borrower', 'sent_on', 'loans')
+    list_filter = ('sent_on',)
+    list_select_related = ('borrower',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # Register the admin class with the associated model
 admin.site.register(Author, AuthorAdmin)
 # admin.site.register(Book, BookAdmin)
@@ -0,0 +1,19 @@
+"""The catalog URLs with the home page, lists and detail pages served by async views."""
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    'index': async_views.index,
+    'books': async_views.book_list,
+    'book-detail': async_views.book_detail,
+    'authors': async_views.author_list,
+    'author-detail': async_views.author_detail,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name) if pattern.name in ASYNC_VIEWS
+    else pattern
+    for pattern in sync_urlpatterns
+]
@@ -0,0 +1,96 @@
+"""Native async versions of the home page and the catalog list and detail views.
+
+They are served under ASGI (see locallibrary/asgi.py and asgi_urls.py), where a
+sync view would hold a worker thread for the whole request. Reads go through the
+async ORM (``acount()``, ``aget()``, ``async for``); template rendering and the few
+sync helpers still run in Django's sync thread. Each view reuses the configuration
+and context of its sync counterpart in views.py, and the same page cache and
+conditional GET handling wrap it.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.views import generic
+
+from catalog import conditional, services, tagcache, views
+from catalog.counters import astatus_counts
+from catalog.stats import aget_index_counts
+from catalog.visits import record_visit, set_visit_cookies
+
+
+async def index(request):
+    """View function for home page of site."""
+    # The counters (one query, usually cached) and the session holding the visit
+    # count do not depend on each other
+    counts, num_visits = await asyncio.gather(aget_index_counts(), sync_to_async(record_visit)(request))
+    response = TemplateResponse(request, 'index.html', context={**counts, 'num_visits': num_visits})
+    return set_visit_cookies(request, response)
+
+
+class AsyncListMixin:
+    """Read a ListView's page with the async ORM, then build its usual context."""
+    # The sync views wrap dispatch in the page cache; these are wrapped whole instead
+    dispatch = generic.View.dispatch
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        paginator, page, object_list, is_paginated = await self.apaginate_queryset(
+            self.object_list, self.paginate_by)
+        context = self.get_context_data(object_list=object_list, paginator=paginator, page_obj=page,
+                                        is_paginated=is_paginated)
+        return self.render_to_response(context)
+
+    def get_paginate_by(self, queryset):
+        # get() has paginated already
+        return None
+
+
+class AsyncDetailMixin:
+    """Read a DetailView's object with the async ORM."""
+    dispatch = generic.View.dispatch
+
+    async def get(self, request, *args, **kwargs):
+        self.object = await self.aget_object()
+        context = await self.aget_context_data(object=self.object)
+        return self.render_to_response(context)
+
+    async def aget_object(self):
+        queryset = self.get_queryset()
+        try:
+            return await queryset.aget(pk=self.kwargs[self.pk_url_kwarg])
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.verbose_name} found matching the query')
+
+    async def aget_context_data(self, **kwargs):
+        return super().get_context_data(**kwargs)
+
+
+class BookListView(AsyncListMixin, views.BookListView):
+    pass
+
+
+class AuthorListView(AsyncListMixin, views.AuthorListView):
+    pass
+
+
+class BookDetailView(AsyncDetailMixin, views.BookDetailView):
+    async def aget_context_data(self, **kwargs):
+        context = generic.DetailView.get_context_data(self, **kwargs)
+        counts = await astatus_counts(self.object)
+        user = await self.request.auser()
+        position = await sync_to_async(services.queue_position)(self.object, user) if user.is_authenticated else None
+        return self.add_book_context(context, counts, user, position)
+
+
+class AuthorDetailView(AsyncDetailMixin, views.AuthorDetailView):
+    pass
+
+
+book_list = tagcache.cache_anonymous_page(BookListView.as_view())
+author_list = tagcache.cache_anonymous_page(AuthorListView.as_view())
+book_detail = tagcache.cache_anonymous_page(
+    conditional.acondition(conditional.abook_etag, conditional.abook_last_modified)(BookDetailView.as_view()))
+author_detail = tagcache.cache_anonymous_page(
+    conditional.acondition(conditional.aauthor_etag, conditional.aauthor_last_modified)(AuthorDetailView.as_view()))
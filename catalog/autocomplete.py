@@ -0,0 +1,279 @@
+"""In-process autocomplete index for book titles and author names.
+
+Each process keeps one index, built from the database on first use and then kept
+up to date from model signals (see signals.py). Changes made by other processes are
+only seen after ``CATALOG_AUTOCOMPLETE_MAX_AGE`` seconds, when the index is rebuilt.
+That rebuild runs in a background thread: lookups keep using the old index until the
+new one, with the changes signalled meanwhile replayed on it, replaces it.
+
+Layout: every title/name gets a slot in a plain list of labels. Prefix lookups bisect
+a sorted list of ``"word\\x00slot"`` strings (one per word), and typo/infix lookups use
+a dict mapping each trigram to an ``array('I')`` of slots. Removed slots are only
+marked dead and skipped; the index compacts itself once half of it is dead.
+"""
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+BOOK_KIND = 'book'
+AUTHOR_KIND = 'author'
+KINDS = (BOOK_KIND, AUTHOR_KIND)
+
+MAX_AGE = getattr(settings, 'CATALOG_AUTOCOMPLETE_MAX_AGE', 15 * 60)
+
+logger = logging.getLogger(__name__)
+
+_SEPARATOR = '\x00'
+
+
+def normalize(text):
+    """Lowercase text and strip accents so 'Émile' matches 'emile'."""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def words(text):
+    return re.findall(r'\w+', normalize(text))
+
+
+def trigrams(text):
+    padded = f'  {normalize(text)} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AutocompleteIndex:
+    # Trigrams found in more than this share of labels are too common to help ranking
+    COMMON_TRIGRAM_SHARE = 0.02
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+        self.built_at = time.monotonic()
+
+    def _clear(self):
+        self._labels = []  # slot -> label, None once removed
+        self._keys = array('q')  # slot -> object id * 2 + kind
+        self._slots = {}  # object id * 2 + kind -> slot
+        self._prefixes = []  # sorted "word\x00slot" strings
+        self._trigrams = {}  # trigram -> array of slots
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    @staticmethod
+    def _key(kind, object_id):
+        return object_id * 2 + KINDS.index(kind)
+
+    def _insert(self, key, label, keep_sorted=True):
+        slot = len(self._labels)
+        self._labels.append(label)
+        self._keys.append(key)
+        self._slots[key] = slot
+        for word in set(words(label)):
+            entry = f'{word}{_SEPARATOR}{slot:x}'
+            if keep_sorted:
+                insort(self._prefixes, entry)
+            else:
+                self._prefixes.append(entry)
+        for trigram in trigrams(label):
+            self._trigrams.setdefault(trigram, array('I')).append(slot)
+
+    def _remove(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        for word in set(words(self._labels[slot])):
+            entry = f'{word}{_SEPARATOR}{slot:x}'
+            position = bisect_left(self._prefixes, entry)
+            if position < len(self._prefixes) and self._prefixes[position] == entry:
+                del self._prefixes[position]
+        # Trigram postings are left in place and skipped because the label is gone
+        self._labels[slot] = None
+        self._dead += 1
+
+    def _compact(self):
+        live = [(self._keys[slot], label) for slot, label in enumerate(self._labels) if label is not None]
+        self._clear()
+        for key, label in live:
+            self._insert(key, label, keep_sorted=False)
+        self._prefixes.sort()
+
+    def bulk_load(self, entries):
+        """Load (kind, object_id, label) entries, sorting the prefix list once at the end."""
+        with self._lock:
+            for kind, object_id, label in entries:
+                self._insert(self._key(kind, object_id), label, keep_sorted=False)
+            self._prefixes.sort()
+
+    def add(self, kind, object_id, label):
+        """Add or replace the label of a book or author."""
+        key = self._key(kind, object_id)
+        with self._lock:
+            if key in self._slots:
+                if self._labels[self._slots[key]] == label:
+                    return
+                self._remove(key)
+            self._insert(key, label)
+
+    def remove(self, kind, object_id):
+        with self._lock:
+            self._remove(self._key(kind, object_id))
+            if self._dead > len(self._slots):
+                self._compact()
+
+    def _result(self, slot):
+        key = self._keys[slot]
+        return {'kind': KINDS[key % 2], 'id': key // 2, 'label': self._labels[slot]}
+
+    def lookup(self, query, limit=10):
+        """Return up to limit {'kind', 'id', 'label'} dicts matching query.
+
+        Labels with a word starting with the last query word (and containing the other
+        query words) come first, then the closest trigram matches to fill the list.
+        """
+        query_words = words(query)
+        if not query_words:
+            return []
+        *whole, partial = query_words
+        normalized_query = ' '.join(query_words)
+
+        with self._lock:
+            matches = {}
+            position = bisect_left(self._prefixes, partial)
+            while position < len(self._prefixes) and len(matches) < limit * 5:
+                entry = self._prefixes[position]
+                position += 1
+                if not entry.startswith(partial):
+                    break
+                slot = int(entry.rsplit(_SEPARATOR, 1)[1], 16)
+                label = self._labels[slot]
+                if slot in matches:
+                    continue
+                label_words = words(label)
+                if all(any(word.startswith(w) for word in label_words) for w in whole):
+                    # Labels that start with the query sort first, then alphabetically
+                    matches[slot] = (not normalize(label).startswith(normalized_query), label)
+            slots = [slot for slot, _ in heapq.nsmallest(limit, matches.items(), key=lambda item: item[1])]
+
+            if len(slots) < limit and len(normalized_query) >= 3:
+                common = max(self.COMMON_TRIGRAM_SHARE * len(self._labels), 100)
+                postings = [self._trigrams.get(trigram, ()) for trigram in trigrams(normalized_query)]
+                postings = [slots_ for slots_ in postings if len(slots_) <= common]
+                shared = Counter()
+                for slots_ in postings:
+                    shared.update(slots_)
+                needed = len(postings) // 2 + 1
+                for slot, count in shared.most_common():
+                    if len(slots) >= limit or count < needed:
+                        break
+                    if slot not in matches and self._labels[slot] is not None:
+                        slots.append(slot)
+
+            return [self._result(slot) for slot in slots]
+
+
+_index = None
+_index_lock = threading.Lock()
+# The background rebuild in progress, and the changes to replay on its index
+_rebuild = None
+_changes = []
+_rebuild_lock = threading.Lock()
+
+
+def build_index():
+    """Build a fresh index from every book title and author name in the database."""
+    from .models import Author, Book
+
+    index = AutocompleteIndex()
+
+    def entries():
+        for pk, title in Book.objects.values_list('pk', 'title').iterator(chunk_size=2000):
+            yield BOOK_KIND, pk, title
+        for pk, last_name, first_name in Author.objects.values_list(
+                'pk', 'last_name', 'first_name').iterator(chunk_size=2000):
+            yield AUTHOR_KIND, pk, f'{last_name}, {first_name}'  # Same as Author.__str__
+
+    index.bulk_load(entries())
+    return index
+
+
+def _rebuild_in_background():
+    global _index, _rebuild
+    index = None
+    try:
+        index = build_index()
+    except Exception:
+        # Keep serving the old index; the next stale lookup tries again
+        logger.exception('Rebuilding the autocomplete index failed')
+    finally:
+        connections.close_all()
+        with _rebuild_lock:
+            # reset() may have dropped this rebuild meanwhile
+            if _rebuild is threading.current_thread():
+                if index is not None:
+                    # Changes signalled while the rows were read may be missing from them
+                    for change in _changes:
+                        if change[0] == 'add':
+                            index.add(*change[1:])
+                        else:
+                            index.remove(*change[1:])
+                    _index = index
+                _changes.clear()
+                _rebuild = None
+
+
+def get_index():
+    """Return this process's index, building it on first use.
+
+    Once it is older than MAX_AGE a new one is built in the background, and the
+    old one is returned until then.
+    """
+    global _index, _rebuild
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _index = build_index()
+            index = _index
+    elif time.monotonic() - index.built_at > MAX_AGE and _rebuild is None:
+        with _rebuild_lock:
+            if _rebuild is None:
+                _rebuild = threading.Thread(target=_rebuild_in_background, name='autocomplete-rebuild', daemon=True)
+                _rebuild.start()
+    return index
+
+
+def update(kind, object_id, label):
+    """Apply a change to the index if this process has built one; otherwise it is read on build."""
+    with _rebuild_lock:
+        if _rebuild is not None:
+            _changes.append(('add', kind, object_id, label))
+    if _index is not None:
+        _index.add(kind, object_id, label)
+
+
+def remove(kind, object_id):
+    with _rebuild_lock:
+        if _rebuild is not None:
+            _changes.append(('remove', kind, object_id))
+    if _index is not None:
+        _index.remove(kind, object_id)
+
+
+def reset():
+    """Forget the index so the next lookup rebuilds it."""
+    global _index, _rebuild
+    with _index_lock, _rebuild_lock:
+        _index = None
+        _rebuild = None
+        _changes.clear()
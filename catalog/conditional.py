@@ -0,0 +1,176 @@
+"""ETag and Last-Modified validators for the book and author detail pages.
+
+A detail page changes when its object, or a related row it shows, changes. Every
+write to those rows moves an ``updated_at`` column: ``auto_now`` covers saves, the
+services and bulk updates set it explicitly, and signals touch the books of a
+renamed genre or language and the author a book leaves. Adding or removing a copy
+changes the book's copy counts, which touches the book too.
+
+So a page's state is the newest of those timestamps plus the number of related
+rows, read in one query. The views answer ``If-None-Match``/``If-Modified-Since``
+with a 304 from it before loading or rendering anything else.
+
+Anonymous requests reach these validators only on a miss of the page cache
+(tagcache.py), so an ``updated_at`` moved by a queryset update is not seen until
+the code doing it invalidates the rows' tags as well.
+
+Pages for a signed-in user also show their name, their place in the hold queue and
+forms carrying their CSRF token, none of which have a timestamp. Their ETag mixes
+those in and they get no Last-Modified.
+
+Django's condition() calls its validators synchronously, which async views cannot
+do with the ORM; acondition() takes the async validators (``abook_etag``...) instead.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import services
+from .models import Author, Book
+
+
+def _book_row(pk):
+    return (
+        Book.objects.filter(pk=pk)
+        .annotate(copies=Count('bookinstance'), copies_updated=Max('bookinstance__updated_at'))
+        .values_list('updated_at', 'author__updated_at', 'copies', 'copies_updated')
+    )
+
+
+def _book_page(row):
+    if row is None:
+        return None
+    updated_at, author_updated_at, copies, copies_updated = row
+    return max(filter(None, (updated_at, author_updated_at, copies_updated))), copies
+
+
+def book_state(pk):
+    """Return (last_modified, related rows) of a book's detail page, or None if there is no such book."""
+    return _book_page(_book_row(pk).first())
+
+
+async def abook_state(pk):
+    return _book_page(await _book_row(pk).afirst())
+
+
+def _author_row(pk):
+    return (
+        Author.objects.filter(pk=pk)
+        .annotate(books=Count('book'), books_updated=Max('book__updated_at'))
+        .values_list('updated_at', 'books', 'books_updated')
+    )
+
+
+def _author_page(row):
+    if row is None:
+        return None
+    updated_at, books, books_updated = row
+    return max(filter(None, (updated_at, books_updated))), books
+
+
+def author_state(pk):
+    """Return (last_modified, related rows) of an author's detail page, or None if there is no such author."""
+    return _author_page(_author_row(pk).first())
+
+
+async def aauthor_state(pk):
+    return _author_page(await _author_row(pk).afirst())
+
+
+def _state(request, state, pk):
+    # condition() asks for the ETag and Last-Modified separately; read the state once
+    states = request.__dict__.setdefault('_catalog_page_states', {})
+    if (state, pk) not in states:
+        states[state, pk] = state(pk)
+    return states[state, pk]
+
+
+async def _astate(request, state, pk):
+    states = request.__dict__.setdefault('_catalog_page_states', {})
+    if (state, pk) not in states:
+        states[state, pk] = await state(pk)
+    return states[state, pk]
+
+
+def _etag(request, user, name, pk, page, *personal):
+    if page is None:
+        return None
+    parts = [name, pk, page[0].isoformat(), page[1]]
+    if user.is_authenticated:
+        # Make sure the CSRF secret the page's forms will carry exists before it is hashed
+        get_token(request)
+        parts += [user.pk, request.META.get('CSRF_COOKIE', ''), *personal]
+    return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def _last_modified(user, page):
+    if page is None or user.is_authenticated:
+        return None
+    return page[0]
+
+
+def book_etag(request, pk):
+    page = _state(request, book_state, pk)
+    if not request.user.is_authenticated:
+        return _etag(request, request.user, 'book', pk, page)
+    return _etag(request, request.user, 'book', pk, page, services.queue_position(Book(pk=pk), request.user))
+
+
+def book_last_modified(request, pk):
+    return _last_modified(request.user, _state(request, book_state, pk))
+
+
+def author_etag(request, pk):
+    return _etag(request, request.user, 'author', pk, _state(request, author_state, pk))
+
+
+def author_last_modified(request, pk):
+    return _last_modified(request.user, _state(request, author_state, pk))
+
+
+async def abook_etag(request, pk):
+    page = await _astate(request, abook_state, pk)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return _etag(request, user, 'book', pk, page)
+    position = await sync_to_async(services.queue_position)(Book(pk=pk), user)
+    return _etag(request, user, 'book', pk, page, position)
+
+
+async def abook_last_modified(request, pk):
+    return _last_modified(await request.auser(), await _astate(request, abook_state, pk))
+
+
+async def aauthor_etag(request, pk):
+    return _etag(request, await request.auser(), 'author', pk, await _astate(request, aauthor_state, pk))
+
+
+async def aauthor_last_modified(request, pk):
+    return _last_modified(await request.auser(), await _astate(request, aauthor_state, pk))
+
+
+def acondition(etag_func, last_modified_func):
+    """condition() for async views, awaiting async validators."""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = await etag_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            last_modified = await last_modified_func(request, *args, **kwargs)
+            last_modified = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
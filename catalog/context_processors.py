@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+
+SIDEBAR_FRAGMENT = 'sidebar'
+SIDEBAR_TIMEOUT = getattr(settings, 'CATALOG_SIDEBAR_TIMEOUT', 60 * 60)
+
+
+def sidebar_variant(user):
+    """Return which cached sidebar a user sees.
+
+    Anonymous and non-staff users share one sidebar each. Staff links depend on the
+    user's own permissions, so each staff member gets a sidebar of their own, deleted
+    by invalidate_sidebars() whenever their groups or permissions change.
+    """
+    if not user.is_authenticated:
+        return 'anonymous'
+    if not user.is_staff:
+        return 'member'
+    return f'staff-{user.pk}'
+
+
+def invalidate_sidebars(user_ids):
+    """Forget the cached sidebars of these users."""
+    # The {% cache %} tag prefers a 'template_fragments' cache when one is configured
+    try:
+        fragment_cache = caches['template_fragments']
+    except InvalidCacheBackendError:
+        fragment_cache = caches['default']
+    fragment_cache.delete_many([
+        make_template_fragment_key(SIDEBAR_FRAGMENT, [f'staff-{user_id}']) for user_id in user_ids
+    ])
+
+
+def sidebar(request):
+    """Add the sidebar fragment cache key and timeout to every template context."""
+    user = getattr(request, 'user', None)
+    if user is None:
+        return {}
+    return {'sidebar_variant': sidebar_variant(user), 'sidebar_timeout': SIDEBAR_TIMEOUT}
@@ -0,0 +1,175 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Book, BookInstance, BookInstanceCounter
+
+
+def _bump(book_id, status, delta):
+    """Atomically add delta to one counter row, creating the row if needed."""
+    counters = BookInstanceCounter.objects.filter(book_id=book_id, status=status)
+    if counters.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            BookInstanceCounter.objects.create(book_id=book_id, status=status, count=delta)
+    except IntegrityError:
+        # Another transaction created the row first, so it can be updated now.
+        counters.update(count=F('count') + delta)
+
+
+def adjust(book_id, status, delta):
+    """Add delta copies in status to the global counter and to the book's own counter."""
+    _bump(None, status, delta)
+    if book_id is not None:
+        _bump(book_id, status, delta)
+
+
+def _count_copies(book_id, total, available):
+    """Add to the copy counts stored on the book itself."""
+    changes = {}
+    if total:
+        changes['total_copies'] = F('total_copies') + total
+    if available:
+        changes['available_copies'] = F('available_copies') + available
+    if changes:
+        Book.objects.filter(pk=book_id).update(**changes, updated_at=timezone.now())
+
+
+def record_change(old, new):
+    """Move one copy between (book_id, status) pairs; None means it did not exist."""
+    if old == new:
+        return
+    per_book = Counter()
+    for key, delta in ((old, -1), (new, 1)):
+        if key is None:
+            continue
+        book_id, status = key
+        adjust(book_id, status, delta)
+        if book_id is not None:
+            per_book[book_id, 'total'] += delta
+            per_book[book_id, 'available'] += delta if status == 'a' else 0
+    # A status change within one book leaves its total alone, so it costs one UPDATE at most
+    for book_id in {book_id for book_id, _ in per_book}:
+        _count_copies(book_id, per_book[book_id, 'total'], per_book[book_id, 'available'])
+
+
+def record_new_books(copies):
+    """Count copies created with bulk_create (which sends no signals) for books that are new too.
+
+    The books have no counter rows yet, so theirs are bulk inserted; the global
+    counters are adjusted once per status, and the books' copy counts are set
+    from their new counter rows in one UPDATE.
+    """
+    per_book = Counter((copy.book_id, copy.status) for copy in copies)
+    BookInstanceCounter.objects.bulk_create(
+        BookInstanceCounter(book_id=book_id, status=status, count=count)
+        for (book_id, status), count in per_book.items() if book_id is not None
+    )
+    for status, count in Counter(copy.status for copy in copies).items():
+        _bump(None, status, count)
+
+    book_counters = BookInstanceCounter.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    Book.objects.filter(pk__in={book_id for book_id, _ in per_book if book_id is not None}).update(
+        total_copies=Coalesce(Subquery(book_counters.annotate(n=Sum('count')).values('n')), Value(0)),
+        available_copies=Coalesce(Subquery(book_counters.filter(status='a').values('count')), Value(0)),
+        updated_at=timezone.now(),
+    )
+
+
+def status_counts(book=None):
+    """Return a dict of copy counts for every loan status, for one book or the whole library."""
+    counts = {status: 0 for status, _ in BookInstance.LOAN_STATUS}
+    counters = BookInstanceCounter.objects.filter(book=book).values_list('status', 'count')
+    counts.update(counters)
+    return counts
+
+
+async def astatus_counts(book=None):
+    """status_counts() for async views."""
+    counts = {status: 0 for status, _ in BookInstance.LOAN_STATUS}
+    async for status, count in BookInstanceCounter.objects.filter(book=book).values_list('status', 'count'):
+        counts[status] = count
+    return counts
+
+
+def _expected_counters():
+    """Count the copies in each status, per book and globally, from the BookInstance table."""
+    per_book = BookInstance.objects.filter(book__isnull=False).values_list('book_id', 'status')
+    overall = BookInstance.objects.values_list('status')
+
+    expected = {
+        (book_id, status): count
+        for book_id, status, count in per_book.annotate(n=Count('pk')).order_by().values_list('book_id', 'status', 'n')
+    }
+    expected.update(
+        ((None, status), count)
+        for status, count in overall.annotate(n=Count('pk')).order_by().values_list('status', 'n')
+    )
+    return expected
+
+
+def counter_drift():
+    """Return {(book_id, status): (stored, expected)} for every counter that is wrong."""
+    expected = _expected_counters()
+    current = {
+        (book_id, status): count
+        for book_id, status, count in BookInstanceCounter.objects.values_list('book_id', 'status', 'count')
+    }
+    return {
+        key: (current.get(key, 0), expected.get(key, 0))
+        for key in expected.keys() | current.keys() if expected.get(key, 0) != current.get(key, 0)
+    }
+
+
+def _copy_counts():
+    """Expressions counting a book's copies and available copies in the BookInstance table."""
+    copies = BookInstance.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    return {
+        'total_copies': Coalesce(Subquery(copies.annotate(n=Count('pk')).values('n')), Value(0)),
+        'available_copies': Coalesce(Subquery(copies.filter(status='a').annotate(n=Count('pk')).values('n')), Value(0)),
+    }
+
+
+def book_drift():
+    """Return the books whose stored copy counts differ from their copies.
+
+    Each book is annotated with its expected_total and expected_available counts.
+    """
+    counts = _copy_counts()
+    return (
+        Book.objects.annotate(expected_total=counts['total_copies'], expected_available=counts['available_copies'])
+        .exclude(total_copies=F('expected_total'), available_copies=F('expected_available'))
+        .order_by('pk')
+    )
+
+
+def rebuild():
+    """Recompute every counter from the BookInstance table; returns the number of rows corrected."""
+    with transaction.atomic():
+        current = {
+            (book_id, status): count
+            for book_id, status, count in BookInstanceCounter.objects.select_for_update()
+            .values_list('book_id', 'status', 'count')
+        }
+        # Counted once the counters are locked, so a status change committed before
+        # then is included and one after it waits for the new counters
+        expected = _expected_counters()
+        drifted = sum(1 for key in expected.keys() | current.keys() if expected.get(key, 0) != current.get(key, 0))
+        BookInstanceCounter.objects.all().delete()
+        BookInstanceCounter.objects.bulk_create(
+            BookInstanceCounter(book_id=book_id, status=status, count=count)
+            for (book_id, status), count in expected.items()
+        )
+    return drifted
+
+
+def rebuild_books():
+    """Recompute the copy counts of the books that drifted; returns the number of books corrected."""
+    drifted = list(book_drift().values_list('pk', flat=True))
+    # Counted again inside the UPDATE, so a copy changing meanwhile is not undone
+    Book.objects.filter(pk__in=drifted).update(**_copy_counts(), updated_at=timezone.now())
+    return len(drifted)
@@ -0,0 +1,139 @@
+"""Streaming export of the whole catalog as JSON Lines (NDJSON) or CSV.
+
+Rows are read in keyset chunks (``WHERE id > last id ORDER BY id LIMIT n``), each
+through ``.iterator()``, so neither the database nor Python holds more than one
+chunk at a time and no transaction stays open for the length of the export. Book
+genres are prefetched once per chunk. The book columns match what import_catalog
+reads, so an export can be imported into another library.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .models import Author, Book, BookInstance, Genre
+
+CHUNK_SIZE = 1000
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def book_row(book):
+    return {
+        'id': book.pk,
+        'isbn': book.isbn,
+        'title': book.title,
+        'summary': book.summary,
+        'author_id': book.author_id,
+        'author_first_name': book.author.first_name if book.author else '',
+        'author_last_name': book.author.last_name if book.author else '',
+        'language': book.language.name if book.language else '',
+        'genres': [genre.name for genre in book.genre.all()],
+        'available_copies': book.available_copies,
+        'total_copies': book.total_copies,
+    }
+
+
+def author_row(author):
+    return {
+        'id': author.pk,
+        'first_name': author.first_name,
+        'last_name': author.last_name,
+        'date_of_birth': author.date_of_birth,
+        'date_of_death': author.date_of_death,
+    }
+
+
+def copy_row(copy):
+    # Borrowers are left out: the export is for catalog systems, not patron records
+    return {
+        'id': copy.pk,
+        'book_id': copy.book_id,
+        'imprint': copy.imprint,
+        'status': copy.status,
+        'due_back': copy.due_back,
+    }
+
+
+class Export:
+    """One exportable model: the rows to read, how to turn them into a dict, and who may read them."""
+
+    def __init__(self, queryset, fields, to_row, permission):
+        self.queryset = queryset
+        self.fields = fields
+        self.to_row = to_row
+        self.permission = permission
+
+    def rows(self, chunk_size=CHUNK_SIZE):
+        """Yield a dict per object, reading chunk_size objects per query."""
+        queryset = self.queryset.order_by('pk')
+        last_pk = None
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            count = 0
+            # The iterator prefetches the genres of the chunk's books in one query
+            for obj in chunk[:chunk_size].iterator(chunk_size=chunk_size):
+                count += 1
+                last_pk = obj.pk
+                yield self.to_row(obj)
+            if count < chunk_size:
+                return
+
+
+EXPORTS = {
+    'books': Export(
+        Book.objects.select_related('author', 'language').prefetch_related(
+            Prefetch('genre', queryset=Genre.objects.order_by('name'))),
+        ['id', 'isbn', 'title', 'summary', 'author_id', 'author_first_name', 'author_last_name', 'language',
+         'genres', 'available_copies', 'total_copies'],
+        book_row,
+        'catalog.view_book',
+    ),
+    'authors': Export(
+        Author.objects.all(),
+        ['id', 'first_name', 'last_name', 'date_of_birth', 'date_of_death'],
+        author_row,
+        'catalog.view_author',
+    ),
+    'copies': Export(
+        BookInstance.objects.all(),
+        ['id', 'book_id', 'imprint', 'status', 'due_back'],
+        copy_row,
+        'catalog.view_bookinstance',
+    ),
+}
+
+
+class Echo:
+    """A file-like object whose write() returns the value, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(export, chunk_size=CHUNK_SIZE):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in export.rows(chunk_size):
+        yield encoder.encode(row) + '\n'
+
+
+def csv_lines(export, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(export.fields)
+    for row in export.rows(chunk_size):
+        # Genres go in one cell separated by semicolons, as import_catalog reads them
+        yield writer.writerow([
+            '; '.join(value) if isinstance(value, list) else ('' if value is None else value)
+            for value in (row[field] for field in export.fields)
+        ])
+
+
+def lines(kind, file_format, chunk_size=CHUNK_SIZE):
+    """Yield the export of kind ('books', 'authors' or 'copies') as lines of text."""
+    export = EXPORTS[kind]
+    if file_format == 'csv':
+        return csv_lines(export, chunk_size)
+    return ndjson_lines(export, chunk_size)
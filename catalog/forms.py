@@ -9,17 +9,21 @@ from django.forms import ModelForm
 from catalog.models import BookInstance
 
 
+def validate_renewal_date(data):
+    """Check a renewal date is between today and four weeks ahead."""
+    # Check if a date is not in the past.
+    if data < datetime.date.today():
+        raise ValidationError(_('Invalid date - renewal in past'))
+
+    # Check if a date is in the allowed range (+4 weeks from today).
+    if data > datetime.date.today() + datetime.timedelta(weeks=4):
+        raise ValidationError(_('Invalid date - renewal more than 4 weeks ahead'))
+
+
 class RenewBookModelForm(ModelForm):
     def clean_due_back(self):
         data = self.cleaned_data['due_back']
-
-        # Check if a date is not in the past.
-        if data < datetime.date.today():
-            raise ValidationError(_('Invalid date - renewal in past'))
-
-        # Check if a date is in the allowed range (+4 weeks from today).
-        if data > datetime.date.today() + datetime.timedelta(weeks=4):
-            raise ValidationError(_('Invalid date - renewal more than 4 weeks ahead'))
+        validate_renewal_date(data)
 
         # Remember to always return the cleaned data.
         return data
@@ -36,14 +40,29 @@ class RenewBookForm(forms.Form):
 
     def clean_renewal_date(self):
         data = self.cleaned_data['renewal_date']
-
-        # Check if a date is not in the past.
-        if data < datetime.date.today():
-            raise ValidationError(_('Invalid date - renewal in past'))
-
-        # Check if a date is in the allowed range (+4 weeks from today).
-        if data > datetime.date.today() + datetime.timedelta(weeks=4):
-            raise ValidationError(_('Invalid date - renewal more than 4 weeks ahead'))
+        validate_renewal_date(data)
 
         # Remember to always return the cleaned data.
         return data
+
+
+class BulkRenewBookForm(forms.Form):
+    """Pick several loans and one new due date for all of them.
+
+    Only the loans passed in (a page of them) are offered, but any copy is accepted:
+    one returned since the form was shown is skipped by the renewal, rather than
+    failing the whole form.
+    """
+    due_back = forms.DateField(label=_('Renewal date'),
+                               help_text=_('Enter a date between now and 4 weeks (default 3 weeks).'),
+                               validators=[validate_renewal_date])
+    copies = forms.ModelMultipleChoiceField(
+        queryset=BookInstance.objects.all(),
+        widget=forms.CheckboxSelectMultiple,
+        label=_('Loans to renew'),
+    )
+
+    def __init__(self, *args, loans=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['copies'].widget.choices = [
+            (copy.pk, f'{copy.book.title} - {copy.borrower} (due {copy.due_back})') for copy in loans]
@@ -0,0 +1,155 @@
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+
+from catalog.models import Author, Book
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Compare requests per second of the catalog pages served by the sync views through the WSGI '
+            'handler on a thread pool with the async views through the ASGI handler on an event loop.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Requests in flight: WSGI threads or ASGI tasks (default: 8).')
+        parser.add_argument('--seconds', type=float, default=10, help='Length of each run (default: 10).')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Send anonymous requests, which the page cache mostly answers; by default a '
+                                 'signed-in user\'s pages are rendered every time.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        book_ids = list(Book.objects.values_list('pk', flat=True)[:10_000])
+        author_ids = list(Author.objects.values_list('pk', flat=True)[:10_000])
+        if not book_ids or not author_ids:
+            raise CommandError('The database has no books; run generate_library first.')
+        rng = random.Random(options['seed'])
+        self.urls = [
+            rng.choice([
+                reverse('index'),
+                f"{reverse('books')}?page={rng.randint(1, 20)}",
+                reverse('book-detail', args=[rng.choice(book_ids)]),
+                reverse('author-detail', args=[rng.choice(author_ids)]),
+            ])
+            for _ in range(1000)
+        ]
+
+        user = None
+        self.cookie = ''
+        if not options['anonymous']:
+            user = User.objects.create_user(username='asgi-benchmark')
+            client = Client()
+            client.force_login(user)
+            self.cookie = client.cookies.output(header='', sep=';').strip()
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for label, run in [('WSGI, sync views', self.wsgi), ('ASGI, async views', self.asgi)]:
+                    timings, statuses = run(options)
+                    self.report(label, timings, statuses, options['seconds'])
+        finally:
+            if user is not None:
+                client.logout()
+                user.delete()
+
+    def report(self, label, timings, statuses, seconds):
+        timings = sorted(timings)
+
+        def percentile(share):
+            return timings[min(len(timings) - 1, int(len(timings) * share))]
+
+        errors = sum(1 for status in statuses if status >= 400)
+        self.stdout.write(
+            f'{label:<20} {len(timings) / seconds:8.1f} requests/s, mean {statistics.mean(timings):.1f} ms, '
+            f'p50 {percentile(0.5):.1f} ms, p95 {percentile(0.95):.1f} ms, {errors} errors'
+        )
+
+    def wsgi(self, options):
+        factory = RequestFactory(HTTP_COOKIE=self.cookie)
+        timings, statuses = [], []
+
+        def worker(handler, offset, deadline):
+            i = offset
+            while time.perf_counter() < deadline:
+                url = self.urls[i % len(self.urls)]
+                i += 1
+                start = time.perf_counter()
+                response = handler(factory.get(url).environ, lambda status, headers: None)
+                b''.join(response)
+                # Fires request_finished, as a WSGI server does
+                response.close()
+                timings.append((time.perf_counter() - start) * 1000)
+                statuses.append(response.status_code)
+
+        with override_settings(ROOT_URLCONF='locallibrary.urls'):
+            handler = WSGIHandler()
+            deadline = time.perf_counter() + options['seconds']
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                for future in [pool.submit(worker, handler, i * 97, deadline) for i in range(options['concurrency'])]:
+                    future.result()
+        return timings, statuses
+
+    def asgi(self, options):
+        timings, statuses = [], []
+        headers = [(b'host', b'testserver')]
+        if self.cookie:
+            headers.append((b'cookie', self.cookie.encode()))
+
+        async def request(handler, url):
+            parts = urlsplit(url)
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': parts.path, 'raw_path': parts.path.encode(),
+                'query_string': parts.query.encode(), 'root_path': settings.FORCE_SCRIPT_NAME or '',
+                'headers': headers, 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+            }
+            disconnected = asyncio.Event()
+            received = []
+
+            async def receive():
+                if not received:
+                    received.append(True)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # The client stays connected until the response is sent
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            status = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            await handler(scope, receive, send)
+            disconnected.set()
+            return status[0]
+
+        async def worker(handler, offset, deadline):
+            i = offset
+            while time.perf_counter() < deadline:
+                url = self.urls[i % len(self.urls)]
+                i += 1
+                start = time.perf_counter()
+                statuses.append(await request(handler, url))
+                timings.append((time.perf_counter() - start) * 1000)
+
+        async def main():
+            handler = ASGIHandler()
+            deadline = time.perf_counter() + options['seconds']
+            await asyncio.gather(*(worker(handler, i * 97, deadline) for i in range(options['concurrency'])))
+
+        with override_settings(ROOT_URLCONF='locallibrary.asgi_urls'):
+            asyncio.run(main())
+        return timings, statuses
@@ -0,0 +1,90 @@
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from catalog import autocomplete
+
+SYLLABLES = ('an', 'bel', 'cor', 'da', 'el', 'fen', 'gra', 'hol', 'is', 'jun', 'ka', 'lor', 'mi', 'nor',
+             'os', 'pa', 'qui', 'ro', 'sa', 'tor', 'ul', 'ven', 'wy', 'xa', 'yor', 'zen')
+
+
+def fake_word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))).capitalize()
+
+
+class Command(BaseCommand):
+    help = 'Report the memory footprint and lookup latency of the autocomplete index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100_000,
+                            help='Number of synthetic titles/names to index (default: 100000).')
+        parser.add_argument('--lookups', type=int, default=5_000, help='Number of lookups to time.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--from-db', action='store_true',
+                            help='Index the books and authors in the database instead of synthetic data.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        if options['from_db']:
+            build = autocomplete.build_index
+        else:
+            entries = [
+                (autocomplete.BOOK_KIND if i % 4 else autocomplete.AUTHOR_KIND, i,
+                 ' '.join(fake_word(rng) for _ in range(rng.randint(1, 5))))
+                for i in range(options['entries'])
+            ]
+
+            def build():
+                index = autocomplete.AutocompleteIndex()
+                index.bulk_load(entries)
+                return index
+
+        start = time.perf_counter()
+        index = build()
+        build_seconds = time.perf_counter() - start
+
+        # Build a second time under tracemalloc, which would otherwise distort the build time
+        del index
+        tracemalloc.start()
+        index = build()
+        memory, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        labels = [label for label in index._labels if label]
+        if not labels:
+            self.stdout.write(self.style.WARNING('Nothing to index.'))
+            return
+
+        queries = []
+        for _ in range(options['lookups']):
+            word = rng.choice(autocomplete.words(rng.choice(labels)) or ['a'])
+            if rng.random() < 0.2 and len(word) > 4:
+                # A typo: drop one letter, which only the trigram fallback can match
+                cut = rng.randrange(len(word))
+                word = word[:cut] + word[cut + 1:]
+            else:
+                word = word[:rng.randint(1, len(word))]
+            queries.append(word)
+
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            index.lookup(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+
+        def percentile(share):
+            return timings[min(len(timings) - 1, int(len(timings) * share))]
+
+        self.stdout.write(f'Entries indexed:   {len(index)}')
+        self.stdout.write(f'Build time:        {build_seconds:.2f} s')
+        self.stdout.write(f'Memory (retained): {memory / 1024 / 1024:.1f} MiB ({memory / len(index):.0f} B/entry)')
+        self.stdout.write(f'Memory (peak):     {peak / 1024 / 1024:.1f} MiB')
+        self.stdout.write(
+            f'Lookup latency:    mean {statistics.mean(timings):.3f} ms, p50 {percentile(0.5):.3f} ms, '
+            f'p95 {percentile(0.95):.3f} ms, p99 {percentile(0.99):.3f} ms, max {timings[-1]:.3f} ms'
+        )
@@ -0,0 +1,81 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from catalog.models import Book
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Compare opening a database connection for every request with reusing persistent ones '
+            '(CONN_MAX_AGE), against the configured database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests timed with each setting (default: 500).')
+        parser.add_argument('--conn-max-age', type=int, default=600,
+                            help='CONN_MAX_AGE of the persistent run (default: 600).')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        book_ids = list(Book.objects.values_list('pk', flat=True)[:10_000])
+        if not book_ids:
+            raise CommandError('The database has no books; run generate_library first.')
+        self.stdout.write(f'{connection.vendor} database {connection.settings_dict["NAME"]}')
+
+        self.report('Connect', [self.timed(self.reconnect) for _ in range(min(options['requests'], 100))])
+
+        user = User.objects.create_user(username='connections-benchmark')
+        original = connection.settings_dict['CONN_MAX_AGE']
+        try:
+            # Signed in, so that pages are rendered rather than served from the page cache
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                client = Client()
+                client.force_login(user)
+                for label, max_age in [('Per-request connection', 0),
+                                       (f'Persistent ({options["conn_max_age"]}s)', options['conn_max_age'])]:
+                    connection.close()
+                    connection.settings_dict['CONN_MAX_AGE'] = max_age
+                    rng = random.Random(options['seed'])
+                    urls = [reverse('book-detail', args=[rng.choice(book_ids)]) if rng.random() < 0.8
+                            else f"{reverse('books')}?page={rng.randint(1, 20)}"
+                            for _ in range(options['requests'])]
+                    self.report(label, [self.timed(self.request, client, url) for url in urls])
+                client.logout()
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = original
+            user.delete()
+
+    def reconnect(self):
+        connection.close()
+        connection.ensure_connection()
+
+    def request(self, client, url):
+        client.get(url)
+        # The test client leaves connections open; close them as a server does at
+        # the end of a request, according to CONN_MAX_AGE
+        close_old_connections()
+
+    def timed(self, function, *args):
+        start = time.perf_counter()
+        function(*args)
+        return (time.perf_counter() - start) * 1000
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+
+        def percentile(share):
+            return timings[min(len(timings) - 1, int(len(timings) * share))]
+
+        self.stdout.write(
+            f'{label:<28} mean {statistics.mean(timings):.3f} ms, p50 {percentile(0.5):.3f} ms, '
+            f'p95 {percentile(0.95):.3f} ms, {1000 * len(timings) / sum(timings):.1f}/s'
+        )
@@ -0,0 +1,111 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import counters, services
+from catalog.models import Author, Book, BookInstance
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time hold placement, queue position lookups, cancellations and returns on long reservation queues.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=5, help='Number of popular titles (default: 5).')
+        parser.add_argument('--holds', type=int, default=2_000, help='Holds queued per title (default: 2000).')
+        parser.add_argument('--operations', type=int, default=500,
+                            help='Lookups, cancellations and returns timed of each kind (default: 500).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated rows instead of rolling back.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                self.benchmark(options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            pass
+
+    def timed(self, function, *args):
+        start = time.perf_counter()
+        function(*args)
+        return (time.perf_counter() - start) * 1000
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+
+        def percentile(share):
+            return timings[min(len(timings) - 1, int(len(timings) * share))]
+
+        self.stdout.write(
+            f'{label:<28} mean {statistics.mean(timings):.3f} ms, p50 {percentile(0.5):.3f} ms, '
+            f'p95 {percentile(0.95):.3f} ms, max {timings[-1]:.3f} ms'
+        )
+
+    def benchmark(self, options):
+        rng = self.rng
+        author = Author.objects.create(first_name='Benchmark', last_name='Author')
+        books = Book.objects.bulk_create([
+            Book(title=f'Popular title {i}', summary='', isbn=f'H{i:012d}', author=author)
+            for i in range(options['books'])
+        ])
+        # One copy per title, on loan, so that every patron has to queue
+        copies = BookInstance.objects.bulk_create([
+            BookInstance(book=book, imprint='Benchmark', status='o') for book in books
+        ])
+        counters.record_new_books(copies)
+        password = make_password(None)
+        patrons = User.objects.bulk_create([
+            User(username=f'holds-benchmark-{i}', password=password) for i in range(options['holds'])
+        ])
+
+        start = time.perf_counter()
+        placed = {book.pk: [] for book in books}
+        for patron in patrons:
+            for book in books:
+                placed[book.pk].append(self.timed(services.place_hold, book, patron))
+        fill_seconds = time.perf_counter() - start
+        tenth = max(1, options['holds'] // 10)
+        first = [t for timings in placed.values() for t in timings[:tenth]]
+        last = [t for timings in placed.values() for t in timings[-tenth:]]
+
+        lookups = [self.timed(services.queue_position, rng.choice(books), rng.choice(patrons))
+                   for _ in range(options['operations'])]
+
+        cancels = []
+        for _ in range(options['operations']):
+            book = rng.choice(books)
+            patron = rng.choice(patrons)
+            if services.queue_position(book, patron) is not None:
+                cancels.append(self.timed(services.cancel_hold, book, patron))
+
+        returns = []
+        for _ in range(options['operations']):
+            copy = rng.choice(copies)
+            returns.append(self.timed(services.return_copy, copy.pk))
+            # The patron it was reserved for takes it, so it can be returned again
+            patron = BookInstance.objects.filter(pk=copy.pk).values_list('borrower', flat=True).get()
+            if patron is not None:
+                services.checkout(copy.book, User(pk=patron))
+
+        self.stdout.write(f'Queued {sum(map(len, placed.values()))} holds on {len(books)} titles '
+                          f'in {fill_seconds:.1f}s')
+        self.report('Place hold (first 10%)', first)
+        self.report('Place hold (last 10%)', last)
+        self.report('Queue position', lookups)
+        self.report('Cancel hold', cancels)
+        self.report('Return and allocate', returns)
+        if not options['keep']:
+            self.stdout.write('Rolled back the benchmark data.')
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from catalog import sqlite
+from catalog.models import Author, Book, BookInstance
+
+User = get_user_model()
+
+# Label: (PRAGMA profile, CONN_MAX_AGE)
+RUNS = {
+    'default': ('', 0),
+    'production': ('production', 600),
+}
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+def worker(profile, conn_max_age, user_pk, book_ids, author_ids, seconds, write_share, seed):
+    """Send requests for `seconds` as one signed-in patron; return (timings in ms, errors)."""
+    # Forked with no open connection; the first query connects with these settings
+    sqlite.PROFILE = profile
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    rng = random.Random(seed)
+    client = Client()
+    client.force_login(User.objects.get(pk=user_pk))
+    timings = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if rng.random() < write_share:
+            # Borrow a copy and hand it back: two short write transactions
+            requests = [('post', reverse('book-borrow', args=[rng.choice(book_ids)]))]
+            loan = BookInstance.objects.filter(borrower_id=user_pk, status__exact='o').values_list('pk', flat=True)
+            requests += [('post', reverse('return-book-librarian', args=[pk])) for pk in loan[:1]]
+        else:
+            requests = [('get', rng.choice([
+                reverse('index'),
+                f"{reverse('books')}?page={rng.randint(1, 50)}",
+                reverse('book-detail', args=[rng.choice(book_ids)]),
+                reverse('author-detail', args=[rng.choice(author_ids)]),
+            ]))]
+        for method, url in requests:
+            start = time.perf_counter()
+            try:
+                getattr(client, method)(url)
+            except OperationalError:
+                # 'database is locked': the lock was not released within the busy timeout
+                errors += 1
+                continue
+            finally:
+                # The test client leaves connections open; close them as a server
+                # does at the end of a request, according to CONN_MAX_AGE
+                close_old_connections()
+            timings.append((time.perf_counter() - start) * 1000)
+    connections.close_all()
+    return timings, errors
+
+
+class Command(BaseCommand):
+    help = ('Load-test a copy of the SQLite database from several processes, with SQLite\'s defaults and '
+            'with the production profile (WAL, mmap, page cache, busy timeout, persistent connections).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Concurrent client processes (default: 4).')
+        parser.add_argument('--seconds', type=float, default=10, help='Length of each run (default: 10).')
+        parser.add_argument('--writes', type=float, default=0.1,
+                            help='Share of iterations that borrow and return a copy (default: 0.1).')
+        parser.add_argument('--runs', nargs='+', choices=RUNS, default=list(RUNS),
+                            help='Configurations to compare (default: all).')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            raise CommandError('benchmark_sqlite needs a file-based SQLite database.')
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('benchmark_sqlite needs the fork start method.')
+
+        source = connection.settings_dict['NAME']
+        book_ids = list(Book.objects.values_list('pk', flat=True))
+        author_ids = list(Author.objects.values_list('pk', flat=True))
+        if not book_ids or not author_ids:
+            raise CommandError('The database has no books; run generate_library first.')
+
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                for label in options['runs']:
+                    # Every run starts from the same copy, so the real database is never written
+                    path = os.path.join(directory, f'{label}.sqlite3')
+                    self.copy(source, path, RUNS[label][0])
+                    connections.close_all()
+                    connection.settings_dict['NAME'] = path
+                    self.run(label, book_ids, author_ids, options)
+                    connections.close_all()
+        finally:
+            connection.settings_dict['NAME'] = source
+
+    def copy(self, source, path, profile):
+        with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+            # The journal mode is stored in the file: set the one this run is about
+            dst.execute(f"PRAGMA journal_mode = {sqlite.pragmas(profile).get('journal_mode', 'DELETE')}")
+        src.close()
+        dst.close()
+
+    def run(self, label, book_ids, author_ids, options):
+        profile, conn_max_age = RUNS[label]
+        password = make_password(None)
+        # Superusers, so they may also mark their copies returned
+        users = User.objects.bulk_create([
+            User(username=f'sqlite-benchmark-{i}', password=password, is_superuser=True)
+            for i in range(options['processes'])
+        ])
+        connections.close_all()
+
+        jobs = [
+            (profile, conn_max_age, user.pk, book_ids, author_ids, options['seconds'], options['writes'],
+             options['seed'] + i)
+            for i, user in enumerate(users)
+        ]
+        with multiprocessing.get_context('fork').Pool(options['processes']) as pool:
+            results = pool.starmap(worker, jobs)
+
+        timings = sorted(t for worker_timings, _ in results for t in worker_timings)
+        errors = sum(worker_errors for _, worker_errors in results)
+        if not timings:
+            self.stdout.write(f'{label:<12} no request completed, {errors} errors')
+            return
+
+        def percentile(share):
+            return timings[min(len(timings) - 1, int(len(timings) * share))]
+
+        self.stdout.write(
+            f'{label:<12} {len(timings) / options["seconds"]:8.1f} requests/s, '
+            f'mean {statistics.mean(timings):.1f} ms, p50 {percentile(0.5):.1f} ms, '
+            f'p95 {percentile(0.95):.1f} ms, max {timings[-1]:.1f} ms, {errors} errors'
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from catalog import export
+
+
+class Command(BaseCommand):
+    help = 'Stream every book, author or copy to a JSON Lines (NDJSON) or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(export.EXPORTS))
+        parser.add_argument('--format', dest='file_format', choices=sorted(export.FORMATS), default='ndjson',
+                            help='Output format (default: ndjson).')
+        parser.add_argument('--output', '-o', default='-', help="Output file, or '-' for standard output (default).")
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE,
+                            help=f'Rows read per query (default: {export.CHUNK_SIZE}).')
+
+    def handle(self, *args, **options):
+        lines = export.lines(options['kind'], options['file_format'], options['chunk_size'])
+        if options['output'] == '-':
+            self.write(lines, self.stdout)
+        else:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                self.write(lines, output)
+            self.stderr.write(f'Wrote {options["kind"]} to {options["output"]}.')
+
+    def write(self, lines, output):
+        for line in lines:
+            output.write(line)
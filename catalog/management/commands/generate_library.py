@@ -0,0 +1,158 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from catalog import counters, search, tagcache
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.stats import invalidate_index_counts
+
+User = get_user_model()
+
+FIRST_NAMES = ('Ada', 'Chinua', 'Doris', 'Emeka', 'Fyodor', 'George', 'Haruki', 'Isabel', 'James', 'Jane',
+               'Kazuo', 'Leo', 'Margaret', 'Ngozi', 'Octavia', 'Chimamanda', 'Salman', 'Toni', 'Ursula', 'Virginia')
+LAST_NAMES = ('Achebe', 'Adichie', 'Allende', 'Atwood', 'Austen', 'Butler', 'Dostoevsky', 'Eliot', 'Ishiguro',
+              'Joyce', 'Lessing', 'Le Guin', 'Morrison', 'Murakami', 'Okafor', 'Rushdie', 'Tolstoy', 'Woolf')
+TITLE_WORDS = ('Things', 'Fall', 'Apart', 'Half', 'Yellow', 'Sun', 'Purple', 'Hibiscus', 'Night', 'River',
+               'Garden', 'House', 'Spirits', 'Left', 'Hand', 'Darkness', 'Remains', 'Day', 'Beloved', 'Anthills',
+               'Savannah', 'Arrow', 'God', 'Waves', 'Lighthouse', 'Kingdom', 'Dream', 'Stranger', 'Harvest')
+GENRE_WORDS = ('Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'Horror', 'Poetry', 'History', 'Biography',
+               'Thriller', 'Drama', 'Satire', 'Travel', 'Philosophy', 'Children', 'Adventure')
+LANGUAGE_WORDS = ('English', 'French', 'German', 'Spanish', 'Igbo', 'Yoruba', 'Hausa', 'Japanese', 'Russian',
+                  'Portuguese', 'Italian', 'Arabic', 'Swahili', 'Chinese', 'Hindi')
+
+# Share of copies in each loan status, roughly what a lending library looks like
+STATUS_WEIGHTS = (('a', 55), ('o', 30), ('m', 10), ('r', 5))
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible synthetic library (authors, books, copies, users) for benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=10_000)
+        parser.add_argument('--books', type=int, default=100_000)
+        parser.add_argument('--copies', type=int, default=1_000_000, help='Total BookInstances to create.')
+        parser.add_argument('--genres', type=int, default=50)
+        parser.add_argument('--languages', type=int, default=15)
+        parser.add_argument('--users', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the random generator (default: 0).')
+        parser.add_argument('--chunk-size', type=int, default=10_000,
+                            help='Books (with their copies) written per transaction (default: 10000).')
+        parser.add_argument('--batch-size', type=int, default=2_000, help='Rows per bulk_create INSERT.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = datetime.date.today()
+        start = time.perf_counter()
+
+        with transaction.atomic():
+            genre_ids = self.create_named(Genre, GENRE_WORDS, options['genres'])
+            language_ids = self.create_named(Language, LANGUAGE_WORDS, options['languages'])
+            author_ids = self.create_authors(options['authors'])
+            user_ids = self.create_users(options['users'])
+        self.stdout.write(f'Created lookups, {len(author_ids)} authors and {len(user_ids)} users '
+                          f'({time.perf_counter() - start:.1f}s)')
+
+        books_done = copies_done = 0
+        next_number = (Book.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        while books_done < options['books']:
+            chunk = min(options['chunk_size'], options['books'] - books_done)
+            # Spread the copies over the chunks in proportion to their books
+            copies = (options['copies'] * (books_done + chunk)) // options['books'] - copies_done
+            with transaction.atomic():
+                self.create_books(chunk, copies, next_number + books_done, author_ids, genre_ids, language_ids,
+                                  user_ids)
+            books_done += chunk
+            copies_done += copies
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'{books_done} books, {copies_done} copies ({copies_done / elapsed:.0f} copies/s)')
+
+        invalidate_index_counts()
+        # Bulk writes send no signals: drop every cached catalog page
+        tagcache.invalidate('catalog')
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {books_done} books and {copies_done} copies in {time.perf_counter() - start:.1f}s.'))
+
+    def create_named(self, model, words, count):
+        """Create count uniquely named rows (names stay unique ignoring case) and return all ids."""
+        names = [words[i] if i < len(words) else f'{words[i % len(words)]} {i // len(words)}'
+                 for i in range(count)]
+        model.objects.bulk_create([model(name=name) for name in names], ignore_conflicts=True)
+        return list(model.objects.values_list('pk', flat=True))
+
+    def create_authors(self, count):
+        rng = self.rng
+        authors = []
+        for _ in range(count):
+            birth = datetime.date(rng.randint(1800, 1990), rng.randint(1, 12), rng.randint(1, 28))
+            death = birth + datetime.timedelta(days=rng.randint(30, 95) * 365) if rng.random() < 0.4 else None
+            authors.append(Author(first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                                  date_of_birth=birth, date_of_death=death))
+        authors = Author.objects.bulk_create(authors, batch_size=self.batch_size)
+        search.index(search.AUTHOR_KIND, [author.pk for author in authors])
+        return [author.pk for author in authors]
+
+    def create_users(self, count):
+        offset = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        # Hash once: hashing a password per user would dominate the run time
+        password = make_password('password')
+        users = User.objects.bulk_create(
+            [User(username=f'reader{offset + i}', password=password) for i in range(count)],
+            batch_size=self.batch_size,
+        )
+        return [user.pk for user in users]
+
+    def random_title(self):
+        return ' '.join(self.rng.choice(TITLE_WORDS) for _ in range(self.rng.randint(1, 4))).capitalize()
+
+    def random_loan(self, user_ids):
+        """Return (status, due_back, borrower_id) for a copy."""
+        rng = self.rng
+        status = rng.choices([status for status, _ in STATUS_WEIGHTS], [w for _, w in STATUS_WEIGHTS])[0]
+        if status == 'o' and user_ids:
+            # About one loan in six is overdue
+            return status, self.today + datetime.timedelta(days=rng.randint(-14, 56)), rng.choice(user_ids)
+        if status == 'r' and user_ids:
+            return status, self.today + datetime.timedelta(days=rng.randint(1, 7)), rng.choice(user_ids)
+        return status, None, None
+
+    def create_books(self, count, copies, first_number, author_ids, genre_ids, language_ids, user_ids):
+        rng = self.rng
+        books = Book.objects.bulk_create([
+            Book(
+                title=self.random_title(),
+                summary=' '.join(rng.choice(TITLE_WORDS).lower() for _ in range(rng.randint(10, 40))),
+                isbn=f'G{first_number + i:012d}',  # Unique, and never a real ISBN-13
+                author_id=rng.choice(author_ids) if author_ids else None,
+                language_id=rng.choice(language_ids) if language_ids else None,
+            )
+            for i in range(count)
+        ], batch_size=self.batch_size)
+
+        if genre_ids:
+            Book.genre.through.objects.bulk_create([
+                Book.genre.through(book_id=book.pk, genre_id=genre_id)
+                for book in books
+                for genre_id in rng.sample(genre_ids, min(len(genre_ids), rng.randint(1, 3)))
+            ], batch_size=self.batch_size)
+
+        # A few popular titles get many copies: weight books with a Pareto distribution
+        weights = [rng.paretovariate(1.5) for _ in books]
+        instances = []
+        for book in rng.choices(books, weights, k=copies):
+            status, due_back, borrower_id = self.random_loan(user_ids)
+            instances.append(BookInstance(
+                book_id=book.pk,
+                imprint=f'{rng.choice(LAST_NAMES)} Press, {rng.randint(1950, 2024)}',
+                status=status, due_back=due_back, borrower_id=borrower_id,
+            ))
+        BookInstance.objects.bulk_create(instances, batch_size=self.batch_size)
+
+        counters.record_new_books(instances)
+        search.index(search.BOOK_KIND, [book.pk for book in books])
@@ -0,0 +1,228 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from catalog import counters, search, tagcache
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.stats import invalidate_index_counts
+
+STATUSES = {status for status, _ in BookInstance.LOAN_STATUS}
+
+
+def read_rows(stream, file_format):
+    """Yield one dict per input record without loading the whole file."""
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def value(row, name):
+    """Return a column as a stripped string, whatever type the JSON held."""
+    return str(row.get(name) or '').strip()
+
+
+def split_genres(value):
+    if isinstance(value, list):
+        return [name.strip() for name in value if name and name.strip()]
+    return [name.strip() for name in (value or '').replace('|', ';').split(';') if name.strip()]
+
+
+def author_names(row):
+    """Return (first_name, last_name) from author_first_name/author_last_name or 'Last, First'."""
+    if row.get('author_last_name') or row.get('author_first_name'):
+        return value(row, 'author_first_name'), value(row, 'author_last_name')
+    last_name, _, first_name = value(row, 'author').partition(',')
+    return first_name.strip(), last_name.strip()
+
+
+class NameLookup:
+    """In-memory name -> id map for a lookup model, matched case-insensitively.
+
+    Names are compared with Python's str.lower(): SQLite's LOWER() only folds ASCII
+    letters, so matching in SQL would miss stored names like 'Épopée'.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = {name.lower(): pk for pk, name in model.objects.values_list('pk', 'name').iterator()}
+        self.created = 0
+
+    def resolve(self, names):
+        """Make sure every name has a row, creating the missing ones in one bulk insert."""
+        missing = {}
+        for name in names:
+            if name and name.lower() not in self.ids:
+                missing.setdefault(name.lower(), name)
+        if not missing:
+            return
+        # Another import may have created some of the names meanwhile
+        missing = {key: name for key, name in missing.items() if key not in self.load(missing)}
+        if not missing:
+            return
+        # ignore_conflicts: ...or may still be doing so
+        self.model.objects.bulk_create([self.model(name=name) for name in missing.values()], ignore_conflicts=True)
+        self.created += len(self.load(missing))
+
+    def load(self, missing):
+        """Add the stored rows matching the missing names to the map and return their lowered names."""
+        candidates = self.model.objects.annotate(lower_name=Lower('name')).filter(
+            Q(lower_name__in=missing) | Q(name__in=missing.values()))
+        found = {name.lower(): pk for pk, name in candidates.values_list('pk', 'name')}
+        found = {key: pk for key, pk in found.items() if key in missing}
+        self.ids.update(found)
+        return found
+
+    def __getitem__(self, name):
+        return self.ids[name.lower()]
+
+
+class AuthorLookup:
+    """In-memory (first_name, last_name) -> id map, matched case-insensitively."""
+
+    def __init__(self):
+        self.ids = {
+            (first.lower(), last.lower()): pk
+            for pk, first, last in Author.objects.values_list('pk', 'first_name', 'last_name').iterator()
+        }
+        self.created = 0
+
+    def resolve(self, names):
+        """Create the authors not seen before and return their ids."""
+        missing = {}
+        for first, last in names:
+            if (first or last) and (first.lower(), last.lower()) not in self.ids:
+                missing.setdefault((first.lower(), last.lower()), (first, last))
+        authors = Author.objects.bulk_create([Author(first_name=first, last_name=last)
+                                              for first, last in missing.values()])
+        for key, author in zip(missing, authors):
+            self.ids[key] = author.pk
+        self.created += len(authors)
+        return [author.pk for author in authors]
+
+    def get(self, first, last):
+        return self.ids.get((first.lower(), last.lower()))
+
+
+class Command(BaseCommand):
+    help = 'Stream books (and their copies) from a CSV or JSON Lines file into the catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for standard input.")
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Input format (default: guessed from the file extension).')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Input rows imported per transaction (default: 5000).')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per bulk_create INSERT (default: 1000).')
+        parser.add_argument('--status', default='a', choices=sorted(STATUSES),
+                            help="Status of imported copies without a status column (default: 'a').")
+        parser.add_argument('--imprint', default='', help='Imprint of imported copies without an imprint column.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['path'] == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(options['path'], newline='', encoding='utf-8')
+            except OSError as e:
+                raise CommandError(e)
+
+        self.options = options
+        self.genres = NameLookup(Genre)
+        self.languages = NameLookup(Language)
+        self.authors = AuthorLookup()
+        self.totals = {'rows': 0, 'books': 0, 'copies': 0, 'duplicates': 0, 'invalid': 0}
+
+        start = time.perf_counter()
+        with stream:
+            rows = read_rows(stream, file_format)
+            while chunk := list(islice(rows, options['chunk_size'])):
+                with transaction.atomic():
+                    self.import_chunk(chunk)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{self.totals['rows']} rows, {self.totals['books']} books, {self.totals['copies']} copies "
+                    f"({self.totals['rows'] / elapsed:.0f} rows/s)"
+                )
+        invalidate_index_counts()
+        # Bulk writes send no signals: drop every cached catalog page
+        tagcache.invalidate('catalog')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.totals['books']} books and {self.totals['copies']} copies in "
+            f"{time.perf_counter() - start:.1f}s; created {self.authors.created} authors, "
+            f"{self.genres.created} genres, {self.languages.created} languages; skipped "
+            f"{self.totals['duplicates']} duplicate and {self.totals['invalid']} invalid rows."
+        ))
+
+    def import_chunk(self, chunk):
+        batch_size = self.options['batch_size']
+        self.totals['rows'] += len(chunk)
+
+        # Drop rows without a title/ISBN and ISBNs seen earlier in the chunk or already stored
+        rows, isbns = [], set()
+        for row in chunk:
+            isbn, title = value(row, 'isbn'), value(row, 'title')
+            copies = value(row, 'copies') or '0'
+            if not isbn or not title or len(isbn) > Book._meta.get_field('isbn').max_length or not copies.isdigit():
+                self.totals['invalid'] += 1
+            elif isbn in isbns:
+                self.totals['duplicates'] += 1
+            else:
+                isbns.add(isbn)
+                rows.append(row)
+        existing = set(Book.objects.filter(isbn__in=isbns).values_list('isbn', flat=True))
+        self.totals['duplicates'] += len(existing)
+        rows = [row for row in rows if value(row, 'isbn') not in existing]
+        if not rows:
+            return
+
+        self.genres.resolve(name for row in rows for name in split_genres(row.get('genres')))
+        self.languages.resolve(value(row, 'language') for row in rows)
+        new_authors = self.authors.resolve(author_names(row) for row in rows)
+
+        books = Book.objects.bulk_create([
+            Book(
+                title=value(row, 'title'),
+                summary=value(row, 'summary'),
+                isbn=value(row, 'isbn'),
+                author_id=self.authors.get(*author_names(row)),
+                language_id=self.languages.ids.get(value(row, 'language').lower()),
+            )
+            for row in rows
+        ], batch_size=batch_size)
+
+        Book.genre.through.objects.bulk_create([
+            Book.genre.through(book_id=book.pk, genre_id=genre_id)
+            for book, row in zip(books, rows)
+            for genre_id in {self.genres[name] for name in split_genres(row.get('genres'))}
+        ], batch_size=batch_size)
+
+        copies = []
+        for book, row in zip(books, rows):
+            status = value(row, 'status') or self.options['status']
+            if status not in STATUSES:
+                status = self.options['status']
+            imprint = value(row, 'imprint') or self.options['imprint']
+            copies += [BookInstance(book_id=book.pk, imprint=imprint, status=status)
+                       for _ in range(int(value(row, 'copies') or 0))]
+        BookInstance.objects.bulk_create(copies, batch_size=batch_size)
+
+        # bulk_create sends no signals, so update the counters and search index here
+        counters.record_new_books(copies)
+        search.index(search.BOOK_KIND, [book.pk for book in books])
+        search.index(search.AUTHOR_KIND, new_authors)
+
+        self.totals['books'] += len(books)
+        self.totals['copies'] += len(copies)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for books and authors.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild (default: default).')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not search.is_supported(connection):
+            self.stdout.write(self.style.WARNING(
+                f'Full-text search is not available on {connection.vendor}; searches use icontains instead.'))
+            return
+        with transaction.atomic(using=options['database']):
+            search.create_index(connection)
+            indexed = search.rebuild(connection)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} book(s) and author(s).'))
@@ -0,0 +1,90 @@
+import datetime
+import time
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError
+from django.template.loader import render_to_string
+
+from catalog.models import BookInstance, OverdueNotice
+
+
+class Command(BaseCommand):
+    help = 'Email each borrower one digest of their overdue loans, at most once a day.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Loans fetched from the database at a time (default: 2000).')
+        parser.add_argument('--rate', type=float, default=5,
+                            help='Maximum emails sent per second; 0 for no limit (default: 5).')
+        parser.add_argument('--limit', type=int, help='Stop after sending this many emails.')
+        parser.add_argument('--from-email', default=settings.DEFAULT_FROM_EMAIL)
+        parser.add_argument('--dry-run', action='store_true', help='Report the digests without sending them.')
+
+    def overdue_loans(self, today):
+        """Overdue loans in borrower order, skipping borrowers already notified today."""
+        notified = OverdueNotice.objects.filter(sent_on=today).values('borrower')
+        return (
+            BookInstance.objects.filter(status='o', due_back__lt=today, borrower__isnull=False)
+            .exclude(borrower__in=notified)
+            .select_related('book', 'borrower')
+            .only('due_back', 'borrower', 'book__title', 'borrower__username', 'borrower__email',
+                  'borrower__first_name', 'borrower__last_name')
+            .order_by('borrower', 'due_back')
+        )
+
+    def handle(self, *args, **options):
+        today = datetime.date.today()
+        interval = 1 / options['rate'] if options['rate'] > 0 else 0
+        sent = skipped = 0
+        next_send = time.monotonic()
+
+        loans = self.overdue_loans(today).iterator(chunk_size=options['chunk_size'])
+        # One connection for the whole run; EmailMessage.send() would open one per message
+        with get_connection() as connection:
+            for _, borrower_loans in groupby(loans, key=lambda loan: loan.borrower_id):
+                if options['limit'] is not None and sent >= options['limit']:
+                    break
+                borrower_loans = list(borrower_loans)
+                borrower = borrower_loans[0].borrower
+                if not borrower.email:
+                    skipped += 1
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(f'{borrower.email}: {len(borrower_loans)} overdue')
+                    sent += 1
+                    continue
+
+                # Record the notice first: if it was already sent (say, by a concurrent run)
+                # the unique constraint stops a second email.
+                try:
+                    notice = OverdueNotice.objects.create(borrower=borrower, sent_on=today,
+                                                          loans=len(borrower_loans))
+                except IntegrityError:
+                    continue
+
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_send = max(next_send, time.monotonic()) + interval
+
+                message = EmailMessage(
+                    subject='Overdue library books',
+                    body=render_to_string('overdue_notice_email.txt', {'borrower': borrower, 'loans': borrower_loans}),
+                    from_email=options['from_email'],
+                    to=[borrower.email],
+                    connection=connection,
+                )
+                try:
+                    message.send()
+                except Exception:
+                    # Let the next run retry this borrower
+                    notice.delete()
+                    raise
+                sent += 1
+
+        action = 'Would send' if options['dry_run'] else 'Sent'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {sent} overdue notices; skipped {skipped} borrowers without an email address.'))
@@ -0,0 +1,101 @@
+# Generated by Django 5.0.3 on 2026-10-18 02:47
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    """Fill the status counters from the copies that already exist."""
+    BookInstance = apps.get_model("catalog", "BookInstance")
+    BookInstanceCounter = apps.get_model("catalog", "BookInstanceCounter")
+
+    per_book = (
+        BookInstance.objects.filter(book__isnull=False)
+        .values_list("book_id", "status")
+        .annotate(n=Count("pk"))
+        .order_by()
+    )
+    overall = BookInstance.objects.values_list("status").annotate(n=Count("pk")).order_by()
+
+    BookInstanceCounter.objects.bulk_create(
+        [BookInstanceCounter(book_id=book_id, status=status, count=n) for book_id, status, n in per_book]
+        + [BookInstanceCounter(book_id=None, status=status, count=n) for status, n in overall]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalog", "0005_author_catalog_author_date_of_death_gt_date_of_birth"),
+    ]
+
+    operations = [
+        # Bring the migration state in line with models.py before adding the counters.
+        migrations.AlterModelOptions(
+            name="book",
+            options={"ordering": ["title"]},
+        ),
+        migrations.RemoveConstraint(
+            model_name="author",
+            name="catalog_author_date_of_death_gt_date_of_birth",
+        ),
+        migrations.AlterField(
+            model_name="author",
+            name="date_of_death",
+            field=models.DateField(blank=True, null=True, verbose_name="died"),
+        ),
+        migrations.AddConstraint(
+            model_name="author",
+            constraint=models.CheckConstraint(
+                check=models.Q(("date_of_death__gt", models.F("date_of_birth"))),
+                name="catalog_author_date_of_death_gt_date_of_birth",
+                violation_error_message="Date of birth cannot be greater than date of death",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="language",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("name"),
+                name="language_name_case_insensitive_unique",
+                violation_error_message="Language already exists (case insensitive match)",
+            ),
+        ),
+        migrations.CreateModel(
+            name="BookInstanceCounter",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "status",
+                    models.CharField(
+                        blank=True,
+                        choices=[("m", "Maintenance"), ("o", "On loan"), ("a", "Available"), ("r", "Reserved")],
+                        max_length=1,
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="catalog.book",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("book", "status"), name="bookinstance_counter_book_status_unique"
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(("book__isnull", True)),
+                        fields=("status",),
+                        name="bookinstance_counter_global_status_unique",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
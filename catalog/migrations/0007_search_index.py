@@ -0,0 +1,80 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:10
+
+from django.db import migrations
+
+# The schema and backfill as of this migration, written out rather than imported from
+# catalog.search so that later changes to that module do not change this migration.
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_search_index USING fts5("
+    "title, body, names, genres, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+]
+
+POSTGRESQL_CREATE = [
+    "CREATE TABLE IF NOT EXISTS catalog_search_index ("
+    "kind varchar(10) NOT NULL, object_id bigint NOT NULL, title text NOT NULL, "
+    "document tsvector NOT NULL, PRIMARY KEY (kind, object_id))",
+    "CREATE INDEX IF NOT EXISTS catalog_search_index_document ON catalog_search_index USING GIN (document)",
+]
+
+# Books and authors as (kind, object_id, title, body, names, genres) rows
+BOOKS_SQL = (
+    "SELECT 'book' AS kind, b.id AS object_id, b.title AS title, b.summary AS body, "
+    "COALESCE(a.first_name || ' ' || a.last_name, '') AS names, "
+    "COALESCE((SELECT {concat} FROM catalog_book_genre bg "
+    "JOIN catalog_genre g ON g.id = bg.genre_id WHERE bg.book_id = b.id), '') AS genres "
+    "FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id"
+)
+
+AUTHORS_SQL = (
+    "SELECT 'author' AS kind, a.id AS object_id, a.last_name || ', ' || a.first_name AS title, "
+    "'' AS body, a.first_name || ' ' || a.last_name AS names, '' AS genres "
+    "FROM catalog_author a"
+)
+
+# On SQLite the rowid encodes the object: id * 2 for books, id * 2 + 1 for authors
+SQLITE_FILL = [
+    "INSERT INTO catalog_search_index (rowid, title, body, names, genres) "
+    "SELECT object_id * 2, title, body, names, genres FROM (%s) AS source"
+    % BOOKS_SQL.format(concat="group_concat(g.name, ' ')"),
+    "INSERT INTO catalog_search_index (rowid, title, body, names, genres) "
+    "SELECT object_id * 2 + 1, title, body, names, genres FROM (%s) AS source" % AUTHORS_SQL,
+]
+
+POSTGRESQL_FILL = [
+    "INSERT INTO catalog_search_index (kind, object_id, title, document) "
+    "SELECT kind, object_id, title, "
+    "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', names), 'B') || "
+    "setweight(to_tsvector('simple', genres), 'C') || setweight(to_tsvector('simple', body), 'D') "
+    "FROM (%s) AS source" % source
+    for source in (BOOKS_SQL.format(concat="string_agg(g.name, ' ')"), AUTHORS_SQL)
+]
+
+
+def create_search_index(apps, schema_editor):
+    """Create the full-text search table (FTS5 or tsvector) and fill it from the catalog."""
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        statements = SQLITE_CREATE + SQLITE_FILL
+    elif vendor == "postgresql":
+        statements = POSTGRESQL_CREATE + POSTGRESQL_FILL
+    else:
+        return  # Other databases search with icontains
+    for sql in statements:
+        schema_editor.execute(sql, params=None)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE IF EXISTS catalog_search_index", params=None)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalog", "0006_bookinstancecounter"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0007_search_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="author",
+            index=models.Index(fields=["last_name", "first_name", "id"], name="catalog_author_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(fields=["title", "id"], name="catalog_book_title_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(fields=["borrower", "status", "due_back"], name="catalog_bi_borrower_loans_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(condition=models.Q(("status", "o")), fields=["due_back"], name="catalog_bi_on_loan_due_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(fields=["status", "due_back", "-id"], name="catalog_bi_status_due_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(fields=["due_back", "-id"], name="catalog_bi_due_back_idx"),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0008_loan_and_ordering_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OverdueNotice",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("sent_on", models.DateField()),
+                ("loans", models.PositiveIntegerField(help_text="Number of overdue loans listed in the notice")),
+                ("borrower", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="overduenotice",
+            constraint=models.UniqueConstraint(fields=("borrower", "sent_on"), name="overdue_notice_borrower_sent_on_unique"),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.3 on 2026-10-18 03:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_copy_counts(apps, schema_editor):
+    """Fill the copy counts of the books that already exist from their copies."""
+    Book = apps.get_model("catalog", "Book")
+    BookInstance = apps.get_model("catalog", "BookInstance")
+
+    copies = BookInstance.objects.filter(book=OuterRef("pk")).order_by().values("book")
+    Book.objects.update(
+        total_copies=Coalesce(Subquery(copies.annotate(n=Count("pk")).values("n")), Value(0)),
+        available_copies=Coalesce(Subquery(copies.filter(status="a").annotate(n=Count("pk")).values("n")), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0010_hold"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="available_copies",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="total_copies",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(fields=["-available_copies", "title", "id"], name="catalog_book_available_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                condition=models.Q(("available_copies__gt", 0)), fields=["title", "id"], name="catalog_book_available_now_idx"
+            ),
+        ),
+        migrations.RunPython(populate_copy_counts, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse  # Used in get_absolute_url() to get URL for specified ID
 from django.db.models import UniqueConstraint  # Constrains fields to unique values
 from django.db.models.functions import Lower  # Returns lower cased value of field
@@ -77,9 +77,42 @@ class Book(models.Model):
     genre = models.ManyToManyField(
         Genre, help_text="Select a genre for this book")
     language = models.ForeignKey(Language, on_delete=models.RESTRICT, null=True)
+    # Copies of the book, kept in step with BookInstance by the counters module so
+    # the book list can filter and sort on availability without counting copies.
+    available_copies = models.IntegerField(default=0, editable=False)
+    total_copies = models.IntegerField(default=0, editable=False)
+    # Moves whenever the book's detail page may change (see catalog/conditional.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    COPY_COUNT_FIELDS = ('available_copies', 'total_copies')
 
     class Meta:
         ordering = ['title']
+        indexes = [
+            # Default ordering, and the (title, id) keyset ordering of the book list
+            models.Index(fields=['title', 'id'], name='catalog_book_title_idx'),
+            # The book list sorted by availability, and filtered to books available now
+            models.Index(fields=['-available_copies', 'title', 'id'], name='catalog_book_available_idx'),
+            models.Index(fields=['title', 'id'], condition=models.Q(available_copies__gt=0),
+                         name='catalog_book_available_now_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded author so saves can tell which author lost the book."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_author_id = dict(zip(field_names, values)).get('author_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The copy counts are changed with UPDATE ... SET n = n + 1 as copies come and go;
+        # saving a book loaded earlier must not write its stale counts back.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COPY_COUNT_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         """String for representing the Model object."""
@@ -119,15 +152,41 @@ class BookInstance(models.Model):
         default='m',
         help_text='Book availability',
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['due_back']
         permissions = (('can_mark_returned', 'Set book as returned'),)
+        indexes = [
+            # A borrower's loans, soonest due first (LoanedBooksByUserListView)
+            models.Index(fields=['borrower', 'status', 'due_back'], name='catalog_bi_borrower_loans_idx'),
+            # Every loan, soonest due first (AllBorrowedBooksListView)
+            models.Index(fields=['due_back'], condition=models.Q(status='o'), name='catalog_bi_on_loan_due_idx'),
+            # The admin changelist filters on status and sorts by due_back (then -pk)
+            models.Index(fields=['status', 'due_back', '-id'], name='catalog_bi_status_due_idx'),
+            models.Index(fields=['due_back', '-id'], name='catalog_bi_due_back_idx'),
+        ]
 
     def __str__(self):
         """String for representing the Model object."""
         return f'{self.id} ({self.book.title})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded book and status so saves can tell what changed."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keep the status counters in the same transaction as the copy itself.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     @property
     def is_overdue(self):
         """Determines if the book is overdue based on due date and current date."""
@@ -140,9 +199,14 @@ class Author(models.Model):
     last_name = models.CharField(max_length=100)
     date_of_birth = models.DateField(null=True, blank=True)
     date_of_death = models.DateField('died', null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['last_name', 'first_name']
+        indexes = [
+            # Default ordering, and the (last_name, first_name, id) keyset ordering of the author list
+            models.Index(fields=['last_name', 'first_name', 'id'], name='catalog_author_name_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 name="%(app_label)s_%(class)s_date_of_death_gt_date_of_birth",
@@ -158,3 +222,71 @@ class Author(models.Model):
     def __str__(self):
         """String for representing the Model object."""
         return f'{self.last_name}, {self.first_name}'
+
+
+class BookInstanceCounter(models.Model):
+    """Model holding the number of copies in each loan status, per book and globally (book is empty)."""
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, null=True, blank=True)
+    status = models.CharField(max_length=1, choices=BookInstance.LOAN_STATUS, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['book', 'status'],
+                name='bookinstance_counter_book_status_unique',
+            ),
+            UniqueConstraint(
+                fields=['status'],
+                condition=models.Q(book__isnull=True),
+                name='bookinstance_counter_global_status_unique',
+            ),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f'{self.book or "All books"} - {self.get_status_display()}: {self.count}'
+
+
+class Hold(models.Model):
+    """Model representing a patron waiting in a book's reservation queue.
+
+    Positions in a book's queue are contiguous: the head has the lowest one, new holds
+    take the highest plus one, and cancelling a hold moves the holds behind it up. A
+    patron's place in the queue is therefore their position minus the head's, plus one.
+    """
+    book = models.ForeignKey('Book', on_delete=models.CASCADE)
+    patron = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    position = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['book_id', 'position']
+        constraints = [
+            # Also the index used to find the head of the queue and a patron's place in it
+            UniqueConstraint(fields=['book', 'position'], name='hold_book_position_unique'),
+            UniqueConstraint(fields=['book', 'patron'], name='hold_book_patron_unique'),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f'{self.patron} waiting for {self.book} (#{self.position})'
+
+
+class OverdueNotice(models.Model):
+    """Model recording an overdue-loans digest emailed to a borrower, so each is sent once per day."""
+    borrower = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    sent_on = models.DateField()
+    loans = models.PositiveIntegerField(help_text='Number of overdue loans listed in the notice')
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['borrower', 'sent_on'],
+                name='overdue_notice_borrower_sent_on_unique',
+            ),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f'{self.borrower} ({self.sent_on}): {self.loans} overdue'
@@ -0,0 +1,181 @@
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+
+from . import tagcache
+
+
+class KeysetPage:
+    """A page of results fetched by cursor rather than by OFFSET, with no total count."""
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CachedCountMixin:
+    """Read the paginator's COUNT(*) of a ListView from the tag cache.
+
+    ``count_tags`` name what changes the count (see tagcache); the count is cached
+    per query, so each filter has its own.
+    """
+    count_tags = ('catalog',)
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        # Paginator.count is a cached_property: setting it skips the query
+        paginator.count = tagcache.get_or_set(f'count:{queryset.query}', self.count_tags, queryset.count)
+        return paginator
+
+    async def aget_paginator(self, queryset, per_page, **kwargs):
+        paginator = self.paginator_class(queryset, per_page, **kwargs)
+        paginator.count = await tagcache.aget_or_set(f'count:{queryset.query}', self.count_tags, queryset.acount)
+        return paginator
+
+
+class KeysetPaginationMixin:
+    """Add cursor (keyset) pagination to a ListView.
+
+    The page is found with a ``WHERE (keys) > (last seen keys)`` filter on the
+    ``keyset_ordering`` fields, which must end in a unique field, so deep pages
+    cost the same as the first one and no ``COUNT(*)`` is run. Offset pagination
+    stays the default; keyset mode is used when ``pagination_mode`` is 'keyset'
+    (see the CATALOG_PAGINATION_MODE setting) or the request carries a cursor.
+    """
+    keyset_ordering = ('id',)
+    cursor_kwarg = 'cursor'
+    cursor_salt = 'catalog.pagination'
+    pagination_mode = getattr(settings, 'CATALOG_PAGINATION_MODE', 'offset')
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # The other query parameters (filters, sorting) that the page links must keep
+        params = self.request.GET.copy()
+        params.pop(self.page_kwarg, None)
+        params.pop(self.cursor_kwarg, None)
+        context['page_params'] = params.urlencode()
+        return context
+
+    def use_keyset_pagination(self):
+        return self.pagination_mode == 'keyset' or self.cursor_kwarg in self.request.GET
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        queryset, values, backwards = self.keyset_queryset(queryset)
+        return self.keyset_page(list(queryset[:page_size + 1]), page_size, values, backwards)
+
+    async def aget_paginator(self, queryset, per_page, **kwargs):
+        paginator = self.paginator_class(queryset, per_page, **kwargs)
+        paginator.count = await queryset.acount()
+        return paginator
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """paginate_queryset() for async views, reading the page with the async ORM."""
+        if self.use_keyset_pagination():
+            queryset, values, backwards = self.keyset_queryset(queryset)
+            object_list = [obj async for obj in queryset[:page_size + 1]]
+            return self.keyset_page(object_list, page_size, values, backwards)
+
+        # MultipleObjectMixin.paginate_queryset(), with the count and the page awaited
+        paginator = await self.aget_paginator(queryset, page_size, orphans=self.get_paginate_orphans(),
+                                              allow_empty_first_page=self.get_allow_empty())
+        page = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        try:
+            page_number = int(page)
+        except ValueError:
+            if page != 'last':
+                raise Http404('Page is not “last”, nor can it be converted to an int.')
+            page_number = paginator.num_pages
+        try:
+            page = paginator.page(page_number)
+        except InvalidPage as e:
+            raise Http404(f'Invalid page ({page_number}): {e}')
+        page.object_list = [obj async for obj in page.object_list]
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def keyset_queryset(self, queryset):
+        """Return the queryset filtered and ordered from the request's cursor, its values and direction."""
+        ordering = self.get_keyset_ordering()
+        direction, values = self.decode_cursor(self.request.GET.get(self.cursor_kwarg))
+        backwards = direction == 'previous'
+
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, values, backwards))
+        queryset = queryset.order_by(*(self.reverse_key(key) for key in ordering) if backwards else ordering)
+        return queryset, values, backwards
+
+    def keyset_page(self, object_list, page_size, values, backwards):
+        """Build the page from up to page_size + 1 objects read from keyset_queryset()."""
+        ordering = self.get_keyset_ordering()
+        has_more = len(object_list) > page_size
+        object_list = object_list[:page_size]
+        if backwards:
+            object_list.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        page = KeysetPage(object_list)
+        if object_list and has_next:
+            page.next_cursor = self.encode_cursor('next', object_list[-1], ordering)
+        if object_list and has_previous:
+            page.previous_cursor = self.encode_cursor('previous', object_list[0], ordering)
+        return None, page, object_list, page.has_other_pages()
+
+    @staticmethod
+    def reverse_key(key):
+        return key[1:] if key.startswith('-') else f'-{key}'
+
+    @staticmethod
+    def keyset_filter(ordering, values, backwards=False):
+        """Build the lexicographic "comes after these values" filter for the ordering."""
+        condition = Q()
+        for position, key in enumerate(ordering):
+            descending = key.startswith('-')
+            name = key.lstrip('-')
+            lookup = 'lt' if descending != backwards else 'gt'
+            equal = {ordering[i].lstrip('-'): values[i] for i in range(position)}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[position]})
+        # The redundant bound on the first key lets the database walk one range of the
+        # ordering index instead of merging an index lookup per OR branch and sorting.
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') != backwards else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & condition
+
+    def encode_cursor(self, direction, obj, ordering):
+        values = [getattr(obj, key.lstrip('-')) for key in ordering]
+        return signing.dumps([direction, values], salt=self.cursor_salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return 'next', None
+        try:
+            direction, values = signing.loads(cursor, salt=self.cursor_salt)
+        except (signing.BadSignature, ValueError, TypeError):
+            raise Http404('Invalid cursor.')
+        if direction not in ('next', 'previous') or len(values) != len(self.get_keyset_ordering()):
+            raise Http404('Invalid cursor.')
+        return direction, values
@@ -0,0 +1,118 @@
+"""Send reads to read replicas and writes to the primary database.
+
+The replicas are the database aliases in CATALOG_READ_REPLICAS; each read of a
+catalog model picks one at random. Sessions, users, permissions and the other
+apps' tables always use the primary: a session or permission written a moment ago
+must be there on the next request. Replicas lag behind the primary, so catalog
+reads go to the primary instead:
+
+- inside a transaction on the primary, which must see its own uncommitted rows;
+- for the rest of a request that has written, and for any unsafe (POST...) request;
+- for CATALOG_REPLICA_LAG seconds after a client's request wrote, through a short
+  lived cookie, so the page a form redirects to shows the change.
+
+Outside requests (management commands, shells), reads stick to the primary once
+anything has been written.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICAS = getattr(settings, 'CATALOG_READ_REPLICAS', [])
+
+REPLICA_LAG = getattr(settings, 'CATALOG_REPLICA_LAG', 5)
+
+COOKIE_NAME = 'catalog_primary'
+
+PRIMARY = DEFAULT_DB_ALIAS
+
+# Only these apps' models are read from the replicas
+REPLICATED_APPS = {'catalog'}
+
+# Whether reads must go to the primary, and whether this request has written
+_pinned = contextvars.ContextVar('catalog_pinned', default=False)
+_wrote = contextvars.ContextVar('catalog_wrote', default=False)
+
+
+def replication_lag():
+    """Seconds a read may still return rows older than the last write (0 without replicas)."""
+    return REPLICA_LAG if REPLICAS else 0
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not REPLICAS or model._meta.app_label not in REPLICATED_APPS:
+            return None
+        if _pinned.get() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        # Other apps are never read from a replica, so their writes (a session saved
+        # on every request...) need not pin the catalog reads
+        if not REPLICAS or model._meta.app_label not in REPLICATED_APPS:
+            return None
+        _pinned.set(True)
+        _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        databases = {PRIMARY, *REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary, through replication
+        if db in REPLICAS:
+            return False
+        return None
+
+
+class PrimaryPinMiddleware:
+    """Keep a client's reads on the primary while its writes may not have reached the replicas."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not REPLICAS:
+            raise MiddlewareNotUsed
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self.start(request)
+        try:
+            return self.finish(self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    async def __acall__(self, request):
+        # Context variables set here are seen by the view and the sync code it calls
+        tokens = self.start(request)
+        try:
+            return self.finish(await self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    def start(self, request):
+        pinned = COOKIE_NAME in request.COOKIES or request.method not in ('GET', 'HEAD', 'OPTIONS')
+        return _pinned.set(pinned), _wrote.set(False)
+
+    def finish(self, response):
+        if _wrote.get():
+            response.set_cookie(COOKIE_NAME, '1', max_age=REPLICA_LAG, httponly=True, samesite='Lax')
+        return response
+
+    def reset(self, tokens):
+        pinned, wrote = tokens
+        _pinned.reset(pinned)
+        _wrote.reset(wrote)
@@ -0,0 +1,205 @@
+"""Full-text search over books and authors.
+
+Books and authors are denormalized into ``catalog_search_index``: an FTS5 virtual
+table on SQLite, or a table with a GIN-indexed tsvector on PostgreSQL. Model signals
+keep the rows in step with the catalog (see signals.py) and the rebuild_search_index
+command recreates them from scratch. Other databases fall back to ``icontains``.
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db.models import Q
+
+from .models import Author, Book, Genre
+
+SEARCH_TABLE = 'catalog_search_index'
+
+# Relative weight of each indexed column: title, summary, author names, genre names.
+SQLITE_BM25_WEIGHTS = '10.0, 1.0, 5.0, 2.0'
+
+BOOK_KIND = 'book'
+AUTHOR_KIND = 'author'
+
+INDEX_CHUNK_SIZE = 500
+
+# On SQLite the FTS5 rowid encodes the object, so single rows are found through the rowid b-tree.
+SQLITE_ROWID_OFFSET = {BOOK_KIND: 0, AUTHOR_KIND: 1}
+
+
+def is_supported(connection=default_connection):
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def create_index(connection=default_connection):
+    """Create the search table for the connection's database."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                f"title, body, names, genres, "
+                f"tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+                f"kind varchar(10) NOT NULL, object_id bigint NOT NULL, title text NOT NULL, "
+                f"document tsvector NOT NULL, PRIMARY KEY (kind, object_id))"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)"
+            )
+
+
+def drop_index(connection=default_connection):
+    if is_supported(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+def _source_sql(kind, connection, ids=None):
+    """SELECT producing (kind, object_id, title, body, names, genres) rows for books or authors."""
+    concat = 'group_concat(g.name, \' \')' if connection.vendor == 'sqlite' else 'string_agg(g.name, \' \')'
+    if kind == BOOK_KIND:
+        sql = (
+            f"SELECT '{BOOK_KIND}' AS kind, b.id AS object_id, b.title AS title, b.summary AS body, "
+            f"COALESCE(a.first_name || ' ' || a.last_name, '') AS names, "
+            f"COALESCE((SELECT {concat} FROM {Book.genre.through._meta.db_table} bg "
+            f"JOIN {Genre._meta.db_table} g ON g.id = bg.genre_id WHERE bg.book_id = b.id), '') AS genres "
+            f"FROM {Book._meta.db_table} b LEFT JOIN {Author._meta.db_table} a ON a.id = b.author_id"
+        )
+        alias = 'b'
+    else:
+        sql = (
+            f"SELECT '{AUTHOR_KIND}' AS kind, a.id AS object_id, a.last_name || ', ' || a.first_name AS title, "
+            f"'' AS body, a.first_name || ' ' || a.last_name AS names, '' AS genres "
+            f"FROM {Author._meta.db_table} a"
+        )
+        alias = 'a'
+    params = []
+    if ids is not None:
+        sql += f" WHERE {alias}.id IN ({', '.join(['%s'] * len(ids))})"
+        params = list(ids)
+    return sql, params
+
+
+def _insert(kind, connection, ids=None):
+    """Write the index rows of books or authors, replacing any they already have.
+
+    An upsert rather than a delete and insert, so two saves of the same object
+    indexing it at once cannot both insert its row.
+    """
+    sql, params = _source_sql(kind, connection, ids)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # FTS5 deletes the replaced row's terms too
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, title, body, names, genres) "
+                f"SELECT object_id * 2 + %s, title, body, names, genres "
+                f"FROM ({sql}) AS source",
+                [SQLITE_ROWID_OFFSET[kind], *params],
+            )
+        else:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (kind, object_id, title, document) "
+                f"SELECT kind, object_id, title, "
+                f"setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', names), 'B') || "
+                f"setweight(to_tsvector('simple', genres), 'C') || setweight(to_tsvector('simple', body), 'D') "
+                f"FROM ({sql}) AS source "
+                f"ON CONFLICT (kind, object_id) DO UPDATE SET title = EXCLUDED.title, document = EXCLUDED.document",
+                params,
+            )
+
+
+def remove(kind, ids, connection=default_connection):
+    """Delete the index rows of the given books or authors."""
+    ids = list(ids)
+    if not ids or not is_supported(connection):
+        return
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            rowids = [object_id * 2 + SQLITE_ROWID_OFFSET[kind] for object_id in ids]
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", rowids)
+        else:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE kind = %s AND object_id IN ({placeholders})", [kind, *ids])
+
+
+def index(kind, ids, connection=default_connection):
+    """(Re)index the given books or authors from their current database rows.
+
+    Deleted objects are taken out of the index by remove().
+    """
+    ids = list(ids)
+    if not is_supported(connection):
+        return
+    # Chunk so a popular author or genre never exceeds the database's parameter limit
+    for start in range(0, len(ids), INDEX_CHUNK_SIZE):
+        _insert(kind, connection, ids[start:start + INDEX_CHUNK_SIZE])
+
+
+def rebuild(connection=default_connection):
+    """Empty the index and refill it from the catalog tables; returns the number of rows indexed."""
+    if not is_supported(connection):
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    for kind in (BOOK_KIND, AUTHOR_KIND):
+        _insert(kind, connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _ranked_ids(terms, limit, connection):
+    """Return (kind, object_id) pairs best match first."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # Every term must match, each as a prefix so partial words still find results
+            match = ' '.join(f'"{term}"*' for term in terms)
+            cursor.execute(
+                f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                f"ORDER BY bm25({SEARCH_TABLE}, {SQLITE_BM25_WEIGHTS}) LIMIT %s",
+                [match, limit],
+            )
+            return [(BOOK_KIND if rowid % 2 == 0 else AUTHOR_KIND, rowid // 2) for rowid, in cursor.fetchall()]
+        else:
+            tsquery = ' & '.join(f'{term}:*' for term in terms)
+            cursor.execute(
+                f"SELECT kind, object_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) AS query "
+                f"WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT %s",
+                [tsquery, limit],
+            )
+        return cursor.fetchall()
+
+
+def search(query, limit=50, connection=default_connection):
+    """Return the books and authors matching query, best match first."""
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if not is_supported(connection):
+        condition = Q()
+        for term in terms:
+            condition &= Q(title__icontains=term) | Q(summary__icontains=term) | Q(genre__name__icontains=term)
+        books = Book.objects.filter(condition).select_related('author').distinct()[:limit]
+        for book in books:
+            book.search_kind = BOOK_KIND
+        return list(books)
+
+    ranked = _ranked_ids(terms, limit, connection)
+    books = Book.objects.select_related('author').in_bulk(
+        [object_id for kind, object_id in ranked if kind == BOOK_KIND])
+    authors = Author.objects.in_bulk([object_id for kind, object_id in ranked if kind == AUTHOR_KIND])
+    results = []
+    for kind, object_id in ranked:
+        obj = (books if kind == BOOK_KIND else authors).get(object_id)
+        if obj is not None:
+            obj.search_kind = kind
+            results.append(obj)
+    return results
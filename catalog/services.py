@@ -0,0 +1,191 @@
+"""Checkout, return and renewal of book copies, and the reservation queue.
+
+Each operation is one conditional UPDATE (``... WHERE id = %s AND status = %s``), so
+when two requests race for the same copy exactly one of them changes the row and the
+other sees zero rows updated. Nothing is read and then saved back, so a concurrent
+change to another field of the copy is never overwritten. The updates bypass the
+model signals, so the status counters are adjusted here, in the same transaction.
+
+When a copy is returned it goes to the head of the book's hold queue, if anyone is
+waiting, as a reserved copy that only that patron can check out. A queue is read
+and then rewritten, so the changes to one book's queue take a row lock on the book
+first and run one at a time.
+"""
+import datetime
+import random
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
+
+from . import counters, tagcache
+from .forms import validate_renewal_date
+from .models import Book, BookInstance, Hold
+from .stats import invalidate_index_counts
+
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+
+# How long a copy stays reserved for the patron at the head of the queue
+PICKUP_PERIOD = datetime.timedelta(weeks=1)
+
+# How many available copies to try per query when checking out a book
+CHECKOUT_CANDIDATES = 10
+
+
+class LoanError(Exception):
+    """A checkout, return or renewal could not be made."""
+
+
+class NoCopyAvailable(LoanError):
+    pass
+
+
+class NotOnLoan(LoanError):
+    pass
+
+
+class NotQueued(LoanError):
+    pass
+
+
+def _change_status(book_id, old_status, new_status):
+    counters.record_change((book_id, old_status), (book_id, new_status))
+    transaction.on_commit(invalidate_index_counts)
+    tagcache.invalidate('books', f'bookinstance-of:{book_id}')
+
+
+def _lock_queue(book_id):
+    """Wait for other changes to the book's hold queue; call inside the transaction making one."""
+    Book.objects.select_for_update().only('pk').get(pk=book_id)
+
+
+def checkout(book, borrower, due_back=None):
+    """Lend any available copy of book to borrower and return that copy.
+
+    Raises NoCopyAvailable once every copy of the book is taken.
+    """
+    due_back = due_back or datetime.date.today() + LOAN_PERIOD
+
+    # A copy reserved for this borrower comes first
+    reserved = BookInstance.objects.filter(book=book, status__exact='r', borrower=borrower)
+    for pk in reserved.order_by().values_list('pk', flat=True)[:1]:
+        with transaction.atomic():
+            if reserved.filter(pk=pk).update(status='o', due_back=due_back, updated_at=timezone.now()):
+                _change_status(book.pk, 'r', 'o')
+                return BookInstance.objects.select_related('book').get(pk=pk)
+
+    available = BookInstance.objects.filter(book=book, status__exact='a')
+    while True:
+        candidates = list(available.order_by().values_list('pk', flat=True)[:CHECKOUT_CANDIDATES])
+        if not candidates:
+            raise NoCopyAvailable(f'No copy of {book} is available.')
+        # Concurrent checkouts of the same book spread over its copies instead of
+        # all queueing on the first one
+        random.shuffle(candidates)
+        for pk in candidates:
+            with transaction.atomic():
+                if available.filter(pk=pk).update(status='o', borrower=borrower, due_back=due_back,
+                                                 updated_at=timezone.now()):
+                    _change_status(book.pk, 'a', 'o')
+                    return BookInstance.objects.select_related('book').get(pk=pk)
+        # Every candidate was lent meanwhile; look again
+
+
+def return_copy(copy_id):
+    """Mark a copy on loan as returned, reserving it for the next patron waiting for the book.
+
+    Returns the patron the copy is now reserved for, or None if it is available.
+    """
+    with transaction.atomic():
+        returned = BookInstance.objects.filter(pk=copy_id, status__exact='o').update(
+            status='a', borrower=None, due_back=None, updated_at=timezone.now())
+        if not returned:
+            raise NotOnLoan('This copy is not on loan.')
+        book_id = BookInstance.objects.filter(pk=copy_id).values_list('book_id', flat=True).get()
+        _change_status(book_id, 'o', 'a')
+        return _allocate(copy_id, book_id)
+
+
+def _allocate(copy_id, book_id):
+    """Reserve an available copy for the first eligible patron in the book's queue."""
+    _lock_queue(book_id)
+    while True:
+        # The head of the queue is found through the (book, position) index
+        hold = Hold.objects.filter(book_id=book_id).select_related('patron').order_by('position').first()
+        if hold is None:
+            return None
+        # Removing the head leaves the other positions contiguous
+        hold.delete()
+        if not hold.patron.is_active:
+            continue
+        BookInstance.objects.filter(pk=copy_id, status__exact='a').update(
+            status='r', borrower=hold.patron, due_back=datetime.date.today() + PICKUP_PERIOD,
+            updated_at=timezone.now())
+        _change_status(book_id, 'a', 'r')
+        return hold.patron
+
+
+def renew(copy_id, due_back):
+    """Move the due date of a copy on loan, checked with the usual renewal rules."""
+    validate_renewal_date(due_back)
+    if not BookInstance.objects.filter(pk=copy_id, status__exact='o').update(
+            due_back=due_back, updated_at=timezone.now()):
+        raise NotOnLoan('This copy is not on loan.')
+    book_id = BookInstance.objects.filter(pk=copy_id).values_list('book_id', flat=True).get()
+    tagcache.invalidate(f'bookinstance-of:{book_id}')
+
+
+def place_hold(book, patron):
+    """Add patron to the end of the book's queue and return their place in it."""
+    while True:
+        try:
+            with transaction.atomic():
+                _lock_queue(book.pk)
+                # Checked under the lock: a copy returned meanwhile is either reserved
+                # for someone already queued or seen here as available
+                if BookInstance.objects.filter(book=book, status__exact='a').exists():
+                    raise LoanError(f'A copy of {book} is available: borrow it instead.')
+                last = Hold.objects.filter(book=book).order_by('-position').values_list('position', flat=True).first()
+                Hold.objects.create(book=book, patron=patron, position=(last or 0) + 1)
+                return queue_position(book, patron)
+        except IntegrityError:
+            if Hold.objects.filter(book=book, patron=patron).exists():
+                raise LoanError(f'You are already waiting for {book}.')
+            # Another patron took that position meanwhile; take the next one
+
+
+def queue_position(book, patron):
+    """Return patron's place in the book's queue (1 is next), or None if they are not in it.
+
+    One query over the (book, position) and (book, patron) indexes, whatever the queue length.
+    """
+    head = Hold.objects.filter(book=book).order_by('position').values('position')[:1]
+    return (
+        Hold.objects.filter(book=book, patron=patron)
+        .annotate(place=F('position') - Subquery(head) + 1)
+        .values_list('place', flat=True)
+        .first()
+    )
+
+
+def cancel_hold(book, patron):
+    """Take patron out of the book's queue, closing the gap they leave."""
+    with transaction.atomic():
+        _lock_queue(book.pk)
+        hold = Hold.objects.filter(book=book, patron=patron).first()
+        if hold is None:
+            raise NotQueued(f'You are not waiting for {book}.')
+        hold.delete()
+        queue = Hold.objects.filter(book=book)
+        # Close the gap from whichever end has fewer holds to move: the holds ahead move
+        # back one place, or the holds behind move up one. Each move goes through negative
+        # positions, as a single shifting UPDATE could collide with the unique (book, position).
+        positions = queue.values_list('position', flat=True)
+        head, tail = positions.order_by('position').first(), positions.order_by('-position').first()
+        if head is None or hold.position < head or hold.position > tail:
+            return  # The queue is empty now, or the hold was at one end
+        if hold.position - head < tail - hold.position:
+            queue.filter(position__lt=hold.position).update(position=-(F('position') + 1))
+        else:
+            queue.filter(position__gt=hold.position).update(position=-(F('position') - 1))
+        queue.filter(position__lt=0).update(position=-F('position'))
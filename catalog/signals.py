@@ -0,0 +1,264 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import autocomplete, counters, search, sqlite, tagcache
+from .context_processors import invalidate_sidebars
+from .models import Book, Author, BookInstance, Genre, Language
+from .stats import invalidate_index_counts
+
+User = get_user_model()
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    """Tune each new SQLite connection with the CATALOG_SQLITE_PROFILE PRAGMAs."""
+    sqlite.apply_profile(connection)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def catalog_changed(sender, **kwargs):
+    """Invalidate the cached home page counters whenever a counted model changes."""
+    invalidate_index_counts()
+
+
+def _loaded_key(instance):
+    """Return the (book_id, status) pair the copy had when it was loaded, or None if unknown."""
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        return None
+    return loaded.get('book_id', instance.book_id), loaded.get('status', instance.status)
+
+
+def _copies_changed(*book_ids):
+    tagcache.invalidate('books', *(f'bookinstance-of:{book_id}' for book_id in set(book_ids)))
+
+
+@receiver(post_save, sender=BookInstance)
+def bookinstance_saved(sender, instance, created, **kwargs):
+    """Move the copy between status counters when it is created or its book/status change."""
+    new = (instance.book_id, instance.status)
+    old = None if created else _loaded_key(instance)
+    _copies_changed(new[0], old[0] if old else new[0])
+    if created:
+        counters.record_change(None, new)
+    else:
+        if old is None:
+            # Saved without being loaded first: the previous state is unknown, so leave
+            # the counters alone and let reconcile_counters pick up any drift.
+            return
+        counters.record_change(old, new)
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), 'book_id': new[0], 'status': new[1]}
+
+
+@receiver(post_delete, sender=BookInstance)
+def bookinstance_deleted(sender, instance, **kwargs):
+    """Remove the copy from its status counters."""
+    old = _loaded_key(instance) or (instance.book_id, instance.status)
+    counters.record_change(old, None)
+    _copies_changed(old[0])
+
+
+@receiver(post_save, sender=Book)
+def book_saved_search(sender, instance, **kwargs):
+    """Reindex a book for full-text search."""
+    search.index(search.BOOK_KIND, [instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_search(sender, instance, **kwargs):
+    search.remove(search.BOOK_KIND, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed_search(sender, instance, action, reverse, pk_set, **kwargs):
+    """Reindex the books whose genres were added, removed or cleared."""
+    if reverse and action == 'pre_clear':
+        # The genre is losing all its books; remember which ones before they are gone
+        instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        book_ids = [instance.pk]
+    elif action == 'post_clear':
+        book_ids = getattr(instance, '_search_book_ids', [])
+    else:
+        book_ids = pk_set
+    search.index(search.BOOK_KIND, book_ids)
+
+
+@receiver(post_save, sender=Author)
+def author_saved_search(sender, instance, created, **kwargs):
+    """Reindex an author and, since their name is indexed with them, their books."""
+    search.index(search.AUTHOR_KIND, [instance.pk])
+    if not created:
+        search.index(search.BOOK_KIND, instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def author_deleted_search(sender, instance, **kwargs):
+    search.remove(search.AUTHOR_KIND, [instance.pk])
+
+
+@receiver(post_save, sender=Genre)
+def genre_saved_search(sender, instance, created, **kwargs):
+    """Reindex the books of a renamed genre."""
+    if not created:
+        search.index(search.BOOK_KIND, instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Genre)
+def genre_deleting_search(sender, instance, **kwargs):
+    instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def genre_deleted_search(sender, instance, **kwargs):
+    """Reindex the books that lost the deleted genre."""
+    search.index(search.BOOK_KIND, getattr(instance, '_search_book_ids', []))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def catalog_saved_autocomplete(sender, instance, **kwargs):
+    """Update this process's autocomplete index once the transaction commits."""
+    kind = autocomplete.BOOK_KIND if sender is Book else autocomplete.AUTHOR_KIND
+    transaction.on_commit(partial(autocomplete.update, kind, instance.pk, str(instance)))
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+def catalog_deleted_autocomplete(sender, instance, **kwargs):
+    kind = autocomplete.BOOK_KIND if sender is Book else autocomplete.AUTHOR_KIND
+    transaction.on_commit(partial(autocomplete.remove, kind, instance.pk))
+
+
+def _invalidate_sidebars_on_commit(user_ids):
+    # Delete after commit, so a page rendered meanwhile cannot cache the old permissions again
+    transaction.on_commit(partial(invalidate_sidebars, list(user_ids)))
+
+
+@receiver(post_save, sender=User)
+def user_saved_sidebar(sender, instance, created, **kwargs):
+    """Forget a user's sidebar, since is_superuser or is_active may have changed their permissions."""
+    if not created and kwargs['update_fields'] != {'last_login'}:
+        _invalidate_sidebars_on_commit([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_permissions_changed_sidebar(sender, instance, action, reverse, pk_set, **kwargs):
+    """Forget the sidebars of users who joined or left a group or gained or lost a permission."""
+    if reverse and action == 'pre_clear':
+        instance._sidebar_user_ids = list(instance.user_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'post_clear':
+        user_ids = getattr(instance, '_sidebar_user_ids', [])
+    else:
+        user_ids = pk_set
+    _invalidate_sidebars_on_commit(user_ids)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed_sidebar(sender, instance, action, reverse, pk_set, **kwargs):
+    """Forget the sidebars of every member of a group whose permissions changed."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    groups = [instance.pk] if not reverse else (
+        pk_set if pk_set is not None else instance.group_set.values_list('pk', flat=True))
+    _invalidate_sidebars_on_commit(User.objects.filter(groups__in=groups).values_list('pk', flat=True).distinct())
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted_sidebar(sender, instance, **kwargs):
+    _invalidate_sidebars_on_commit(instance.user_set.values_list('pk', flat=True))
+
+
+def _touch(queryset):
+    """Move updated_at on rows whose detail page shows something that changed elsewhere."""
+    queryset.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed_touch(sender, instance, action, reverse, pk_set, **kwargs):
+    """Touch the books whose genres were added, removed or cleared."""
+    if reverse and action == 'pre_clear':
+        _touch(instance.book_set.all())
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        _touch(Book.objects.filter(pk__in=pk_set) if reverse else Book.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(pre_delete, sender=Genre)
+@receiver(post_save, sender=Language)
+def lookup_changed_touch(sender, instance, **kwargs):
+    """Touch the books that show a renamed or deleted genre, or a renamed language."""
+    if not kwargs.get('created'):
+        _touch(instance.book_set.all())
+
+
+@receiver(post_save, sender=Book)
+def book_saved_touch(sender, instance, **kwargs):
+    """Touch the author a book was moved away from, whose page no longer lists it."""
+    old = getattr(instance, '_loaded_author_id', None)
+    if old is not None and old != instance.author_id:
+        _touch(Author.objects.filter(pk=old))
+        tagcache.invalidate(f'books-by:{old}')
+    instance._loaded_author_id = instance.author_id
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_touch(sender, instance, **kwargs):
+    if instance.author_id is not None:
+        _touch(Author.objects.filter(pk=instance.author_id))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed_tags(sender, instance, **kwargs):
+    """Drop the cached pages showing the book: its own, its author's and the book lists."""
+    tagcache.invalidate('books', f'book:{instance.pk}', f'books-by:{instance.author_id}')
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def author_changed_tags(sender, instance, **kwargs):
+    tagcache.invalidate('authors', f'author:{instance.pk}')
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def lookup_changed_tags(sender, instance, **kwargs):
+    tagcache.invalidate(f'{sender._meta.model_name}:{instance.pk}')
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop the cached pages of books that gained or lost a genre."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        tagcache.invalidate(f'book:{instance.pk}')
+    elif action == 'post_clear':
+        # Every page that showed the genre is tagged with it
+        tagcache.invalidate(f'genre:{instance.pk}')
+    else:
+        tagcache.invalidate(*(f'book:{pk}' for pk in pk_set))
@@ -0,0 +1,74 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .models import Book, Author, BookInstanceCounter, Genre
+
+INDEX_COUNTS_CACHE_KEY = 'catalog:index-counts'
+
+# Cached for a day by default; model signals delete the entry on every change anyway.
+INDEX_COUNTS_TIMEOUT = getattr(settings, 'CATALOG_INDEX_COUNTS_TIMEOUT', 60 * 60 * 24)
+
+
+def _index_querysets():
+    """Return the querysets behind each counter shown on the home page."""
+    # Copies are read from the status counters instead of scanning catalog_bookinstance.
+    copies = BookInstanceCounter.objects.filter(book__isnull=True)
+    return {
+        'num_books': Book.objects.all(),
+        'num_instances': (copies, 'count'),
+        'num_genres': Genre.objects.all(),
+        'num_instances_available': (copies.filter(status__exact='a'), 'count'),
+        'num_books_available': Book.objects.filter(title__icontains='a'),
+        'num_authors': Author.objects.all(),
+    }
+
+
+def count_querysets(querysets, using='default'):
+    """Count several querysets in a single round trip.
+
+    Each queryset is compiled to its own scalar ``SELECT COUNT(*)`` subquery and
+    all of them are selected together, so the database is hit exactly once.
+    A ``(queryset, field)`` pair sums that field instead of counting rows.
+    """
+    connection = connections[using]
+    columns, params = [], []
+    for name, queryset in querysets.items():
+        if isinstance(queryset, tuple):
+            queryset, field = queryset
+            aggregate = f'COALESCE(SUM({connection.ops.quote_name(field)}), 0)'
+        else:
+            field, aggregate = 'pk', 'COUNT(*)'
+        sql, sql_params = queryset.order_by().values(field).query.get_compiler(using).as_sql()
+        columns.append(f'(SELECT {aggregate} FROM ({sql}) AS {name}_q) AS {connection.ops.quote_name(name)}')
+        params.extend(sql_params)
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + ', '.join(columns), params)
+        row = cursor.fetchone()
+    return dict(zip(querysets, row))
+
+
+def get_index_counts():
+    """Return the home page counters, computing them only on a cache miss."""
+    counts = cache.get(INDEX_COUNTS_CACHE_KEY)
+    if counts is None:
+        counts = count_querysets(_index_querysets())
+        cache.set(INDEX_COUNTS_CACHE_KEY, counts, INDEX_COUNTS_TIMEOUT)
+    return counts
+
+
+async def aget_index_counts():
+    """get_index_counts() for async views."""
+    counts = await cache.aget(INDEX_COUNTS_CACHE_KEY)
+    if counts is None:
+        # Still one query for all counters: six acount() calls would be six round trips
+        counts = await sync_to_async(count_querysets)(_index_querysets())
+        await cache.aset(INDEX_COUNTS_CACHE_KEY, counts, INDEX_COUNTS_TIMEOUT)
+    return counts
+
+
+def invalidate_index_counts():
+    """Drop the cached home page counters so the next request recomputes them."""
+    cache.delete(INDEX_COUNTS_CACHE_KEY)
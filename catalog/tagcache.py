@@ -0,0 +1,204 @@
+"""A cache for pages and querysets that is invalidated by tags rather than by time.
+
+Each cached value is stored with the tags of the rows it was built from, such as
+``book:42``, ``author:7`` or ``bookinstance-of:42``, and the version each tag had.
+A tag's version lives under its own cache key; invalidate() replaces it with the
+current time, both at once and when the transaction commits. A cached value whose tag versions no
+longer match is a miss, so nothing has to know which entries used a tag.
+
+A value is only stored if none of its tags changed while it was being built (their
+version is older than the start of the build), so a page rendered from rows that
+were being changed meanwhile is never kept. With read replicas, the build is taken
+to start the replication lag earlier, as its rows may be that old. Only get, set, add and get_many are
+used, which every backend has, the locmem and file-based ones included.
+
+Only model signals invalidate tags on their own. Code that changes catalog rows
+with a queryset ``.update()``, ``bulk_create()`` or raw SQL sends no signal and must
+call invalidate() with the tags of those rows itself: the cached pages sit in front
+of the conditional GET validators (see conditional.py), so until then a stale
+page, its ETag and its Last-Modified are all still served.
+
+Tags used by the catalog pages:
+
+``catalog``
+    Everything; bumped by bulk imports that send no signals.
+``books``, ``authors``
+    Which books or authors exist, their list order and (for books) availability.
+``book:<id>``, ``author:<id>``, ``genre:<id>``, ``language:<id>``
+    One row's own fields.
+``bookinstance-of:<book id>``
+    The copies of a book.
+``books-by:<author id>``
+    Which books an author has.
+"""
+import hashlib
+import time
+from functools import partial, wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from .routers import replication_lag
+
+CACHE_ALIAS = getattr(settings, 'CATALOG_TAG_CACHE', 'default')
+
+PAGE_TIMEOUT = getattr(settings, 'CATALOG_PAGE_CACHE_TIMEOUT', 60 * 60)
+
+KEY_PREFIX = 'catalog:tagcache'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _key(kind, name):
+    # Hashed, so any page path or tag makes a short key that every backend accepts
+    return f'{KEY_PREFIX}:{kind}:{hashlib.md5(name.encode(), usedforsecurity=False).hexdigest()}'
+
+
+def _versions(tags):
+    """Return {tag: version}, None for a tag that has no version yet."""
+    keys = {tag: _key('tag', tag) for tag in tags}
+    found = _cache().get_many(keys.values())
+    return {tag: found.get(key) for tag, key in keys.items()}
+
+
+def invalidate(*tags):
+    """Give the tags new versions now and again once the current transaction commits.
+
+    The first bump drops the entries built before the change; the second drops any
+    built from the old rows while the transaction was still open.
+    """
+    _bump(tags)
+    transaction.on_commit(partial(_bump, tags))
+
+
+def _bump(tags):
+    version = time.time_ns()
+    cache = _cache()
+    for tag in tags:
+        cache.set(_key('tag', tag), version, None)
+
+
+def lookup(key):
+    """Return the value cached under key, or None if it is missing or one of its tags changed."""
+    entry = _cache().get(_key('value', key))
+    if entry is None:
+        return None
+    versions, value = entry
+    if _versions(versions) != versions:
+        return None
+    return value
+
+
+def store(key, value, tags, started, timeout=PAGE_TIMEOUT):
+    """Cache value under key, tagged, unless a tag changed since ``started`` (a time.time_ns()).
+
+    Returns whether the value was stored.
+    """
+    cache = _cache()
+    versions = _versions(tags)
+    for tag, version in versions.items():
+        if version is None:
+            # Unknown tag: give it a version now, which also means it may have changed
+            # during the build, so this value is not stored
+            cache.add(_key('tag', tag), time.time_ns(), None)
+    # Rows read from a replica may be older than changes made up to the replication lag ago
+    settled = started - replication_lag() * 1_000_000_000
+    if any(version is None or version >= settled for version in versions.values()):
+        return False
+    cache.set(_key('value', key), (versions, value), timeout)
+    return True
+
+
+def get_or_set(key, tags, compute, timeout=PAGE_TIMEOUT):
+    """Return the cached value for key, computing and caching it on a miss."""
+    value = lookup(key)
+    if value is None:
+        started = time.time_ns()
+        value = compute()
+        store(key, value, tags, started, timeout)
+    return value
+
+
+async def aget_or_set(key, tags, compute, timeout=PAGE_TIMEOUT):
+    """get_or_set() for async code, where compute is a coroutine function."""
+    value = await sync_to_async(lookup)(key)
+    if value is None:
+        started = time.time_ns()
+        value = await compute()
+        await sync_to_async(store)(key, value, tags, started, timeout)
+    return value
+
+
+def tag(request, *tags):
+    """Add tags to the page being built for request (see cache_anonymous_page)."""
+    request.__dict__.setdefault('_catalog_cache_tags', {'catalog'}).update(tags)
+
+
+def _cached_page(request, key):
+    response = lookup(key)
+    if response is None:
+        return None
+    last_modified = parse_http_date_safe(response.get('Last-Modified', ''))
+    return get_conditional_response(request, etag=response.get('ETag'), last_modified=last_modified,
+                                    response=response)
+
+
+def _store_page(request, key, response, started):
+    if response.status_code != 200 or response.streaming:
+        return
+
+    def save(response):
+        store(key, response, request.__dict__.get('_catalog_cache_tags', {'catalog'}), started)
+
+    if hasattr(response, 'render') and callable(response.render):
+        response.add_post_render_callback(save)
+    else:
+        save(response)
+
+
+def cache_anonymous_page(view):
+    """Serve a view's GET responses to anonymous users from the tag cache.
+
+    The view declares what the page depends on with tag(request, ...) while it is
+    built. A cached page still answers If-None-Match/If-Modified-Since with a 304.
+    Async views get an async wrapper.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            if request.method not in ('GET', 'HEAD') or user.is_authenticated:
+                return await view(request, *args, **kwargs)
+
+            key = f'page:{request.get_full_path()}'
+            response = await sync_to_async(_cached_page)(request, key)
+            if response is not None:
+                return response
+
+            started = time.time_ns()
+            response = await view(request, *args, **kwargs)
+            _store_page(request, key, response, started)
+            return response
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+
+        key = f'page:{request.get_full_path()}'
+        response = _cached_page(request, key)
+        if response is not None:
+            return response
+
+        started = time.time_ns()
+        response = view(request, *args, **kwargs)
+        _store_page(request, key, response, started)
+        return response
+    return wrapper
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from catalog import routers
+
+
+class SqliteReplica:
+    """A read replica of the SQLite test database in a second file, caught up by sync().
+
+    Inside the with block the alias is a database connection and the only entry of
+    the router's replicas. Use it from a TransactionTestCase: in a TestCase every
+    read happens inside a transaction, which the router keeps on the primary.
+    """
+
+    def __init__(self, alias='replica'):
+        self.alias = alias
+
+    def __enter__(self):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise unittest.SkipTest('The replica helper copies SQLite databases')
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, f'{self.alias}.sqlite3')
+        connections.settings[self.alias] = {**primary.settings_dict, 'NAME': self.path}
+        self.patch = mock.patch.object(routers, 'REPLICAS', [self.alias])
+        self.patch.start()
+        self.sync()
+        return self
+
+    def sync(self):
+        """Copy the primary over the replica, as replication would have by now."""
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        connections[self.alias].close()
+        target = sqlite3.connect(self.path)
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+
+    def __exit__(self, *exc_info):
+        connections[self.alias].close()
+        del connections[self.alias]
+        del connections.settings[self.alias]
+        self.patch.stop()
+        self.directory.cleanup()
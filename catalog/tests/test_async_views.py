@@ -0,0 +1,104 @@
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+
+from catalog.models import Author, Book, BookInstance, Genre
+
+User = get_user_model()
+
+
+@override_settings(ROOT_URLCONF='locallibrary.asgi_urls')
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Chinua', last_name='Achebe')
+        genre = Genre.objects.create(name='Tragedy')
+        cls.books = []
+        for i in range(13):
+            book = Book.objects.create(title=f'Things Fall Apart {i:02d}', summary='Okonkwo', author=cls.author,
+                                       isbn=f'97803854745{i:02d}')
+            book.genre.set([genre])
+            cls.books.append(book)
+        BookInstance.objects.create(book=cls.books[0], imprint='Heinemann, 1958', status='a')
+        cls.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_catalog_pages_are_async_views(self):
+        for name, args in [('index', []), ('books', []), ('book-detail', [1]), ('authors', []),
+                           ('author-detail', [1])]:
+            with self.subTest(name=name):
+                self.assertTrue(iscoroutinefunction(resolve(reverse(name, args=args)).func))
+
+    async def test_index(self):
+        response = await self.async_client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['num_books'], response.context['num_instances_available']), (13, 1))
+        self.assertEqual(response.context['num_visits'], 0)
+
+    async def test_book_list_pages(self):
+        response = await self.async_client.get(reverse('books'))
+        self.assertEqual([book.title for book in response.context['book_list']],
+                         [f'Things Fall Apart {i:02d}' for i in range(10)])
+        self.assertEqual(response.context['paginator'].count, 13)
+        self.assertTrue(response.context['is_paginated'])
+
+        response = await self.async_client.get(reverse('books'), {'page': 'last'})
+        self.assertEqual(len(response.context['book_list']), 3)
+        response = await self.async_client.get(reverse('books'), {'page': 3})
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.get(reverse('books'), {'available': '1'})
+        self.assertEqual([book.title for book in response.context['book_list']], ['Things Fall Apart 00'])
+
+    async def test_keyset_pages(self):
+        first = await self.async_client.get(reverse('books'), {'cursor': ''})
+        page = first.context['page_obj']
+        self.assertTrue(page.is_keyset)
+        second = await self.async_client.get(reverse('books'), {'cursor': page.next_cursor})
+        self.assertEqual([book.title for book in second.context['book_list']],
+                         [f'Things Fall Apart {i:02d}' for i in range(10, 13)])
+
+    async def test_detail_pages(self):
+        book = self.books[0]
+        response = await self.async_client.get(reverse('book-detail', args=[book.pk]))
+        self.assertContains(response, 'Things Fall Apart 00')
+        self.assertEqual(response.context['available_copies'], 1)
+        self.assertNotIn('queue_position', response.context)
+
+        response = await self.async_client.get(reverse('author-detail', args=[self.author.pk]))
+        self.assertContains(response, 'Things Fall Apart 12')
+
+        response = await self.async_client.get(reverse('book-detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_signed_in_book_detail(self):
+        await self.async_client.aforce_login(self.reader)
+        response = await self.async_client.get(reverse('book-detail', args=[self.books[0].pk]))
+        self.assertContains(response, 'Borrow a copy')
+        self.assertIsNone(response.context['queue_position'])
+        self.assertFalse(response.context['reserved_for_user'])
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    async def test_conditional_get_and_page_cache(self):
+        url = reverse('book-detail', args=[self.books[0].pk])
+        response = await self.async_client.get(url)
+        self.assertIsNotNone(response.context)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        response = await self.async_client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # The first request gave the page's tags their versions, so it was not cached,
+        # and the 304 is not a page: the next request renders it and caches it
+        response = await self.async_client.get(url)
+        self.assertIsNotNone(response.context)
+
+        # Served from the page cache: no template is rendered
+        response = await self.async_client.get(url)
+        self.assertIsNone(response.context)
+        self.assertEqual(response['ETag'], etag)
@@ -0,0 +1,39 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase
+
+from catalog import sqlite
+
+
+class SqliteProfileTest(TestCase):
+    def pragmas(self, profile):
+        """Open a new connection to a scratch database with profile and return its PRAGMA values."""
+        with tempfile.TemporaryDirectory() as directory:
+            other = connection.copy()
+            other.settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory, 'profile.sqlite3')}
+            try:
+                with mock.patch.object(sqlite, 'PROFILE', profile), other.cursor() as cursor:
+                    values = {}
+                    for name in sqlite.PROFILES['production']:
+                        cursor.execute(f'PRAGMA {name}')
+                        values[name] = cursor.fetchone()[0]
+                    return values
+            finally:
+                other.close()
+
+    def test_production_profile_is_applied_to_new_connections(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite PRAGMAs')
+        self.assertEqual(self.pragmas('production'), {
+            'journal_mode': 'wal', 'synchronous': 1, 'mmap_size': 256 * 1024 * 1024, 'cache_size': -64 * 1024,
+            'busy_timeout': 5000, 'temp_store': 2,
+        })
+        self.assertEqual(self.pragmas('')['journal_mode'], 'delete')
+
+    def test_unknown_profile_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            sqlite.pragmas('fast')
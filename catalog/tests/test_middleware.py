@@ -0,0 +1,62 @@
+import re
+
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import Author, Book
+from locallibrary.middleware import ServerTimingMiddleware
+
+
+@override_settings(PERFORMANCE_SAMPLE_RATE=1)
+class ServerTimingMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(first_name='Chinua', last_name='Achebe')
+        Book.objects.create(title='Things Fall Apart', summary='Okonkwo', isbn='9780385474542', author=author)
+
+    def timings(self, response):
+        return {
+            name: (float(duration), description)
+            for name, duration, description in re.findall(
+                r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?', response['Server-Timing'])
+        }
+
+    def test_header_and_log_line(self):
+        with self.assertLogs('locallibrary.performance', 'INFO') as logs:
+            response = self.client.get(reverse('books'))
+
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {'db', 'tpl', 'view', 'total'})
+        self.assertEqual(timings['db'][1], '2 queries')
+        self.assertGreater(timings['tpl'][0], 0)
+        self.assertGreaterEqual(timings['total'][0], timings['view'][0])
+        record = logs.records[0]
+        self.assertEqual((record.path, record.status, record.db_queries), (reverse('books'), 200, 2))
+        self.assertIn('db_queries=2', record.getMessage())
+
+    def test_function_views_report_template_time(self):
+        with self.assertLogs('locallibrary.performance', 'INFO'):
+            response = self.client.get(reverse('index'))
+
+        self.assertGreater(self.timings(response)['tpl'][0], 0)
+
+    @override_settings(ROOT_URLCONF='locallibrary.asgi_urls')
+    async def test_async_views_stay_async(self):
+        async def get_response(request):
+            pass
+
+        self.assertTrue(iscoroutinefunction(ServerTimingMiddleware(get_response)))
+        with self.assertLogs('locallibrary.performance', 'INFO'):
+            response = await self.async_client.get(reverse('books'))
+
+        timings = self.timings(response)
+        self.assertEqual(timings['db'][1], '2 queries')
+        self.assertGreater(timings['tpl'][0], 0)
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_disabled(self):
+        response = self.client.get(reverse('books'))
+
+        self.assertNotIn('Server-Timing', response)
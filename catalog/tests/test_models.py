@@ -1,10 +1,14 @@
 import datetime
 import uuid
+from io import StringIO
 
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 from django.utils import timezone
 
-from catalog.models import Author, Language, Genre, Book, BookInstance
+from catalog import counters
+from catalog.counters import status_counts
+from catalog.models import Author, Language, Genre, Book, BookInstance, BookInstanceCounter
 
 
 # Create your tests here.
@@ -280,4 +284,110 @@ class BookInstanceModelTest(TestCase):
         bookinstance.due_back = datetime.date.today() - datetime.timedelta(days=1)
         # This will also fail if the book is overdue.
         self.assertTrue(bookinstance.is_overdue)
-        
\ No newline at end of file
+        
+
+class BookInstanceCounterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Big', last_name='Bob')
+        cls.book = Book.objects.create(title='Farm Animal', author=author, summary='Summary', isbn='2000505087778')
+        cls.other_book = Book.objects.create(title='Sunrise', author=author, summary='Summary', isbn='2000505087779')
+
+    def test_counters_follow_create_status_change_and_delete(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='printed', status='a')
+        BookInstance.objects.create(book=self.other_book, imprint='printed', status='a')
+        self.assertEqual(status_counts(self.book)['a'], 1)
+        self.assertEqual(status_counts()['a'], 2)
+
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.status = 'o'
+        copy.save()
+        self.assertEqual(status_counts(self.book)['a'], 0)
+        self.assertEqual(status_counts(self.book)['o'], 1)
+        self.assertEqual(status_counts()['a'], 1)
+
+        # Saving again without changes must not count the copy twice
+        copy.save()
+        self.assertEqual(status_counts()['o'], 1)
+
+        copy.delete()
+        self.assertEqual(status_counts(self.book)['o'], 0)
+        self.assertEqual(status_counts()['o'], 0)
+
+    def test_counters_follow_book_change(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='printed', status='m')
+        copy.book = self.other_book
+        copy.save()
+        self.assertEqual(status_counts(self.book)['m'], 0)
+        self.assertEqual(status_counts(self.other_book)['m'], 1)
+        self.assertEqual(status_counts()['m'], 1)
+
+    def test_reconcile_command_repairs_drift(self):
+        BookInstance.objects.create(book=self.book, imprint='printed', status='a')
+        BookInstance.objects.create(book=self.book, imprint='printed', status='o')
+        # Queryset updates bypass the signals, so the counters drift
+        BookInstance.objects.update(status='m')
+        self.assertEqual(BookInstanceCounter.objects.get(book=self.book, status='a').count, 1)
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('6 counter(s) had drifted', out.getvalue())
+        self.assertEqual(status_counts(self.book), {'m': 2, 'o': 0, 'a': 0, 'r': 0})
+        self.assertEqual(status_counts(), {'m': 2, 'o': 0, 'a': 0, 'r': 0})
+
+    def assertCopyCounts(self, book, available, total):
+        book = Book.objects.get(pk=book.pk)
+        self.assertEqual((book.available_copies, book.total_copies), (available, total))
+
+    def test_book_copy_counts_follow_copies(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='printed', status='a')
+        BookInstance.objects.create(book=self.book, imprint='printed', status='o')
+        self.assertCopyCounts(self.book, 1, 2)
+
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.status = 'm'
+        copy.save()
+        self.assertCopyCounts(self.book, 0, 2)
+
+        copy.status = 'a'
+        copy.book = self.other_book
+        copy.save()
+        self.assertCopyCounts(self.book, 0, 1)
+        self.assertCopyCounts(self.other_book, 1, 1)
+
+        copy.delete()
+        self.assertCopyCounts(self.other_book, 0, 0)
+
+    def test_saving_a_stale_book_keeps_its_copy_counts(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        BookInstance.objects.create(book=self.book, imprint='printed', status='a')
+        stale.title = 'Farm Animals'
+        stale.save()
+        self.assertCopyCounts(self.book, 1, 1)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).title, 'Farm Animals')
+
+    def test_record_new_books_sets_copy_counts(self):
+        copies = BookInstance.objects.bulk_create([
+            BookInstance(book=self.book, imprint='printed', status='a'),
+            BookInstance(book=self.book, imprint='printed', status='a'),
+            BookInstance(book=self.other_book, imprint='printed', status='o'),
+        ])
+        counters.record_new_books(copies)
+        self.assertCopyCounts(self.book, 2, 2)
+        self.assertCopyCounts(self.other_book, 0, 1)
+
+    def test_reconcile_command_checks_and_repairs_book_copy_counts(self):
+        BookInstance.objects.create(book=self.book, imprint='printed', status='a')
+        call_command('reconcile_counters', '--check', stdout=StringIO())
+        Book.objects.filter(pk=self.book.pk).update(available_copies=5)
+
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '0 counter(s) and 1 book(s) have drifted'):
+            call_command('reconcile_counters', '--check', stdout=out)
+        self.assertIn('5/1 copies available, expected 1/1', out.getvalue())
+        self.assertCopyCounts(self.book, 5, 1)
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('1 book(s) had wrong copy counts', out.getvalue())
+        self.assertCopyCounts(self.book, 1, 1)
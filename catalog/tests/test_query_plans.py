@@ -0,0 +1,117 @@
+import datetime
+import re
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from catalog import services, views
+from catalog.models import Author, Book, BookInstance
+from catalog.pagination import KeysetPaginationMixin
+
+User = get_user_model()
+
+
+class QueryPlanTest(TestCase):
+    """Check that the list views, admin filters and hold queue are served by an index.
+
+    A plan that scans a whole table or sorts in a temporary B-tree means an index
+    is missing (or no longer matches the query), which only shows once the tables
+    are large.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='librarian', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='Chinua', last_name='Achebe')
+        book = Book.objects.create(title='Things Fall Apart', summary='Okonkwo', isbn='9780385474542',
+                                   author=author)
+        BookInstance.objects.create(book=book, imprint='Heinemann, 1958', status='o', borrower=cls.user,
+                                    due_back=datetime.date.today())
+
+    def view_queryset(self, view_class, **params):
+        request = RequestFactory().get('/', params)
+        request.user = self.user
+        view = view_class()
+        view.setup(request)
+        return view.get_queryset()
+
+    def admin_queryset(self, model, **params):
+        request = RequestFactory().get('/', params)
+        request.user = self.user
+        return admin.site._registry[model].get_changelist_instance(request).queryset
+
+    def querysets(self):
+        """Return (name, queryset) for the first page of every checked list."""
+        book_keyset = KeysetPaginationMixin.keyset_filter(('title', 'id'), ('M', 1))
+        author_keyset = KeysetPaginationMixin.keyset_filter(('last_name', 'first_name', 'id'), ('M', 'A', 1))
+        return [
+            ('my-borrowed', self.view_queryset(views.LoanedBooksByUserListView)),
+            ('all-borrowed', self.view_queryset(views.AllBorrowedBooksListView)),
+            ('books', self.view_queryset(views.BookListView)),
+            ('books (keyset)', self.view_queryset(views.BookListView).filter(book_keyset).order_by('title', 'id')),
+            ('books (keyset, previous page)', self.view_queryset(views.BookListView).filter(
+                KeysetPaginationMixin.keyset_filter(('title', 'id'), ('M', 1), backwards=True)).order_by('-title', '-id')),
+            ('books available now', self.view_queryset(views.BookListView, available='1')),
+            ('books available now (keyset)', self.view_queryset(views.BookListView, available='1')
+             .filter(book_keyset)),
+            ('books by availability', self.view_queryset(views.BookListView, sort='available')),
+            ('books by availability (keyset)', self.view_queryset(views.BookListView, sort='available').filter(
+                KeysetPaginationMixin.keyset_filter(('-available_copies', 'title', 'id'), (2, 'M', 1)))),
+            ('authors', self.view_queryset(views.AuthorListView)),
+            ('authors (keyset)', self.view_queryset(views.AuthorListView).filter(author_keyset)
+             .order_by('last_name', 'first_name', 'id')),
+            ('admin bookinstance', self.admin_queryset(BookInstance)),
+            ('admin bookinstance by status', self.admin_queryset(BookInstance, status__exact='o')),
+        ]
+
+    def plan(self, sql, params=()):
+        """Return the query plan of sql as text."""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # The test tables are tiny, so make the planner pick an index whenever it can
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}', params)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def unindexed(self, plan):
+        """Return the plan lines that read a table without an index or sort rows themselves."""
+        if connection.vendor == 'postgresql':
+            return [line for line in plan.splitlines() if re.search(r'Seq Scan|Sort(?! Key)', line)]
+        return [
+            line for line in plan.splitlines()
+            if re.search(r'SCAN \w+$', line.strip()) or 'USE TEMP B-TREE' in line
+        ]
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest(f'No plan check for {connection.vendor}')
+
+    def test_list_queries_use_indexes(self):
+        for name, queryset in self.querysets():
+            with self.subTest(query=name):
+                plan = self.plan(*queryset[:10].query.sql_with_params())
+                self.assertEqual(self.unindexed(plan), [], f'{name}:\n{plan}')
+
+    def test_hold_queue_queries_use_indexes(self):
+        book = Book.objects.get()
+        patrons = [User.objects.create_user(username=f'patron{i}') for i in range(3)]
+        copy = BookInstance.objects.get()
+        with CaptureQueriesContext(connection) as queries:
+            for patron in patrons:
+                services.place_hold(book, patron)
+            services.queue_position(book, patrons[2])
+            services.cancel_hold(book, patrons[1])
+            services.return_copy(copy.pk)
+
+        hold_reads = [query['sql'] for query in queries
+                      if query['sql'].startswith('SELECT') and 'catalog_hold' in query['sql']]
+        self.assertTrue(hold_reads)
+        for sql in hold_reads:
+            with self.subTest(sql=sql):
+                plan = self.plan(sql)
+                self.assertEqual(self.unindexed(plan), [], f'{sql}:\n{plan}')
@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from catalog import routers
+from catalog.models import Author, Book, BookInstance
+from catalog.tests.replica import SqliteReplica
+
+User = get_user_model()
+
+
+class ReplicaRouterTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='Chinua', last_name='Achebe')
+        self.book = Book.objects.create(title='Things Fall Apart', summary='Okonkwo', isbn='9780385474542',
+                                        author=self.author)
+        BookInstance.objects.create(book=self.book, imprint='Heinemann, 1958', status='a')
+        self.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+
+    def test_catalog_pages_read_from_the_replica(self):
+        with SqliteReplica() as replica:
+            Book.objects.create(title='Arrow of God', summary='Ezeulu', isbn='9780385014809', author=self.author)
+
+            response = self.client.get(reverse('books'))
+            self.assertContains(response, 'Things Fall Apart')
+            self.assertNotContains(response, 'Arrow of God')
+            self.assertNotIn(routers.COOKIE_NAME, response.cookies)
+
+            replica.sync()
+            self.assertContains(self.client.get(reverse('books')), 'Arrow of God')
+
+    def test_a_client_reads_its_own_writes_from_the_primary(self):
+        self.client.force_login(self.reader)
+        with SqliteReplica() as replica:
+            response = self.client.post(reverse('book-borrow', args=[self.book.pk]))
+            self.assertRedirects(response, reverse('my-borrowed'), fetch_redirect_response=False)
+            self.assertIn(routers.COOKIE_NAME, response.cookies)
+            self.assertContains(self.client.get(reverse('my-borrowed')), 'Things Fall Apart')
+
+            # Once the cookie expires, reads go back to the replica, which has not caught up yet
+            del self.client.cookies[routers.COOKIE_NAME]
+            self.assertContains(self.client.get(reverse('my-borrowed')), 'There are no books borrowed.')
+
+            replica.sync()
+            self.assertContains(self.client.get(reverse('my-borrowed')), 'Things Fall Apart')
+
+    def test_sessions_and_users_are_read_from_the_primary(self):
+        self.client.force_login(self.reader)
+        with SqliteReplica():
+            router = routers.ReplicaRouter()
+            self.assertIsNone(router.db_for_read(Session))
+            self.assertIsNone(router.db_for_read(User))
+
+            # Signed in after the replica was copied: only the primary has the new session
+            reader = User.objects.create_user(username='new reader')
+            self.client.force_login(reader)
+            response = self.client.get(reverse('my-borrowed'))
+            self.assertEqual(response.context['user'], reader)
+            self.assertNotIn(routers.COOKIE_NAME, response.cookies)
+
+    def test_without_replicas_nothing_changes(self):
+        response = self.client.post(reverse('book-borrow', args=[self.book.pk]))
+        self.assertNotIn(routers.COOKIE_NAME, response.cookies)
+        self.assertIsNone(routers.ReplicaRouter().db_for_read(Book))
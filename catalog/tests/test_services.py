@@ -0,0 +1,315 @@
+import datetime
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from catalog import services
+from catalog.counters import book_drift, rebuild, status_counts
+from catalog.models import Author, Book, BookInstance, Hold
+
+User = get_user_model()
+
+
+def create_book(copies, status='a'):
+    author = Author.objects.create(first_name='Chinua', last_name='Achebe')
+    book = Book.objects.create(title='Things Fall Apart', summary='Okonkwo', isbn='9780385474542', author=author)
+    for _ in range(copies):
+        BookInstance.objects.create(book=book, imprint='Heinemann, 1958', status=status)
+    return book
+
+
+class LoanServiceTest(TestCase):
+    def setUp(self):
+        self.book = create_book(2)
+        BookInstance.objects.create(book=self.book, imprint='Heinemann, 1958', status='m')
+        self.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+
+    def test_checkout_lends_available_copies_until_none_left(self):
+        first = services.checkout(self.book, self.reader)
+        second = services.checkout(self.book, self.reader)
+
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual((first.status, first.borrower, first.due_back),
+                         ('o', self.reader, datetime.date.today() + services.LOAN_PERIOD))
+        with self.assertRaises(services.NoCopyAvailable):
+            services.checkout(self.book, self.reader)
+        self.assertEqual(status_counts(self.book), {'m': 1, 'o': 2, 'a': 0, 'r': 0})
+        self.assertEqual(rebuild(), 0)
+        self.assertFalse(book_drift().exists())
+
+    def test_return_and_renew(self):
+        copy = services.checkout(self.book, self.reader)
+        due_back = datetime.date.today() + datetime.timedelta(weeks=1)
+
+        services.renew(copy.pk, due_back)
+        copy.refresh_from_db()
+        self.assertEqual(copy.due_back, due_back)
+
+        services.return_copy(copy.pk)
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('a', None, None))
+        self.assertEqual(status_counts(self.book)['a'], 2)
+
+        with self.assertRaises(services.NotOnLoan):
+            services.return_copy(copy.pk)
+        with self.assertRaises(services.NotOnLoan):
+            services.renew(copy.pk, due_back)
+        with self.assertRaises(ValidationError):
+            services.renew(copy.pk, datetime.date.today() - datetime.timedelta(days=1))
+
+    def test_renew_does_not_overwrite_other_fields(self):
+        copy = services.checkout(self.book, self.reader)
+        # Another librarian changes the imprint after this copy was loaded
+        BookInstance.objects.filter(pk=copy.pk).update(imprint='Anchor, 1994')
+
+        services.renew(copy.pk, datetime.date.today() + datetime.timedelta(weeks=1))
+        copy.refresh_from_db()
+        self.assertEqual(copy.imprint, 'Anchor, 1994')
+
+
+class LoanViewsTest(TestCase):
+    def setUp(self):
+        self.book = create_book(1)
+        self.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        self.librarian = User.objects.create_superuser(username='librarian', password='2HJ1vRV0Z&3iD')
+
+    def test_borrow_and_return(self):
+        self.client.force_login(self.reader)
+        self.assertContains(self.client.get(self.book.get_absolute_url()), reverse('book-borrow', args=[self.book.pk]))
+        response = self.client.post(reverse('book-borrow', args=[self.book.pk]))
+        self.assertRedirects(response, reverse('my-borrowed'))
+        copy = BookInstance.objects.get(borrower=self.reader)
+
+        # The only copy is gone now
+        response = self.client.post(reverse('book-borrow', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, 'No copy of Things Fall Apart is available.', status_code=409)
+
+        self.assertEqual(self.client.post(reverse('return-book-librarian', args=[copy.pk])).status_code, 403)
+        self.client.force_login(self.librarian)
+        response = self.client.post(reverse('return-book-librarian', args=[copy.pk]))
+        self.assertRedirects(response, reverse('all-borrowed'))
+        self.assertEqual(BookInstance.objects.get(pk=copy.pk).status, 'a')
+
+    def test_borrow_requires_post(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(reverse('book-borrow', args=[self.book.pk])).status_code, 405)
+
+    def test_renewing_a_returned_copy_fails(self):
+        copy = services.checkout(self.book, self.reader)
+        self.client.force_login(self.librarian)
+        # The renewal form was opened, then the copy came back before it was submitted
+        services.return_copy(copy.pk)
+        response = self.client.post(reverse('renew-book-librarian', args=[copy.pk]),
+                                    {'due_back': datetime.date.today() + datetime.timedelta(weeks=1)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response.context['form'], None, 'This copy is not on loan.')
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    THREADS = 16
+    COPIES = 5
+
+    def test_no_copy_is_lent_twice(self):
+        book = create_book(self.COPIES)
+        readers = [User.objects.create_user(username=f'reader{i}') for i in range(self.THREADS)]
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def borrow(reader):
+            try:
+                # Connect first so that every thread reaches the checkout at the same time
+                connection.ensure_connection()
+                barrier.wait()
+                while True:
+                    try:
+                        results.append(services.checkout(book, reader).pk)
+                        return
+                    except OperationalError:
+                        # SQLite reports a concurrent writer instead of waiting for it; try again
+                        continue
+            except services.NoCopyAvailable:
+                results.append(None)
+            finally:
+                connection.close()
+
+        def shuffle_slowly(candidates):
+            # Widen the gap between finding available copies and lending one, so the
+            # threads really do race for the same copies
+            time.sleep(0.05)
+
+        threads = [threading.Thread(target=borrow, args=[reader]) for reader in readers]
+        with mock.patch.object(services.random, 'shuffle', shuffle_slowly):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        lent = [pk for pk in results if pk is not None]
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(len(lent), self.COPIES)
+        self.assertEqual(len(set(lent)), self.COPIES)
+        self.assertEqual(BookInstance.objects.filter(status='o').values('borrower').distinct().count(), self.COPIES)
+        self.assertEqual(status_counts(book), {'m': 0, 'o': self.COPIES, 'a': 0, 'r': 0})
+        self.assertEqual(rebuild(), 0)
+        self.assertFalse(book_drift().exists())
+
+
+class HoldQueueTest(TestCase):
+    def setUp(self):
+        self.book = create_book(1, status='o')
+        self.copy = BookInstance.objects.get()
+        self.patrons = [User.objects.create_user(username=f'patron{i}') for i in range(5)]
+
+    def positions(self):
+        return [services.queue_position(self.book, patron) for patron in self.patrons]
+
+    def test_holds_queue_in_order(self):
+        for patron in self.patrons:
+            services.place_hold(self.book, patron)
+
+        self.assertEqual(self.positions(), [1, 2, 3, 4, 5])
+        with self.assertRaises(services.LoanError):
+            services.place_hold(self.book, self.patrons[0])
+
+    def test_queue_position_is_one_query(self):
+        for patron in self.patrons:
+            services.place_hold(self.book, patron)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(services.queue_position(self.book, self.patrons[3]), 4)
+        self.assertIsNone(services.queue_position(self.book, User.objects.create_user(username='other')))
+
+    def test_cannot_hold_an_available_book(self):
+        BookInstance.objects.create(book=self.book, imprint='Anchor, 1994', status='a')
+        with self.assertRaises(services.LoanError):
+            services.place_hold(self.book, self.patrons[0])
+
+    def test_return_reserves_copy_for_head_of_queue(self):
+        self.patrons[0].is_active = False
+        self.patrons[0].save()
+        for patron in self.patrons:
+            services.place_hold(self.book, patron)
+
+        # The inactive patron at the head is skipped
+        self.assertEqual(services.return_copy(self.copy.pk), self.patrons[1])
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('r', self.patrons[1]))
+        self.assertEqual(self.positions(), [None, None, 1, 2, 3])
+        self.assertEqual(status_counts(self.book)['r'], 1)
+
+        # Only that patron can check it out
+        with self.assertRaises(services.NoCopyAvailable):
+            services.checkout(self.book, self.patrons[2])
+        self.assertEqual(services.checkout(self.book, self.patrons[1]).pk, self.copy.pk)
+        self.assertEqual(status_counts(self.book), {'m': 0, 'o': 1, 'a': 0, 'r': 0})
+        self.assertEqual(rebuild(), 0)
+
+    def test_return_with_empty_queue_makes_copy_available(self):
+        self.assertIsNone(services.return_copy(self.copy.pk))
+        self.assertEqual(BookInstance.objects.get().status, 'a')
+
+    def test_cancelling_keeps_positions_contiguous(self):
+        for patron in self.patrons:
+            services.place_hold(self.book, patron)
+
+        services.cancel_hold(self.book, self.patrons[1])  # The holds ahead move back
+        self.assertEqual(self.positions(), [1, None, 2, 3, 4])
+        services.cancel_hold(self.book, self.patrons[3])  # The holds behind move up
+        self.assertEqual(self.positions(), [1, None, 2, None, 3])
+        services.cancel_hold(self.book, self.patrons[4])
+        services.cancel_hold(self.book, self.patrons[0])
+        self.assertEqual(self.positions(), [None, None, 1, None, None])
+        with self.assertRaises(services.NotQueued):
+            services.cancel_hold(self.book, self.patrons[0])
+
+        services.place_hold(self.book, self.patrons[0])
+        self.assertEqual(self.positions(), [2, None, 1, None, None])
+
+    def test_book_detail_shows_queue_position(self):
+        self.client.force_login(self.patrons[0])
+        response = self.client.post(reverse('book-hold', args=[self.book.pk]))
+        self.assertRedirects(response, self.book.get_absolute_url())
+        self.client.force_login(self.patrons[1])
+        self.client.post(reverse('book-hold', args=[self.book.pk]))
+
+        response = self.client.get(self.book.get_absolute_url())
+        self.assertEqual(response.context['queue_position'], 2)
+        self.assertContains(response, 'You are number 2 in the queue')
+
+        self.client.post(reverse('book-hold-cancel', args=[self.book.pk]))
+        response = self.client.get(self.book.get_absolute_url())
+        self.assertIsNone(response.context['queue_position'])
+        self.assertContains(response, 'Place a hold')
+
+
+class ConcurrentHoldQueueTest(TransactionTestCase):
+    COPIES = 4
+    PATRONS = 12
+
+    def test_returns_and_cancellations_keep_the_queue_consistent(self):
+        book = create_book(self.COPIES, status='o')
+        patrons = [User.objects.create_user(username=f'patron{i}') for i in range(self.PATRONS)]
+        for patron in patrons:
+            services.place_hold(book, patron)
+        copies = list(BookInstance.objects.values_list('pk', flat=True))
+        cancelling = patrons[::3]
+        barrier = threading.Barrier(len(copies) + len(cancelling))
+        cancelled = []
+
+        def run(operation, *args):
+            try:
+                connection.ensure_connection()
+                barrier.wait()
+                while True:
+                    try:
+                        return operation(*args)
+                    except OperationalError:
+                        continue
+            finally:
+                connection.close()
+
+        def cancel(patron):
+            try:
+                services.cancel_hold(book, patron)
+                cancelled.append(patron.pk)
+            except services.NotQueued:
+                pass  # A returned copy was reserved for them first
+
+        original_delete = Hold.delete
+        first_attempt = threading.local()
+
+        def delete_slowly(hold, *args, **kwargs):
+            # Widen the gap between reading the queue and changing it, once per thread:
+            # SQLite's table locks make every thread waiting at once retry forever
+            if not getattr(first_attempt, 'done', False):
+                first_attempt.done = True
+                time.sleep(0.05)
+            return original_delete(hold, *args, **kwargs)
+
+        threads = [threading.Thread(target=run, args=[services.return_copy, pk]) for pk in copies]
+        threads += [threading.Thread(target=run, args=[cancel, patron]) for patron in cancelling]
+        with mock.patch.object(Hold, 'delete', delete_slowly):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        reserved_for = list(BookInstance.objects.filter(status='r').values_list('borrower', flat=True))
+        waiting = list(Hold.objects.filter(book=book).order_by('position').values_list('patron', 'position'))
+        self.assertEqual(len(reserved_for), self.COPIES)
+        self.assertEqual(len(set(reserved_for)), self.COPIES)
+        self.assertFalse(set(reserved_for) & set(cancelled))
+        self.assertFalse(set(reserved_for) & {patron for patron, _ in waiting})
+        self.assertEqual(len(waiting) + len(reserved_for) + len(cancelled), self.PATRONS)
+        positions = [position for _, position in waiting]
+        self.assertEqual(positions, list(range(positions[0], positions[0] + len(positions))))
+        self.assertEqual(status_counts(book), {'m': 0, 'o': 0, 'a': 0, 'r': self.COPIES})
+        self.assertEqual(rebuild(), 0)
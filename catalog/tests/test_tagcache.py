@@ -0,0 +1,132 @@
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog import services, tagcache
+from catalog.models import Author, Book, BookInstance, Genre
+
+User = get_user_model()
+
+
+class TagCacheTest(TestCase):
+    """The tag cache on its own, against the locmem and the file-based backends."""
+
+    def backends(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tagcache-test'},
+                'file': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+            }
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                                           **backends}):
+                for alias in backends:
+                    with self.subTest(backend=alias), mock.patch.object(tagcache, 'CACHE_ALIAS', alias):
+                        caches[alias].clear()
+                        yield
+
+    def test_invalidating_a_tag_drops_its_values(self):
+        for _ in self.backends():
+            tagcache.invalidate('book:1', 'book:2')
+            started = time.time_ns()
+            self.assertTrue(tagcache.store('one', 1, {'book:1'}, started))
+            self.assertTrue(tagcache.store('both', 2, {'book:1', 'book:2'}, started))
+            self.assertEqual((tagcache.lookup('one'), tagcache.lookup('both')), (1, 2))
+
+            tagcache.invalidate('book:2')
+            self.assertEqual((tagcache.lookup('one'), tagcache.lookup('both')), (1, None))
+
+    def test_values_built_while_a_tag_changed_are_not_stored(self):
+        for _ in self.backends():
+            tagcache.invalidate('book:1')
+            started = time.time_ns()
+            tagcache.invalidate('book:1')
+            self.assertFalse(tagcache.store('one', 1, {'book:1'}, started))
+            # A tag seen for the first time may have changed too; it has a version from now on
+            self.assertFalse(tagcache.store('new', 1, {'book:3'}, time.time_ns()))
+            self.assertEqual(tagcache.get_or_set('new', {'book:3'}, lambda: 2), 2)
+            self.assertEqual(tagcache.get_or_set('new', {'book:3'}, lambda: 3), 2)
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Chinua', last_name='Achebe')
+        cls.other_author = Author.objects.create(first_name='Ngugi', last_name='wa Thiong\'o')
+        cls.genre = Genre.objects.create(name='Tragedy')
+        cls.book = Book.objects.create(title='Things Fall Apart', summary='Okonkwo', author=cls.author,
+                                       isbn='9780385474542')
+        cls.book.genre.set([cls.genre])
+        BookInstance.objects.create(book=cls.book, imprint='Heinemann, 1958', status='a')
+        cls.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+
+    def setUp(self):
+        cache.clear()
+
+    def cached_get(self, url):
+        """Request url until it comes from the cache, and return that response."""
+        for _ in range(3):
+            response = self.client.get(url)
+            if response.context is None:
+                return response
+        self.fail(f'{url} was not cached')
+
+    def test_pages_are_served_from_cache_without_queries(self):
+        urls = [reverse('books'), reverse('book-detail', args=[self.book.pk]), reverse('authors'),
+                reverse('author-detail', args=[self.author.pk])]
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.cached_get(url).get('ETag')
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                if etag:
+                    with self.assertNumQueries(0):
+                        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_signed_in_users_are_not_served_from_cache(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        self.cached_get(url)
+        self.client.login(username='reader', password='1X<ISRUkw+tuK')
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, 'book_detail.html')
+        self.assertContains(response, 'Borrow a copy')
+
+    def test_changes_drop_the_pages_showing_them(self):
+        book_url = reverse('book-detail', args=[self.book.pk])
+        books_url = reverse('books')
+        author_url = reverse('author-detail', args=[self.author.pk])
+
+        self.cached_get(book_url)
+        services.checkout(self.book, self.reader)
+        self.assertContains(self.client.get(book_url), 'On loan')
+
+        self.cached_get(books_url)
+        self.author.last_name = 'Achebe Jr.'
+        self.author.save()
+        self.assertContains(self.client.get(books_url), 'Achebe Jr.')
+
+        self.cached_get(book_url)
+        self.genre.name = 'Tragedies'
+        self.genre.save()
+        self.assertContains(self.client.get(book_url), 'Tragedies')
+
+        self.cached_get(author_url)
+        book = Book.objects.get(pk=self.book.pk)
+        book.author = self.other_author
+        book.save()
+        self.assertContains(self.client.get(author_url), 'This author has no books.')
+
+    def test_bulk_import_drops_every_page(self):
+        self.cached_get(reverse('books'))
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as source:
+            source.write('title,isbn,author,summary\nArrow of God,9780385014809,"Achebe, Chinua",Ezeulu\n')
+            source.flush()
+            call_command('import_catalog', source.name, stdout=StringIO())
+        self.assertContains(self.client.get(reverse('books')), 'Arrow of God')
@@ -1,18 +1,33 @@
 from django.contrib.contenttypes.models import ContentType
+import csv
+import io
+import json
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 import datetime
+import threading
+import time
+from unittest import mock
 from django.utils import timezone
 # Get user model from settings
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+from catalog import autocomplete, export, search, services, tagcache, views, visits
 from catalog.models import Author, Book, Genre, Language, BookInstance
 
 import uuid
-from django.contrib.auth.models import \
+from django.contrib.auth.models import Group, \
     Permission  # Required to grant the permission needed to set a book as returned.import
 
 
@@ -30,6 +45,10 @@ class AuthorListViewTest(TestCase):
                 last_name=f'Surname {author_id}',
             )
 
+    def setUp(self):
+        # Each test renders its pages rather than reading an earlier test's from the page cache
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         response = self.client.get('/catalog/authors')
         self.assertEqual(response.status_code, 200)
@@ -58,6 +77,18 @@ class AuthorListViewTest(TestCase):
         self.assertTrue(response.context['is_paginated'] is True)
         self.assertEqual(len(response.context['author_list']), 3)
 
+    def test_keyset_pagination_walks_all_authors(self):
+        # Same surname for everyone, so the first name and id decide the order
+        Author.objects.update(last_name='Surname')
+        authors = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get(reverse('authors'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            authors += response.context['author_list']
+            cursor = response.context['page_obj'].next_cursor
+        self.assertEqual(authors, list(Author.objects.order_by('last_name', 'first_name', 'id')))
+
 
 class AuthorDetailViewTest(TestCase):
     @classmethod
@@ -71,6 +102,9 @@ class AuthorDetailViewTest(TestCase):
                 last_name=f'Surname {author_id}',
             )
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         author = Author.objects.get(pk=1)
         response = self.client.get(f'/catalog/author/{author.id}')
@@ -108,6 +142,9 @@ class BookListViewTest(TestCase):
                                        isbn=f'2000505087778{book_id}', language=language)
             book.genre.set([genre1.id, genre2.id])
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         response = self.client.get('/catalog/books/')
         self.assertEqual(response.status_code, 200)
@@ -136,6 +173,65 @@ class BookListViewTest(TestCase):
         self.assertTrue(response.context['is_paginated'] is True)
         self.assertEqual(len(response.context['book_list']), 3)
 
+    def test_authors_are_fetched_with_the_books(self):
+        # One COUNT for the paginator and one SELECT joining the authors
+        with self.assertNumQueries(2):
+            self.client.get(reverse('books'))
+
+    def test_keyset_pagination_walks_all_books_without_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('books') + '?cursor=')
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+        self.assertTrue(response.context['is_paginated'])
+        first_page = list(response.context['book_list'])
+        self.assertEqual(len(first_page), 10)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+        next_cursor = response.context['page_obj'].next_cursor
+        response = self.client.get(reverse('books'), {'cursor': next_cursor})
+        second_page = list(response.context['book_list'])
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(response.context['page_obj'].has_next())
+        self.assertEqual(first_page + second_page, list(Book.objects.order_by('title', 'id')))
+
+        previous_cursor = response.context['page_obj'].previous_cursor
+        response = self.client.get(reverse('books'), {'cursor': previous_cursor})
+        self.assertEqual(list(response.context['book_list']), first_page)
+        self.assertTrue(response.context['page_obj'].has_next())
+
+    def test_keyset_pagination_rejects_tampered_cursor(self):
+        response = self.client.get(reverse('books'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def give_copies(self):
+        """Give the first books copies: book i gets i available copies and one on loan."""
+        books = list(Book.objects.order_by('title', 'id'))
+        for i, book in enumerate(books[:4]):
+            for _ in range(i):
+                BookInstance.objects.create(book=book, imprint='printed', status='a')
+            BookInstance.objects.create(book=book, imprint='printed', status='o')
+        return books
+
+    def test_filter_available_now(self):
+        books = self.give_copies()
+        response = self.client.get(reverse('books'), {'available': '1'})
+        self.assertEqual(list(response.context['book_list']), books[1:4])
+        self.assertContains(response, '3 of 4 available')
+
+    def test_sort_by_availability(self):
+        books = self.give_copies()
+        # Most available first, ties in title order, walked page by page with cursors
+        expected = [books[3], books[2], books[1]] + [books[0]] + books[4:]
+        response = self.client.get(reverse('books'), {'sort': 'available', 'cursor': ''})
+        first_page = list(response.context['book_list'])
+        self.assertContains(response, 'sort=available&amp;cursor=')
+        response = self.client.get(reverse('books'), {'sort': 'available',
+                                                      'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(first_page + list(response.context['book_list']), expected)
+
+        response = self.client.get(reverse('books'), {'sort': 'available', 'available': '1', 'page': '1'})
+        self.assertEqual(list(response.context['book_list']), expected[:3])
+
 
 class BookDetailViewTest(TestCase):
     @classmethod
@@ -157,6 +253,9 @@ class BookDetailViewTest(TestCase):
                                        isbn=f'2000505087778{book_id}', language=language)
             book.genre.set([genre1.id, genre2.id])
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         book = Book.objects.get(pk=1)
         response = self.client.get(f'/catalog/book/{book.id}')
@@ -173,8 +272,118 @@ class BookDetailViewTest(TestCase):
         response = self.client.get(reverse("book-detail", kwargs={'pk': book.id}))
         self.assertEqual(response.status_code, 200)
 
+    def test_query_count_does_not_grow_with_copies(self):
+        book = Book.objects.get(pk=1)
+        for copy in range(5):
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        # The page validators, then book with author and language, genres, copies and the copy counters
+        with self.assertNumQueries(5):
+            self.client.get(reverse("book-detail", kwargs={'pk': book.id}))
+
+    def test_copy_counts_in_context(self):
+        book = Book.objects.get(pk=1)
+        BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='o')
+        response = self.client.get(reverse("book-detail", kwargs={'pk': book.id}))
+        self.assertEqual(
+            response.context['copy_counts'],
+            [('Maintenance', 0), ('On loan', 1), ('Available', 2), ('Reserved', 0)],
+        )
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Chinua', last_name='Achebe')
+        cls.other_author = Author.objects.create(first_name='Ngugi', last_name='wa Thiong\'o')
+        cls.genre = Genre.objects.create(name='Tragedy')
+        cls.book = Book.objects.create(title='Things Fall Apart', summary='Okonkwo', author=cls.author,
+                                       isbn='9780385474542')
+        cls.book.genre.set([cls.genre])
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Heinemann, 1958', status='a')
+        cls.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        cls.other_reader = User.objects.create_user(username='other', password='2HJ1vRV0Z&3iD')
+
+    def setUp(self):
+        cache.clear()
+
+    def book_url(self):
+        return reverse('book-detail', args=[self.book.pk])
+
+    def author_url(self, author=None):
+        return reverse('author-detail', args=[(author or self.author).pk])
+
+    def assertUnchanged(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def assertChanged(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_not_modified_is_answered_from_one_query(self):
+        response = self.client.get(self.book_url())
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.book_url(), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get(reverse('book-detail', args=[999])).status_code, 404)
+
+    def test_book_page_changes_with_its_copies_author_and_genres(self):
+        etag = self.client.get(self.book_url())['ETag']
+        self.assertUnchanged(self.book_url(), etag)
+
+        services.checkout(self.book, self.reader)
+        etag = self.assertChanged(self.book_url(), etag)
+        BookInstance.objects.create(book=self.book, imprint='Anchor, 1994', status='m')
+        etag = self.assertChanged(self.book_url(), etag)
+        self.author.last_name = 'Achebe Jr.'
+        self.author.save()
+        etag = self.assertChanged(self.book_url(), etag)
+        self.genre.name = 'Tragedies'
+        self.genre.save()
+        etag = self.assertChanged(self.book_url(), etag)
+        self.book.genre.clear()
+        self.assertChanged(self.book_url(), etag)
+
+    def test_author_page_changes_when_a_book_moves_away(self):
+        response = self.client.get(self.author_url())
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(self.author_url(), HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        book = Book.objects.get(pk=self.book.pk)
+        book.author = self.other_author
+        book.save()
+        self.assertChanged(self.author_url(), etag)
+        # Last-Modified has whole seconds, so check If-Modified-Since a second later
+        Author.objects.filter(pk=self.author.pk).update(updated_at=timezone.now() + datetime.timedelta(seconds=1))
+        # A queryset update sends no signal; drop the cached page as code doing one must
+        tagcache.invalidate(f'author:{self.author.pk}')
+        self.assertEqual(self.client.get(self.author_url(), HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_signed_in_pages_follow_the_hold_queue(self):
+        services.checkout(self.book, self.other_reader)
+        anonymous = self.client.get(self.book_url())['ETag']
+        self.client.login(username='reader', password='1X<ISRUkw+tuK')
+        response = self.client.get(self.book_url())
+        self.assertNotEqual(response['ETag'], anonymous)
+        # Their place in the queue has no timestamp, so there is no Last-Modified to go by
+        self.assertNotIn('Last-Modified', response)
+        self.assertUnchanged(self.book_url(), response['ETag'])
+
+        services.place_hold(self.book, self.reader)
+        self.assertChanged(self.book_url(), response['ETag'])
+
 
 class IndexTest(TestCase):
+    def setUp(self):
+        # The counters live in the cache, which is not rolled back between tests
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         response = self.client.get('/catalog/')
         self.assertEqual(response.status_code, 200)
@@ -230,9 +439,319 @@ class IndexTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue('num_visits' in response.context)
 
+    def test_counts_match_database(self):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        book = Book.objects.create(title='Farm Animal', summary='Summary', isbn='ABCDEFG', author=author)
+        Book.objects.create(title='Sunrise', summary='Summary', isbn='HIJKLMN', author=author)
+        Genre.objects.create(name='Fantasy')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='o')
+
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_books'], 2)
+        self.assertEqual(response.context['num_instances'], 2)
+        self.assertEqual(response.context['num_instances_available'], 1)
+        self.assertEqual(response.context['num_authors'], 1)
+        self.assertEqual(response.context['num_genres'], 1)
+        self.assertEqual(response.context['num_books_available'], 1)
+
+    def test_counts_are_cached_and_invalidated_by_signals(self):
+        self.client.get(reverse('index'))
+
+        # A warm cache means the counters are not queried again
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+        Genre.objects.create(name='Fantasy')
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_genres'], 1)
+
+    def test_anonymous_visits_are_counted_without_a_session(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 0)
+        # The first visit is stored, in a signed cookie rather than a session row
+        self.assertIn(visits.COOKIE_PREFIX + 'num_visits', response.cookies)
+        self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 1)
+        self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 2)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_visit_cookie_is_carried_into_a_new_session(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        self.client.force_login(User.objects.create_user(username='visitor'))
+        self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 2)
+
+    def test_visits_are_counted_without_a_session_write_per_request(self):
+        visits.reset()
+        self.client.force_login(User.objects.create_user(username='visitor'))
+        self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 1)
+        self.assertFalse([q for q in queries if 'UPDATE "django_session"' in q['sql']])
+        self.assertEqual(self.client.session['num_visits'], 1)
+
+        # Once the interval has passed the buffered visits reach the session
+        with mock.patch.object(visits, 'FLUSH_INTERVAL', 0):
+            self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 2)
+        self.assertEqual(self.client.session['num_visits'], 3)
+        self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 3)
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        cls.other_author = Author.objects.create(first_name='Frank', last_name='Herbert')
+        cls.genre = Genre.objects.create(name='Science Fiction')
+        cls.book = Book.objects.create(title='The Dispossessed', summary='An ambiguous utopia.',
+                                       isbn='9780061054884', author=cls.author)
+        cls.book.genre.set([cls.genre])
+        cls.other_book = Book.objects.create(title='Dune', summary='The dispossessed Fremen of Arrakis.',
+                                             isbn='9780441013593', author=cls.other_author)
+
+    def search(self, query):
+        response = self.client.get(reverse('search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.context['results']
+
+    def test_view_uses_correct_template(self):
+        response = self.client.get(reverse('search'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'search_results.html')
+        self.assertEqual(response.context['results'], [])
+
+    def test_title_match_ranks_above_summary_match(self):
+        self.assertEqual(self.search('dispossessed'), [self.book, self.other_book])
+
+    def test_finds_authors_and_their_books_by_name(self):
+        results = self.search('guin')
+        self.assertIn(self.author, results)
+        self.assertIn(self.book, results)
+        self.assertNotIn(self.other_book, results)
+
+    def test_finds_books_by_genre_and_prefix(self):
+        self.assertEqual(self.search('scien fict'), [self.book])
+
+    def test_index_follows_renames_and_deletes(self):
+        self.genre.name = 'Utopian Fiction'
+        self.genre.save()
+        self.assertEqual(self.search('science'), [])
+        self.assertEqual(self.search('utopian'), [self.book])
+
+        self.other_author.last_name = 'Herberts'
+        self.other_author.save()
+        self.assertIn(self.other_book, self.search('herberts'))
+
+        self.book.genre.clear()
+        self.assertEqual(self.search('utopian'), [])
+
+        self.other_book.delete()
+        self.assertEqual(self.search('dune'), [])
+
+    def test_reindexing_replaces_the_row(self):
+        # Two saves indexing the same book leave one row, holding the latest title
+        Book.objects.filter(pk=self.other_book.pk).update(title='Children of Dune')
+        search.index(search.BOOK_KIND, [self.other_book.pk, self.other_book.pk])
+        search.index(search.BOOK_KIND, [self.other_book.pk])
+        self.assertEqual(self.search('children'), [self.other_book])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {search.SEARCH_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], 4)
+
+    def test_rebuild_command(self):
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 4 book(s) and author(s).', out.getvalue())
+        self.assertEqual(self.search('dune'), [self.other_book])
+
+    def test_punctuation_is_not_query_syntax(self):
+        self.assertEqual(self.search('"dune" OR *'), [])
+        self.assertEqual(self.search('dune"'), [self.other_book])
+
+
+class AutocompleteViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        cls.book = Book.objects.create(title='The Dispossessed', summary='An ambiguous utopia.',
+                                       isbn='9780061054884', author=cls.author)
+        Book.objects.create(title='Dune', summary='Arrakis.', isbn='9780441013593', author=cls.author)
+
+    def setUp(self):
+        # The index lives in the process, not in the rolled back test database
+        autocomplete.reset()
+
+    def complete(self, query):
+        response = self.client.get(reverse('autocomplete'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_index_is_built_once_and_then_served_from_memory(self):
+        with self.assertNumQueries(2):
+            self.complete('d')
+        with self.assertNumQueries(0):
+            results = self.complete('dis')
+        self.assertEqual(results, [{'kind': 'book', 'id': self.book.id, 'label': 'The Dispossessed',
+                                    'url': self.book.get_absolute_url()}])
+
+    def test_stale_index_is_rebuilt_in_the_background(self):
+        self.complete('d')
+        old_index = autocomplete.get_index()
+        building, release = threading.Event(), threading.Event()
+        new_index = autocomplete.AutocompleteIndex()
+        new_index.add(autocomplete.BOOK_KIND, 1, 'Rebuilt Title')
+
+        def build_slowly():
+            building.set()
+            release.wait(5)
+            return new_index
+
+        with mock.patch.object(autocomplete, 'MAX_AGE', -1), \
+                mock.patch.object(autocomplete, 'build_index', build_slowly):
+            # The old index answers while the new one is built
+            with self.assertNumQueries(0):
+                self.assertEqual([r['label'] for r in self.complete('dis')], ['The Dispossessed'])
+            self.assertTrue(building.wait(5))
+            rebuild = autocomplete._rebuild
+            self.assertIs(autocomplete.get_index(), old_index)
+            # Changes signalled meanwhile reach the new index too
+            autocomplete.update(autocomplete.AUTHOR_KIND, 2, 'Changed, Meanwhile')
+            release.set()
+            rebuild.join(5)
+
+        self.assertIs(autocomplete.get_index(), new_index)
+        self.assertEqual([r['label'] for r in self.complete('rebuilt')], ['Rebuilt Title'])
+        self.assertEqual([r['label'] for r in self.complete('meanwhile')], ['Changed, Meanwhile'])
+
+    def test_matches_author_names_and_typos(self):
+        self.assertEqual([r['label'] for r in self.complete('guin')], ['Le Guin, Ursula'])
+        self.assertEqual([r['label'] for r in self.complete('dispossesed')], ['The Dispossessed'])
+        self.assertEqual(self.complete(''), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.complete('d')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'The Left Hand of Darkness'
+            self.book.save()
+        self.assertEqual([r['label'] for r in self.complete('dis')], [])
+        self.assertEqual([r['label'] for r in self.complete('left')], ['The Left Hand of Darkness'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.get(title='Dune').delete()
+        self.assertEqual(self.complete('dune'), [])
+
 
 # Views that are restricted to logged-in users
 
+class ExportViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Chinua', last_name='Achebe', date_of_birth='1930-11-16')
+        genres = [Genre.objects.create(name=name) for name in ('Tragedy', 'Historical')]
+        for number in range(5):
+            book = Book.objects.create(title=f'Things Fall Apart {number}', summary='Okonkwo', author=author,
+                                       isbn=f'978038547454{number}')
+            book.genre.set(genres)
+            BookInstance.objects.create(book=book, imprint='Heinemann, 1958', status='a')
+        cls.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        cls.mirror = User.objects.create_user(username='mirror', password='2HJ1vRV0Z&3iD')
+        cls.mirror.user_permissions.add(*Permission.objects.filter(
+            codename__in=['view_book', 'view_author', 'view_bookinstance']))
+
+    def test_requires_view_permission(self):
+        url = reverse('export', args=['books', 'ndjson'])
+        self.assertRedirects(self.client.get(url), f'/accounts/login/?next={url}')
+        self.client.login(username='reader', password='1X<ISRUkw+tuK')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(reverse('export', args=['patrons', 'ndjson'])).status_code, 404)
+
+    def test_streams_books_as_ndjson(self):
+        self.client.login(username='mirror', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('export', args=['books', 'ndjson']))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['isbn'] for row in rows], [f'978038547454{number}' for number in range(5)])
+        self.assertEqual(rows[0]['genres'], ['Historical', 'Tragedy'])
+        self.assertEqual((rows[0]['author_last_name'], rows[0]['available_copies']), ('Achebe', 1))
+
+    def test_streams_authors_and_copies_as_csv(self):
+        self.client.login(username='mirror', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('export', args=['authors', 'csv']))
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([(row['last_name'], row['date_of_birth'], row['date_of_death']) for row in rows],
+                         [('Achebe', '1930-11-16', '')])
+
+        response = self.client.get(reverse('export', args=['copies', 'csv']))
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertNotIn('borrower', rows[0])
+
+    def test_reads_books_in_keyset_chunks(self):
+        # Two queries per chunk of two books (the books, then their genres), and none
+        # once a chunk comes back short
+        with self.assertNumQueries(6):
+            lines = list(export.lines('books', 'ndjson', chunk_size=2))
+        self.assertEqual(len(lines), 5)
+
+
+class SidebarCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='librarian', password='1X<ISRUkw+tuK', is_staff=True)
+        self.client.force_login(self.user)
+
+    def get_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(reverse('index'))
+
+    def test_sidebar_is_cached_per_staff_member(self):
+        self.get_index()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_index()
+
+        # The permission checks only run when the fragment is rendered
+        self.assertFalse([query for query in queries if 'auth_permission' in query['sql']])
+        self.assertContains(response, reverse('all-borrowed'))
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_permission_change_invalidates_sidebar(self):
+        self.assertNotContains(self.get_index(), reverse('author-create'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(Permission.objects.get(codename='add_author'))
+        self.assertContains(self.get_index(), reverse('author-create'))
+
+    def test_group_permission_change_invalidates_sidebar(self):
+        group = Group.objects.create(name='Librarians')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(group)
+        self.assertNotContains(self.get_index(), reverse('book-create'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.add(Permission.objects.get(codename='add_book'))
+        self.assertContains(self.get_index(), reverse('book-create'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            group.delete()
+        self.assertNotContains(self.get_index(), reverse('book-create'))
+
+    def test_anonymous_and_member_sidebars_are_shared(self):
+        self.client.logout()
+        self.assertContains(self.get_index(), reverse('login'))
+        member = User.objects.create_user(username='reader', password='2HJ1vRV0Z&3iD')
+        self.client.force_login(member)
+        response = self.get_index()
+
+        self.assertContains(response, reverse('my-borrowed'))
+        self.assertNotContains(response, reverse('all-borrowed'))
+        self.assertContains(response, 'User : Reader')
+
+
 class LoanedBooksByUserListViewTest(TestCase):
     def setUp(self) -> None:
         # Create two users
@@ -492,6 +1011,109 @@ class RenewBookInstancesViewTest(TestCase):
         self.assertFormError(response.context['form'], 'due_back', 'Invalid date - renewal more than 4 weeks ahead')
 
 
+class BulkRenewBookInstancesViewTest(TestCase):
+    def setUp(self):
+        self.librarian = User.objects.create_superuser(username='librarian', password='2HJ1vRV0Z&3iD')
+        self.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG', author=author)
+        due_back = datetime.date.today() + datetime.timedelta(days=2)
+        self.loans = [
+            BookInstance.objects.create(book=book, imprint='Imprint', due_back=due_back, borrower=self.reader,
+                                        status='o')
+            for _ in range(3)
+        ]
+        self.available = BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        self.new_date = datetime.date.today() + datetime.timedelta(weeks=2)
+
+    def test_forbidden_without_permission(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('renew-books-librarian'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_lists_only_loans(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse('renew-books-librarian'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({value for value, _ in response.context['form'].fields['copies'].widget.choices},
+                         {loan.pk for loan in self.loans})
+        self.assertFalse(response.context['is_paginated'])
+
+    def test_lists_loans_a_page_at_a_time(self):
+        self.client.force_login(self.librarian)
+        with mock.patch.object(views, 'BULK_RENEW_PAGE_SIZE', 2):
+            response = self.client.get(reverse('renew-books-librarian'), {'page': 2})
+
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['form'].fields['copies'].widget.choices), 1)
+        self.assertContains(response, 'Page 2 of 2.')
+
+    def test_copy_returned_meanwhile_is_skipped(self):
+        self.client.force_login(self.librarian)
+        services.return_copy(self.loans[0].pk)
+        response = self.client.post(reverse('renew-books-librarian'), {
+            'due_back': self.new_date,
+            'copies': [str(loan.pk) for loan in self.loans[:2]],
+        })
+
+        self.assertEqual(response.context['renewed'], 1)
+        self.assertContains(response, 'Renewed 1 loan.')
+        for loan in self.loans:
+            loan.refresh_from_db()
+        self.assertEqual([loan.due_back == self.new_date for loan in self.loans], [False, True, False])
+
+    def test_renews_selected_loans_with_one_update(self):
+        self.client.force_login(self.librarian)
+        selected = [str(loan.pk) for loan in self.loans[:2]]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('renew-books-librarian'),
+                                        {'due_back': self.new_date, 'copies': selected})
+        self.assertEqual(response.context['renewed'], 2)
+        self.assertContains(response, 'Renewed 2 loans.')
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "catalog_bookinstance"')]), 1)
+        for loan in self.loans:
+            loan.refresh_from_db()
+        self.assertEqual([loan.due_back == self.new_date for loan in self.loans], [True, True, False])
+
+    def test_invalid_date_renews_nothing(self):
+        self.client.force_login(self.librarian)
+        response = self.client.post(reverse('renew-books-librarian'), {
+            'due_back': datetime.date.today() - datetime.timedelta(days=1),
+            'copies': [str(self.loans[0].pk)],
+        })
+
+        self.assertFormError(response.context['form'], 'due_back', 'Invalid date - renewal in past')
+        self.assertIsNone(response.context['renewed'])
+
+    def test_admin_action_renews_only_loans(self):
+        self.client.force_login(self.librarian)
+        response = self.client.post(reverse('admin:catalog_bookinstance_changelist'), {
+            'action': 'renew_loans',
+            'due_back': self.new_date,
+            '_selected_action': [str(self.loans[0].pk), str(self.available.pk)],
+        }, follow=True)
+
+        self.assertContains(response, f'Renewed 1 loan to {self.new_date}.')
+        self.loans[0].refresh_from_db()
+        self.available.refresh_from_db()
+        self.assertEqual(self.loans[0].due_back, self.new_date)
+        self.assertIsNone(self.available.due_back)
+
+    def test_admin_action_validates_date(self):
+        self.client.force_login(self.librarian)
+        response = self.client.post(reverse('admin:catalog_bookinstance_changelist'), {
+            'action': 'renew_loans',
+            'due_back': datetime.date.today() + datetime.timedelta(weeks=5),
+            '_selected_action': [str(self.loans[0].pk)],
+        }, follow=True)
+
+        self.assertContains(response, 'Invalid date - renewal more than 4 weeks ahead')
+        self.loans[0].refresh_from_db()
+        self.assertNotEqual(self.loans[0].due_back, self.new_date)
+
+
 class AuthorCreateViewTest(TestCase):
     """Test case for the AuthorCreate view (Created as Challenge)."""
 
@@ -869,3 +1491,142 @@ class BookUpdateViewTest(TestCase):
 
         # self.assertRedirects(response, reverse('book-detail', args=(book.id,)))
 
+
+# Query and latency budgets of every catalog page
+
+# Every request in QueryBudgetTest must finish within this many seconds.
+LATENCY_CEILING = 1.0
+
+
+class QueryBudgetTest(TestCase):
+    """Check the query count and latency of every catalog route and admin changelist.
+
+    Each page is requested against a small and a large library; pages that list rows
+    must run the same number of queries for both, so an N+1 regression fails here.
+    The loan and hold forms are posted once per library, against a book that has a
+    copy available.
+    """
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.reset()
+        self.reader = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        self.librarian = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD', is_staff=True)
+        self.librarian.user_permissions.add(*Permission.objects.filter(content_type__app_label='catalog'))
+        self.admin = User.objects.create_superuser(username='admin', password='2HJ1vRV0Z&3iD')
+        self.language = Language.objects.create(name='English')
+        self.books = 0
+
+    def add_books(self, count):
+        """Add books, each with its own author, two genres and three copies (one on loan)."""
+        for _ in range(count):
+            number = self.books = self.books + 1
+            author = Author.objects.create(first_name=f'John {number}', last_name=f'Smith {number}',
+                                           date_of_birth='1958-06-15', date_of_death='2000-05-05')
+            genres = [Genre.objects.create(name=f'Fantasy {number}'), Genre.objects.create(name=f'Action {number}')]
+            book = Book.objects.create(title=f'Book Title {number}', author=author, summary='My book summary',
+                                       isbn=f'{number:013d}', language=self.language)
+            book.genre.set(genres)
+            BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='a')
+            BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='m')
+            BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='o',
+                                        borrower=self.librarian,
+                                        due_back=datetime.date.today() + datetime.timedelta(days=number % 5))
+
+    def pages(self):
+        """Return (name, user, url, query budget) for every page read with a GET."""
+        book = Book.objects.order_by('pk').first()
+        author = book.author
+        loan = BookInstance.objects.filter(status='o').order_by('pk').first()
+        return [
+            # The counters come from the cache and an anonymous visit has no session to read
+            ('index', None, reverse('index'), 0),
+            ('books', None, reverse('books'), 2),
+            ('books (keyset)', None, reverse('books') + '?cursor=', 1),
+            # The detail pages first read their ETag/Last-Modified validators
+            ('book-detail', None, reverse('book-detail', args=[book.pk]), 5),
+            ('authors', None, reverse('authors'), 2),
+            ('authors (keyset)', None, reverse('authors') + '?cursor=', 1),
+            ('author-detail', None, reverse('author-detail', args=[author.pk]), 3),
+            ('search', None, reverse('search') + '?q=title', 2),
+            # Served from the in-process index, built by the warm-up request
+            ('autocomplete', None, reverse('autocomplete') + '?q=bo', 0),
+            ('export', self.librarian, reverse('export', args=['books', 'csv']), 4),
+            ('my-borrowed', self.librarian, reverse('my-borrowed'), 4),
+            ('all-borrowed', self.librarian, reverse('all-borrowed'), 6),
+            ('renew-book-librarian', self.librarian, reverse('renew-book-librarian', args=[loan.pk]), 5),
+            # The loans are listed a page at a time
+            ('renew-books-librarian', self.librarian, reverse('renew-books-librarian'), 6),
+            ('author-create', self.librarian, reverse('author-create'), 4),
+            ('author-update', self.librarian, reverse('author-update', args=[author.pk]), 5),
+            ('author-delete', self.librarian, reverse('author-delete', args=[author.pk]), 7),
+            ('book-create', self.librarian, reverse('book-create'), 7),
+            ('book-update', self.librarian, reverse('book-update', args=[book.pk]), 9),
+            ('book-delete', self.librarian, reverse('book-delete', args=[book.pk]), 6),
+            ('admin author', self.admin, reverse('admin:catalog_author_changelist'), 5),
+            ('admin book', self.admin, reverse('admin:catalog_book_changelist'), 6),
+            ('admin bookinstance', self.admin, reverse('admin:catalog_bookinstance_changelist'), 5),
+            ('admin genre', self.admin, reverse('admin:catalog_genre_changelist'), 5),
+            ('admin language', self.admin, reverse('admin:catalog_language_changelist'), 5),
+            ('admin bookinstancecounter', self.admin, reverse('admin:catalog_bookinstancecounter_changelist'), 5),
+        ]
+
+    def posts(self):
+        """Return (name, user, url, data, query budget) for the forms, in the order they are posted.
+
+        The reader borrows a book's only available copy, the librarian queues for it
+        and leaves the queue, and the copy is returned and renewed in bulk.
+        """
+        copy = BookInstance.objects.filter(status='a').order_by('book', 'pk').first()
+        loan = BookInstance.objects.filter(status='o', borrower=self.librarian).order_by('pk').first()
+        book = copy.book
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        return [
+            # A status change also moves four status counters and the book's copy counts
+            ('book-borrow', self.reader, reverse('book-borrow', args=[book.pk]), {}, 14),
+            ('book-hold', self.librarian, reverse('book-hold', args=[book.pk]), {}, 10),
+            ('book-hold-cancel', self.librarian, reverse('book-hold-cancel', args=[book.pk]), {}, 10),
+            ('return-book-librarian', self.librarian, reverse('return-book-librarian', args=[copy.pk]), {}, 16),
+            ('renew-books-librarian (post)', self.librarian, reverse('renew-books-librarian'),
+             {'due_back': due_back, 'copies': [str(loan.pk)]}, 9),
+        ]
+
+    def request(self, name, user, method, url, data=None):
+        """Request a page as rendered, not as served from the tag cache; return (response, queries)."""
+        if user is None:
+            self.client.logout()
+        else:
+            self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries, mock.patch.object(tagcache, 'lookup', return_value=None):
+            start = time.perf_counter()
+            response = getattr(self.client, method)(url, data)
+            elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, LATENCY_CEILING, f'{name} took {elapsed:.3f}s')
+        return response, len(queries)
+
+    def measure(self):
+        """Request every page and post every form; return {name: (query count, budget)}."""
+        results = {}
+        for name, user, url, budget in self.pages():
+            # Warm up once so per-process caches (counters, content types) do not skew the count
+            self.request(name, user, 'get', url)
+            response, queries = self.request(name, user, 'get', url)
+            self.assertEqual(response.status_code, 200, name)
+            results[name] = (queries, budget)
+        for name, user, url, data, budget in self.posts():
+            response, queries = self.request(name, user, 'post', url, data)
+            self.assertIn(response.status_code, (200, 302), name)
+            results[name] = (queries, budget)
+        return results
+
+    def test_query_budgets_are_met_and_constant(self):
+        self.add_books(3)
+        small = self.measure()
+        # Enough rows to fill every paginated list
+        self.add_books(12)
+        large = self.measure()
+
+        for name, (queries, budget) in large.items():
+            with self.subTest(page=name):
+                self.assertLessEqual(queries, budget, f'{name} ran {queries} queries, budget is {budget}')
+                self.assertEqual(queries, small[name][0], f'{name} query count grows with the data')
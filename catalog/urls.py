@@ -7,9 +7,17 @@ urlpatterns = [
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'),
     path('authors', views.AuthorListView.as_view(), name='authors'),
     path('author/<int:pk>', views.AuthorDetailView.as_view(), name='author-detail'),
+    path('search/', views.search, name='search'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
+    path('export/<slug:kind>.<slug:file_format>', views.export, name='export'),
     path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
     path('borrowed/', views.AllBorrowedBooksListView.as_view(), name='all-borrowed'),
+    path('book/<int:pk>/borrow/', views.borrow_book, name='book-borrow'),
+    path('book/<int:pk>/hold/', views.place_hold, name='book-hold'),
+    path('book/<int:pk>/hold/cancel/', views.cancel_hold, name='book-hold-cancel'),
     path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
+    path('book/<uuid:pk>/return/', views.return_book_librarian, name='return-book-librarian'),
+    path('borrowed/renew/', views.renew_books_librarian, name='renew-books-librarian'),
     path('author/create/', views.AuthorCreate.as_view(), name='author-create'),
     path('author/<int:pk>/update/', views.AuthorUpdate.as_view(), name='author-update'),
     path('author/<int:pk>/delete/', views.AuthorDelete.as_view(), name='author-delete'),
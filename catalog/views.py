@@ -1,14 +1,29 @@
-from .models import Book, Author, BookInstance, Genre
+from .models import Book, Author, BookInstance
 from django.views import generic
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 
 import datetime
 from django.contrib.auth.decorators import login_required, permission_required
-from django.shortcuts import get_object_or_404, render
-from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse, reverse_lazy
-
-from catalog.forms import RenewBookForm, RenewBookModelForm
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_POST
+
+from catalog.forms import BulkRenewBookForm, RenewBookForm, RenewBookModelForm
+from catalog import autocomplete as autocomplete_index
+from catalog import conditional
+from catalog import export as catalog_export
+from catalog import search as catalog_search
+from catalog import services, tagcache
+from catalog.counters import status_counts
+from catalog.pagination import CachedCountMixin, KeysetPaginationMixin
+from catalog.stats import get_index_counts
+from catalog.visits import record_visit, set_visit_cookies
 
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from .models import Author, Book
@@ -18,68 +33,160 @@ from .models import Author, Book
 def index(request):
     """View function for home page of site."""
 
-    # Generate counts of some main objects
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    # Challenge
-    num_genres = Genre.objects.all().count()
-
-    # Available books (status = 'a')
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-    num_books_available = Book.objects.filter(title__icontains='a').count()
-
-    # The 'all()' is implied by default.
-    num_authors = Author.objects.count()
+    # Generate counts of some main objects (books, copies, available copies, genres,
+    # books with 'a' in the title and authors) in one query, served from the cache.
+    counts = get_index_counts()
 
-    # Number of visits to this view, as counted in the session variable.
-    num_visits = request.session.get('num_visits', 0)
-    request.session['num_visits'] = num_visits + 1
+    # Number of visits to this view, as counted in the session variable (written
+    # back at most every CATALOG_VISIT_FLUSH_INTERVAL seconds), or in a cookie for
+    # visitors without a session.
+    num_visits = record_visit(request)
 
     context = {
-        'num_books': num_books,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
-        'num_genres': num_genres,
-        'num_books_available': num_books_available,
+        **counts,
         'num_visits': num_visits,
     }
 
     # Render the HTML template index.html with the data in the context variable
-    return render(request, 'index.html', context=context)
+    return set_visit_cookies(request, TemplateResponse(request, 'index.html', context=context))
 
 
-class BookListView(generic.ListView):
+@method_decorator(tagcache.cache_anonymous_page, name='dispatch')
+class BookListView(CachedCountMixin, KeysetPaginationMixin, generic.ListView):
     model = Book
+    count_tags = ('catalog', 'books')
     context_object_name = 'book_list'  # your own name for the list as a template variable
+    keyset_ordering = ('title', 'id')  # Book.Meta.ordering plus the primary key as tie-breaker
+    # ?sort= choices; each ordering is served by an index on Book and ends in the primary key
+    sort_orderings = {
+        'title': keyset_ordering,
+        'available': ('-available_copies', 'title', 'id'),
+    }
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort')
+        return sort if sort in self.sort_orderings else 'title'
+
+    def available_only(self):
+        return self.request.GET.get('available') == '1'
+
+    def get_keyset_ordering(self):
+        return self.sort_orderings[self.get_sort()]
 
     def get_queryset(self):
-        return Book.objects.all()  # Get ALl books
+        books = Book.objects.select_related('author')  # Get ALl books, with their authors in the same query
+        if self.available_only():
+            books = books.filter(available_copies__gt=0)
+        return books.order_by(*self.get_keyset_ordering())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['sort'] = self.get_sort()
+        context['available_only'] = self.available_only()
+        tagcache.tag(self.request, 'books', *{f'author:{book.author_id}' for book in context['book_list']})
+        return context
 
     # queryset = Book.objects.filter(title__incontains='war')[:5]  # Get 5 books containing the title war
     template_name = 'book_list.html'  # Specify your own template name/location
     paginate_by = 10
 
 
+# Anonymous visitors get the page from the cache; otherwise a conditional GET is
+# answered with a 304 before the page is loaded or rendered
+@method_decorator(tagcache.cache_anonymous_page, name='dispatch')
+@method_decorator(condition(conditional.book_etag, conditional.book_last_modified), name='get')
 class BookDetailView(generic.DetailView):
     model = Book
     template_name = 'book_detail.html'
-
-
-class AuthorListView(generic.ListView):
+    queryset = Book.objects.select_related('author', 'language').prefetch_related('genre', 'bookinstance_set')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Per-status copy counts come from the counters table, not from counting copies.
+        counts = status_counts(self.object)
+        user = self.request.user
+        position = services.queue_position(self.object, user) if user.is_authenticated else None
+        return self.add_book_context(context, counts, user, position)
+
+    def add_book_context(self, context, counts, user, queue_position):
+        """Add the copy counts and the user's loans and holds, and tag the page."""
+        book = self.object
+        context['copy_counts'] = [(label, counts[status]) for status, label in BookInstance.LOAN_STATUS]
+        context['available_copies'] = counts['a']
+        tagcache.tag(self.request, f'book:{book.pk}', f'bookinstance-of:{book.pk}', f'author:{book.author_id}',
+                     f'language:{book.language_id}', *(f'genre:{genre.pk}' for genre in book.genre.all()))
+        if user.is_authenticated:
+            context['queue_position'] = queue_position
+            context['reserved_for_user'] = any(copy.status == 'r' and copy.borrower_id == user.pk
+                                               for copy in book.bookinstance_set.all())
+        return context
+
+
+@method_decorator(tagcache.cache_anonymous_page, name='dispatch')
+class AuthorListView(CachedCountMixin, KeysetPaginationMixin, generic.ListView):
     model = Author
+    count_tags = ('catalog', 'authors')
     context_object_name = 'author_list'  # your own name for the list as a template variable
+    keyset_ordering = ('last_name', 'first_name', 'id')  # Author.Meta.ordering plus the primary key
 
     def get_queryset(self):
         return Author.objects.all()  # Get all author
 
+    def get_context_data(self, **kwargs):
+        tagcache.tag(self.request, 'authors')
+        return super().get_context_data(**kwargs)
+
     template_name = 'author_list.html'  # Specify the template name
     paginate_by = 10
 
 
+@method_decorator(tagcache.cache_anonymous_page, name='dispatch')
+@method_decorator(condition(conditional.author_etag, conditional.author_last_modified), name='get')
 class AuthorDetailView(generic.DetailView):
     model = Author
     template_name = 'author_detail.html'
+    queryset = Author.objects.prefetch_related('book_set')
+
+    def get_context_data(self, **kwargs):
+        author = self.object
+        tagcache.tag(self.request, f'author:{author.pk}', f'books-by:{author.pk}',
+                     *(f'book:{book.pk}' for book in author.book_set.all()))
+        return super().get_context_data(**kwargs)
+
+
+def search(request):
+    """View function ranking books and authors that match the ?q= search terms."""
+    query = request.GET.get('q', '').strip()
+    results = catalog_search.search(query) if query else []
+
+    context = {
+        'query': query,
+        'results': results,
+    }
+
+    return TemplateResponse(request, 'search_results.html', context=context)
+
+
+@login_required
+def export(request, kind, file_format):
+    """Stream every book, author or copy as JSON Lines or CSV, for systems that mirror the catalog."""
+    if kind not in catalog_export.EXPORTS or file_format not in catalog_export.FORMATS:
+        raise Http404('No such export.')
+    if not request.user.has_perm(catalog_export.EXPORTS[kind].permission):
+        raise PermissionDenied
+    response = StreamingHttpResponse(catalog_export.lines(kind, file_format),
+                                     content_type=catalog_export.FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{file_format}"'
+    return response
+
+
+def autocomplete(request):
+    """Return up to ten book titles and author names completing ?q= as JSON."""
+    results = autocomplete_index.get_index().lookup(request.GET.get('q', ''))
+    for result in results:
+        url_name = 'book-detail' if result['kind'] == autocomplete_index.BOOK_KIND else 'author-detail'
+        result['url'] = reverse(url_name, args=[result['id']])
+    return JsonResponse({'results': results})
 
 
 class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
@@ -92,6 +199,7 @@ class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
         return (
             BookInstance.objects.filter(borrower=self.request.user)
             .filter(status__exact='o')
+            .select_related('book')
             .order_by('due_back')
         )
 
@@ -105,7 +213,7 @@ class AllBorrowedBooksListView(LoginRequiredMixin, PermissionRequiredMixin, gene
 
     def get_queryset(self):
         return (
-            BookInstance.objects.filter(status__exact='o').order_by('due_back')
+            BookInstance.objects.filter(status__exact='o').select_related('book', 'borrower').order_by('due_back')
         )
 
 
@@ -113,7 +221,7 @@ class AllBorrowedBooksListView(LoginRequiredMixin, PermissionRequiredMixin, gene
 @permission_required('catalog.can_mark_returned', raise_exception=True)
 def renew_book_librarian(request, pk):
     """View function for renewing a specific BookInstance by librarian."""
-    book_instance = get_object_or_404(BookInstance, pk=pk)
+    book_instance = get_object_or_404(BookInstance.objects.select_related('book', 'borrower'), pk=pk)
 
     # If this is a POST request then process the Form data
     if request.method == 'POST':
@@ -126,12 +234,15 @@ def renew_book_librarian(request, pk):
         if form1.is_valid():
             # process the data in form.cleaned_data as required (here we just write it to the model due_back field)
             # book_instance.due_back = form.cleaned_data['renewal_date']
-            book_instance.due_back = form1.cleaned_data['due_back']
-
-            book_instance.save()
-
-            # redirect to a new URL:
-            return HttpResponseRedirect(reverse('all-borrowed'))
+            # Only due_back is written, and only while the copy is still on loan, so a
+            # return or another change made meanwhile is not overwritten.
+            try:
+                services.renew(book_instance.pk, form1.cleaned_data['due_back'])
+            except services.LoanError as e:
+                form1.add_error(None, str(e))
+            else:
+                # redirect to a new URL:
+                return HttpResponseRedirect(reverse('all-borrowed'))
 
     # If this is a GET (or any other method) create the default form.
     else:
@@ -144,7 +255,89 @@ def renew_book_librarian(request, pk):
         'book_instance': book_instance,
     }
 
-    return render(request, 'book_renew_librarian.html', context)
+    return TemplateResponse(request, 'book_renew_librarian.html', context)
+
+
+@login_required
+@require_POST
+def borrow_book(request, pk):
+    """View function lending the current user any available copy of a book."""
+    book = get_object_or_404(Book, pk=pk)
+    try:
+        services.checkout(book, request.user)
+    except services.LoanError as e:
+        return TemplateResponse(request, 'loan_error.html', {'book': book, 'error': e}, status=409)
+    return HttpResponseRedirect(reverse('my-borrowed'))
+
+
+@login_required
+@require_POST
+def place_hold(request, pk):
+    """View function adding the current user to a book's reservation queue."""
+    book = get_object_or_404(Book, pk=pk)
+    try:
+        services.place_hold(book, request.user)
+    except services.LoanError as e:
+        return TemplateResponse(request, 'loan_error.html', {'book': book, 'error': e}, status=409)
+    return HttpResponseRedirect(book.get_absolute_url())
+
+
+@login_required
+@require_POST
+def cancel_hold(request, pk):
+    """View function taking the current user out of a book's reservation queue."""
+    book = get_object_or_404(Book, pk=pk)
+    try:
+        services.cancel_hold(book, request.user)
+    except services.LoanError as e:
+        return TemplateResponse(request, 'loan_error.html', {'book': book, 'error': e}, status=409)
+    return HttpResponseRedirect(book.get_absolute_url())
+
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+@require_POST
+def return_book_librarian(request, pk):
+    """View function marking a copy on loan as returned."""
+    book_instance = get_object_or_404(BookInstance.objects.select_related('book'), pk=pk)
+    try:
+        services.return_copy(book_instance.pk)
+    except services.LoanError as e:
+        return TemplateResponse(request, 'loan_error.html', {'book': book_instance.book, 'error': e}, status=409)
+    return HttpResponseRedirect(reverse('all-borrowed'))
+
+
+# Loans listed per page of the bulk renewal form
+BULK_RENEW_PAGE_SIZE = 50
+
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def renew_books_librarian(request):
+    """View function for renewing many loans to the same date at once."""
+    loans = BookInstance.objects.filter(status__exact='o').select_related('book', 'borrower').order_by('due_back', 'pk')
+    paginator = Paginator(loans, BULK_RENEW_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('page'))
+    renewed = None
+    if request.method == 'POST':
+        form = BulkRenewBookForm(request.POST, loans=page)
+        if form.is_valid():
+            # One UPDATE; copies returned since the form was shown are left alone
+            copies = form.cleaned_data['copies']
+            renewed = BookInstance.objects.filter(pk__in=[copy.pk for copy in copies], status__exact='o').update(
+                due_back=form.cleaned_data['due_back'], updated_at=timezone.now())
+            tagcache.invalidate(*{f'bookinstance-of:{copy.book_id}' for copy in copies})
+            # List the loans again, with their new due dates
+            page = paginator.get_page(page.number)
+            form = BulkRenewBookForm(initial={'due_back': form.cleaned_data['due_back']}, loans=page)
+    else:
+        form = BulkRenewBookForm(initial={'due_back': datetime.date.today() + datetime.timedelta(weeks=3)},
+                                 loans=page)
+
+    return TemplateResponse(request, 'book_renew_bulk_librarian.html', {
+        'form': form, 'renewed': renewed,
+        'page_obj': page, 'paginator': paginator, 'is_paginated': page.has_other_pages(),
+    })
 
 
 class AuthorCreate(PermissionRequiredMixin, CreateView):
@@ -165,6 +358,7 @@ class AuthorUpdate(PermissionRequiredMixin, UpdateView):
 
 class AuthorDelete(PermissionRequiredMixin, DeleteView):
     model = Author
+    queryset = Author.objects.prefetch_related('book_set__bookinstance_set')
     success_url = reverse_lazy('authors')
     permission_required = 'catalog.delete_author'
     template_name = 'author_confirm_delete.html'
@@ -195,6 +389,7 @@ class BookUpdate(PermissionRequiredMixin, UpdateView):
 
 class BookDelete(PermissionRequiredMixin, DeleteView):
     model = Book
+    queryset = Book.objects.prefetch_related('bookinstance_set')
     success_url = reverse_lazy('books')
     permission_required = 'catalog.delete_book'
     template_name = 'book_confirm_delete.html'
@@ -0,0 +1,84 @@
+"""Per-visitor page visit counts, written to the session at most every few seconds.
+
+Saving the session on every home page view costs a django_session UPDATE per hit.
+Instead each process buffers the visits it has seen per session and folds them into
+the session once ``CATALOG_VISIT_FLUSH_INTERVAL`` seconds have passed since the last
+write. Visits buffered by a process that stops, or that a visitor never returns to,
+are lost: the count is a courtesy, not an audit log.
+
+Visitors without a session (most anonymous visitors) are not given one just to be
+counted, which would add a django_session row per hit. Their count is kept in a
+signed cookie instead (see set_visit_cookies()), and carried into the session once
+something else, such as signing in, starts one.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+
+FLUSH_INTERVAL = getattr(settings, 'CATALOG_VISIT_FLUSH_INTERVAL', 60)
+
+# Sessions buffered per process; the least recently seen are dropped beyond this
+MAX_PENDING = 10_000
+
+# Signed cookie holding the count of visitors without a session
+COOKIE_PREFIX = 'catalog_'
+COOKIE_SALT = 'catalog.visits'
+
+_pending = OrderedDict()  # (session key, counter name) -> visits not yet in the session
+_lock = threading.Lock()
+
+
+def _cookie_count(request, name):
+    try:
+        return int(request.get_signed_cookie(COOKIE_PREFIX + name, default=0, salt=COOKIE_SALT))
+    except (signing.BadSignature, ValueError):
+        return 0
+
+
+def record_visit(request, name='num_visits'):
+    """Count a visit and return how many earlier visits the visitor has made."""
+    session = request.session
+    flushed_key = f'{name}_flushed_at'
+    stored = session.get(name)
+    if stored is None:
+        stored = _cookie_count(request, name)
+    now = time.time()
+
+    if session.session_key is not None:
+        key = (session.session_key, name)
+        with _lock:
+            pending = _pending.pop(key, 0)
+            if now - session.get(flushed_key, 0) < FLUSH_INTERVAL:
+                _pending[key] = pending + 1
+                if len(_pending) > MAX_PENDING:
+                    _pending.popitem(last=False)
+                return stored + pending
+    elif not session.modified:
+        # Creating a session only to count a visit costs a row per client;
+        # set_visit_cookies() sends the new count back in a signed cookie instead
+        request.__dict__.setdefault('_catalog_visit_cookies', {})[name] = stored + 1
+        return stored
+    else:
+        # A new session, about to be saved anyway
+        pending = 0
+
+    session[name] = stored + pending + 1
+    session[flushed_key] = now
+    return stored + pending
+
+
+def set_visit_cookies(request, response):
+    """Send the counts record_visit() kept out of the session back in signed cookies."""
+    for name, count in request.__dict__.get('_catalog_visit_cookies', {}).items():
+        response.set_signed_cookie(COOKIE_PREFIX + name, count, salt=COOKIE_SALT,
+                                   max_age=settings.SESSION_COOKIE_AGE, httponly=True, samesite='Lax')
+    return response
+
+
+def reset():
+    """Drop every buffered visit."""
+    with _lock:
+        _pending.clear()
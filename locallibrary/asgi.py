@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "locallibrary.settings")
+# Serve the catalog pages with their async views rather than a thread per request
+os.environ.setdefault("CATALOG_ASYNC_VIEWS", "True")
+# Persistent connections are not closed reliably under ASGI: close them after each request
+os.environ.setdefault("DJANGO_CONN_MAX_AGE", "0")
 
 application = get_asgi_application()
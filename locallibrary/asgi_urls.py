@@ -0,0 +1,12 @@
+"""
+URL configuration used under ASGI (see asgi.py): the same URLs as urls.py, with
+the catalog's busiest pages served by native async views.
+"""
+from django.urls import include, path
+
+from . import urls
+
+urlpatterns = [
+    path("catalog/", include("catalog.async_urls")) if str(pattern.pattern) == "catalog/" else pattern
+    for pattern in urls.urlpatterns
+]
@@ -0,0 +1,119 @@
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('locallibrary.performance')
+
+
+class RequestTiming:
+    """Query and render timings collected for one sampled request."""
+
+    __slots__ = ('queries', 'sql', 'template', 'template_start')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.template_start = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed as an execute wrapper on every database connection
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - start
+            self.queries += 1
+
+    def rendered(self, response):
+        self.template += time.perf_counter() - self.template_start
+
+
+class ServerTimingMiddleware:
+    """Report SQL, template and view time of a sample of requests.
+
+    Timings go out as a Server-Timing header and as one log line on the
+    'locallibrary.performance' logger. PERFORMANCE_SAMPLE_RATE is the share of
+    requests measured; at 0 (the default) the middleware removes itself.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PERFORMANCE_SAMPLE_RATE', 0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        timing = request._timing = RequestTiming()
+        start = time.perf_counter()
+        with self.wrap_connections(timing):
+            response = self.get_response(request)
+        return self.report(request, response, timing, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timing = request._timing = RequestTiming()
+        start = time.perf_counter()
+        # Connections belong to a thread: wrap those of the sync thread the ORM runs in
+        wrappers = await sync_to_async(self.wrap_connections)(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrappers.close)()
+        return self.report(request, response, timing, time.perf_counter() - start)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def wrap_connections(self, timing):
+        """Install timing on every database connection of this thread until the returned stack is closed."""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(timing))
+        return stack
+
+    def report(self, request, response, timing, total):
+        view = total - timing.template
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timing.sql * 1000:.1f};desc="{timing.queries} queries"',
+            f'tpl;dur={timing.template * 1000:.1f}',
+            f'view;dur={view * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+        logger.info(
+            'method=%s path=%s status=%s total_ms=%.1f view_ms=%.1f template_ms=%.1f db_ms=%.1f db_queries=%d',
+            request.method, request.path, response.status_code, total * 1000, view * 1000,
+            timing.template * 1000, timing.sql * 1000, timing.queries,
+            extra={
+                'method': request.method, 'path': request.path, 'status': response.status_code,
+                'total_ms': total * 1000, 'view_ms': view * 1000, 'template_ms': timing.template * 1000,
+                'db_ms': timing.sql * 1000, 'db_queries': timing.queries,
+            },
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        # TemplateResponses render after the view returns; time that separately
+        timing = getattr(request, '_timing', None)
+        if timing is not None:
+            timing.template_start = time.perf_counter()
+            response.add_post_render_callback(timing.rendered)
+        return response